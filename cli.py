@@ -0,0 +1,381 @@
+"""
+Bulk invoice extraction from the command line, without going through the API.
+
+Processes every document under a directory, or the files listed in a
+manifest CSV together with their expected values (a "file" column plus one
+column per field, as written by test/corpus.py), on a pool of worker
+processes: extraction, comparison and scoring as for POST /extract/invoice.
+
+Results are appended to a JSONL file (one InvoiceBatchResult-like record
+per document), or written as a directory of Parquet part files with one
+column per value (--format parquet, needs pyarrow). Finished documents are
+recorded in a checkpoint file next to the output in batches, after their
+results are on disk, so an interrupted run resumes where it stopped when
+it is started again with the same output. Throughput is reported live on
+stderr.
+
+Output is append-only: with --retry-errors, the ERROR record of a document
+that is processed again stays in the output next to its new record. Keep
+the last record per "file" (later lines in JSONL, higher part numbers in
+Parquet) when reading results.
+
+Usage:
+    python cli.py [INPUT_DIR] [--manifest manifest.csv] [--output PATH] [--format jsonl|parquet]
+                  [--workers N] [--ocr-threads N] [--commit-every 100] [--retry-errors] [--fresh]
+"""
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from core.config import settings
+from schemas.invoice import InvoiceExpectedValues
+from service.classifier import IMAGE_EXTENSIONS
+from service.scoring import HARD_STOP_FIELDS
+
+# Files picked up when walking a directory
+DOCUMENT_EXTENSIONS = {".pdf", ".docx", ".csv", ".txt", *IMAGE_EXTENSIONS}
+EXPECTED_FIELDS = [field for field in InvoiceExpectedValues.model_fields if field != "correlation_id"]
+
+PART_PATTERN = re.compile(r"part-(\d+)\.parquet")
+
+# (key in the checkpoint and results, path on disk, expected values)
+Task = Tuple[str, str, Dict[str, Optional[str]]]
+
+def find_documents(directory: str) -> Iterator[Task]:
+    """Every supported document under `directory`, in a stable order, keyed by its relative path."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in DOCUMENT_EXTENSIONS:
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, directory).replace(os.sep, "/"), path, {}
+
+def read_manifest(manifest_path: str, directory: Optional[str] = None) -> Iterator[Task]:
+    """
+    The documents listed in a manifest CSV. File paths are relative to
+    `directory` (default: the manifest's own directory); the field columns
+    and an optional correlation_id column are the expected values.
+    """
+    directory = directory or os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        if "file" not in (reader.fieldnames or ()):
+            raise ValueError(f"Manifest {manifest_path} has no 'file' column.")
+        for row in reader:
+            expected = {
+                field: (row.get(field) or "").strip() or None
+                for field in (*EXPECTED_FIELDS, "correlation_id") if field in row
+            }
+            yield row["file"], os.path.join(directory, row["file"]), expected
+
+def process_one(key: str, path: str, expected_values: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    """Extract, compare and score one document; runs in a worker process and never raises."""
+    # Imported in the worker: the parent process only schedules and writes results
+    from service.invoice_extractor import process_invoice_from_path
+    from service.invoice_service import build_response
+
+    start = time.perf_counter()
+    record: Dict[str, Any] = {"file": key, "correlation_id": expected_values.get("correlation_id")}
+    try:
+        expected = InvoiceExpectedValues(**expected_values)
+        hard_stop_expected = (
+            {field: getattr(expected, field) for field in HARD_STOP_FIELDS} if settings.FAST_REJECT_ENABLED else None
+        )
+        extracted_data = process_invoice_from_path(path, hard_stop_expected=hard_stop_expected)
+        record["status"] = "OK"
+        record["result"] = build_response(extracted_data, expected).model_dump()
+        record["cpu_seconds"] = round(extracted_data.get("cpu_seconds", 0.0), 3)
+    except Exception as e:
+        record["status"] = "ERROR"
+        record["error"] = str(e)
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+class Checkpoint:
+    """
+    Append-only JSONL log of the documents whose results are safely in the
+    output: {"file", "status", "output"}, where "output" says where the
+    batch went (the JSONL size after it, or the Parquet part file).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        # Where the most recent batch went, or None before the first one
+        self.last_output: Any = None
+        valid = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # A line cut off by a crash; everything before it is intact
+                    self.entries[entry["file"]] = entry
+                    self.last_output = entry["output"]
+                    valid += len(line)
+        self._file = open(path, "a", encoding="utf-8")
+        self._file.truncate(valid)
+
+    def record(self, records: List[Dict[str, Any]], output: Any) -> None:
+        for record in records:
+            entry = {"file": record["file"], "status": record["status"], "output": output}
+            self.entries[record["file"]] = entry
+            self._file.write(json.dumps(entry) + "\n")
+        self.last_output = output
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+class JsonlWriter:
+    """Appends one JSON record per line; a batch is durable once write() returns."""
+
+    def __init__(self, path: str, checkpoint: Checkpoint):
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < (checkpoint.last_output or 0) or (size and checkpoint.last_output is None):
+            raise SystemExit(f"{path} does not match its checkpoint {checkpoint.path}; use --fresh to start over.")
+        self.path = path
+        self._file = open(path, "ab")
+        # Drop results written after the last checkpointed batch (a crash between the two)
+        self._file.truncate(checkpoint.last_output or 0)
+
+    def write(self, records: List[Dict[str, Any]]) -> int:
+        self._file.write(b"".join(json.dumps(record).encode() + b"\n" for record in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self) -> None:
+        self._file.close()
+
+def flatten(record: Dict[str, Any]) -> Dict[str, Any]:
+    """One Parquet row: the top-level values plus expected/actual/result columns per field."""
+    result = record.get("result") or {}
+    row = {
+        "file": record["file"],
+        "correlation_id": record.get("correlation_id"),
+        "status": record["status"],
+        "error": record.get("error"),
+        "score": result.get("score"),
+        "recommended_action": result.get("recommendedAction"),
+        "remarks": result.get("remarks"),
+        "extraction_method": result.get("extractionMethod"),
+        "extraction_truncated": result.get("extractionTruncated"),
+        "page_methods": ",".join(result.get("pageMethods") or ()) or None,
+        "seconds": record.get("seconds"),
+        "cpu_seconds": record.get("cpu_seconds"),
+    }
+    comparisons = result.get("comparisons") or {}
+    for field in EXPECTED_FIELDS:
+        comparison = comparisons.get(field) or {}
+        row[f"{field}_expected"] = comparison.get("expected")
+        row[f"{field}_actual"] = comparison.get("actual")
+        row[f"{field}_result"] = comparison.get("result")
+    return row
+
+class ParquetWriter:
+    """
+    Writes each batch as a Parquet part file (part-00000.parquet, ...) in a
+    directory that reads as one dataset, e.g. pyarrow.parquet.read_table(dir).
+    """
+
+    def __init__(self, directory: str, checkpoint: Checkpoint):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("--format parquet needs pyarrow (pip install pyarrow).")
+        self._pa, self._pq = pa, pq
+        self.directory = directory
+        text, number = pa.string(), pa.float64()
+        columns = [
+            ("file", text), ("correlation_id", text), ("status", text), ("error", text), ("score", text),
+            ("recommended_action", text), ("remarks", text), ("extraction_method", text),
+            ("extraction_truncated", pa.bool_()), ("page_methods", text), ("seconds", number), ("cpu_seconds", number),
+        ]
+        for field in EXPECTED_FIELDS:
+            columns += [(f"{field}_expected", text), (f"{field}_actual", text), (f"{field}_result", text)]
+        self.schema = pa.schema(columns)
+        # Parts not in the checkpoint were written just before a crash (or hold only records
+        # superseded by --retry-errors); their documents are redone
+        kept = {entry["output"] for entry in checkpoint.entries.values()}
+        for path in glob.glob(os.path.join(directory, "part-*.parquet*")):
+            if os.path.basename(path) not in kept:
+                os.remove(path)
+        # Numbered after the highest part still referenced: kept parts need not be 0..n-1,
+        # and reusing one of their numbers would overwrite checkpointed results
+        numbers = [int(match.group(1)) for name in kept if (match := PART_PATTERN.fullmatch(name))]
+        self._next_part = max(numbers, default=-1) + 1
+
+    def write(self, records: List[Dict[str, Any]]) -> str:
+        name = f"part-{self._next_part:05d}.parquet"
+        self._next_part += 1
+        table = self._pa.Table.from_pylist([flatten(record) for record in records], schema=self.schema)
+        path = os.path.join(self.directory, name)
+        self._pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return name
+
+    def close(self) -> None:
+        pass
+
+class Progress:
+    """Live documents/second on stderr: over the last RECENT_SECONDS and since the start."""
+
+    RECENT_SECONDS = 10.0
+
+    def __init__(self, total: int, interval: float):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.errors = 0
+        self.start = time.perf_counter()
+        self._samples = deque([(self.start, 0)])
+        self._printed = self.start
+        self._tty = sys.stderr.isatty()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        self.done += 1
+        self.errors += record["status"] != "OK"
+
+    def report(self, final: bool = False) -> None:
+        now = time.perf_counter()
+        self._samples.append((now, self.done))
+        while now - self._samples[0][0] > self.RECENT_SECONDS and len(self._samples) > 2:
+            self._samples.popleft()
+        # Without a terminal (logs, CI) a line every RECENT_SECONDS is enough
+        if not final and now - self._printed < (self.interval if self._tty else self.RECENT_SECONDS):
+            return
+        self._printed = now
+        average = self.done / max(now - self.start, 1e-9)
+        since, done_then = self._samples[0]
+        recent = (self.done - done_then) / max(now - since, 1e-9)
+        eta = f"{(self.total - self.done) / recent:.0f}s" if recent > 0 else "-"
+        line = (
+            f"{self.done}/{self.total} documents, {recent:.1f} docs/s now, {average:.1f} docs/s average, "
+            f"{self.errors} errors, ETA {eta}"
+        )
+        if self._tty and not final:
+            # Rewrite the same terminal line
+            print(f"\r{line}  ", end="", file=sys.stderr, flush=True)
+        else:
+            print(f"\r{line}" if self._tty else line, file=sys.stderr, flush=True)
+
+def _new_pool(workers: int) -> ProcessPoolExecutor:
+    # Spawned like the API's extraction workers, so behaviour matches the service
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def run(args: argparse.Namespace) -> int:
+    # Read by the spawned workers' settings: documents run in parallel across processes,
+    # so each needs few OCR threads, and per-document INFO logs would drown the progress
+    os.environ["OCR_WORKERS"] = str(args.ocr_threads)
+    os.environ["LOG_LEVEL"] = args.log_level
+
+    if args.manifest:
+        tasks = list(read_manifest(args.manifest, args.input))
+    else:
+        tasks = list(find_documents(args.input or settings.INPUT_DIR))
+
+    if args.format == "parquet":
+        output = args.output or os.path.join(settings.OUTPUT_DIR, "bulk_results")
+        os.makedirs(output, exist_ok=True)
+        checkpoint_path = os.path.join(output, "_checkpoint.jsonl")
+    else:
+        output = args.output or os.path.join(settings.OUTPUT_DIR, "bulk_results.jsonl")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        checkpoint_path = f"{output}.checkpoint.jsonl"
+    if args.fresh:
+        for path in [checkpoint_path, output, *glob.glob(os.path.join(output, "part-*.parquet*"))]:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    checkpoint = Checkpoint(checkpoint_path)
+    writer = ParquetWriter(output, checkpoint) if args.format == "parquet" else JsonlWriter(output, checkpoint)
+    finished = {
+        key for key, entry in checkpoint.entries.items() if entry["status"] == "OK" or not args.retry_errors
+    }
+    todo = [task for task in tasks if task[0] not in finished]
+    print(
+        f"{len(tasks)} documents, {len(tasks) - len(todo)} already in {checkpoint_path}; "
+        f"processing {len(todo)} with {args.workers} workers -> {output}",
+        file=sys.stderr,
+    )
+
+    progress = Progress(len(todo), args.progress_interval)
+    batch: List[Dict[str, Any]] = []
+    committed_at = time.perf_counter()
+
+    def commit() -> None:
+        nonlocal committed_at
+        if batch:
+            checkpoint.record(batch, writer.write(batch))
+            batch.clear()
+        committed_at = time.perf_counter()
+
+    pool = _new_pool(args.workers)
+    pending: Dict[Any, Task] = {}
+    queue = iter(todo)
+    interrupted = False
+    try:
+        while True:
+            # Two documents per worker in flight: workers never idle, and paths are not all queued up front
+            while len(pending) < 2 * args.workers and (task := next(queue, None)) is not None:
+                pending[pool.submit(process_one, *task)] = task
+            if not pending:
+                break
+            done, _ = wait(pending, timeout=args.progress_interval, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                key = pending.pop(future)[0]
+                try:
+                    record = future.result()
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM-killed); every document in flight is lost with it
+                    record = {"file": key, "status": "ERROR", "error": "Extraction worker terminated unexpectedly."}
+                    broken = True
+                batch.append(record)
+                progress.add(record)
+            if broken:
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = _new_pool(args.workers)
+            if len(batch) >= args.commit_every or time.perf_counter() - committed_at >= args.commit_seconds:
+                commit()
+            progress.report()
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\nInterrupted; saving finished documents. Run again to resume.", file=sys.stderr)
+    finally:
+        pool.shutdown(wait=not interrupted, cancel_futures=True)
+        commit()
+        writer.close()
+        checkpoint.close()
+    progress.report(final=True)
+    return 130 if interrupted else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", nargs="?", help="Directory of documents (default INPUT_DIR); with --manifest, the directory its paths are relative to")
+    parser.add_argument("--manifest", help="CSV with a 'file' column and expected values per field")
+    parser.add_argument("--output", help="JSONL file, or directory for --format parquet (default under OUTPUT_DIR)")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--ocr-threads", type=int, default=1, help="OCR threads per worker process (OCR_WORKERS)")
+    parser.add_argument("--commit-every", type=int, default=100, help="Documents per durable batch (and Parquet part)")
+    parser.add_argument("--commit-seconds", type=float, default=30.0, help="Longest time between batches")
+    parser.add_argument("--retry-errors", action="store_true", help="Process documents that failed in earlier runs again (their old ERROR records stay; the last record per file wins)")
+    parser.add_argument("--fresh", action="store_true", help="Ignore and remove the checkpoint and earlier output")
+    parser.add_argument("--progress-interval", type=float, default=1.0, help="Seconds between progress updates")
+    parser.add_argument("--log-level", default="WARNING", help="LOG_LEVEL of the worker processes")
+    sys.exit(run(parser.parse_args()))
@@ -15,10 +15,147 @@ class Settings:
 
     # Logging
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    # "text" for human-readable lines, "json" for one JSON object per record
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    # Records are handed to a background writer thread through a queue of this size;
+    # when stdout cannot keep up, records beyond it are dropped (and counted) instead of blocking
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # Fraction of requests whose DEBUG records are kept (all or none of a request's); 1 keeps all
+    LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+    # Header carrying the request id: taken from the request when present, always set on the response
+    REQUEST_ID_HEADER = os.getenv("REQUEST_ID_HEADER", "X-Request-Id")
 
     # OCR Settings
     OCR_DPI = int(os.getenv("OCR_DPI", "300"))
     SCANNED_PDF_THRESHOLD = int(os.getenv("SCANNED_PDF_THRESHOLD", "10"))
+    # Pages whose text layer has fewer characters than this are OCR'd individually
+    PAGE_OCR_THRESHOLD = int(os.getenv("PAGE_OCR_THRESHOLD", str(SCANNED_PDF_THRESHOLD)))
+    # Number of pages OCR'd concurrently within one document (OCR threads per process);
+    # 0 sizes it from the cores, see below
+    OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0"))
+    # OCR engine: "auto" keeps a warm Tesseract C API handle (libtesseract via ctypes) per
+    # OCR thread when the library is available and uses pytesseract otherwise;
+    # "capi" / "pytesseract" force one
+    OCR_BACKEND = os.getenv("OCR_BACKEND", "auto").lower()
+    OCR_LANG = os.getenv("OCR_LANG", "eng")
+    # Path to libtesseract when it is not on the default library search path
+    TESSERACT_LIBRARY = os.getenv("TESSERACT_LIBRARY", "")
+    # Deskew and trim page images before OCR, using an adaptive binarisation of the page (needs numpy)
+    OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "true").lower() == "true"
+    # OCR the binarised page instead of the deskewed grayscale
+    OCR_BILEVEL = os.getenv("OCR_BILEVEL", "false").lower() == "true"
+    # Adaptive DPI: OCR pages at OCR_LOW_DPI first and re-render at OCR_DPI only when
+    # Tesseract's mean word confidence is below OCR_MIN_CONFIDENCE; 0 disables
+    OCR_LOW_DPI = int(os.getenv("OCR_LOW_DPI", "0"))
+    OCR_MIN_CONFIDENCE = int(os.getenv("OCR_MIN_CONFIDENCE", "80"))
+    # Early exit for PDFs: "off" processes every page; "all_found" stops rendering/OCR once
+    # every field has been found (TDS: at least one occurrence, summed over the pages read);
+    # "max_pages" stops after EARLY_EXIT_MAX_PAGES pages
+    EARLY_EXIT_MODE = os.getenv("EARLY_EXIT_MODE", "off").lower()
+    # Page cap for the incremental modes; 0 means no cap
+    EARLY_EXIT_MAX_PAGES = int(os.getenv("EARLY_EXIT_MAX_PAGES", "0"))
+    # Fast reject: stop reading pages as soon as a hard-stop field (PAN, GSTIN,
+    # Agreement_Amount) is found with a value that does not match the request
+    FAST_REJECT_ENABLED = os.getenv("FAST_REJECT_ENABLED", "false").lower() == "true"
+
+    # Memory-bounded processing
+    # Pages read per PDF (frames per image); later pages are skipped. 0 means no cap
+    MAX_PAGES = int(os.getenv("MAX_PAGES", "0"))
+    # Largest page image rendered for OCR, in bytes (one byte per pixel); bigger
+    # pages are rendered at a proportionally lower DPI
+    OCR_MAX_RENDER_BYTES = int(os.getenv("OCR_MAX_RENDER_BYTES", str(64 * 1024 * 1024)))
+    # Per-request RSS budget in MB, measured as growth of the worker's RSS since the
+    # request started (in thread mode concurrent requests share it); 0 disables.
+    # Past MEMORY_DEGRADE_RATIO of the budget pages are OCR'd one at a time at
+    # MEMORY_DEGRADED_DPI; past the budget no further pages are read
+    MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "0"))
+    MEMORY_DEGRADE_RATIO = float(os.getenv("MEMORY_DEGRADE_RATIO", "0.75"))
+    MEMORY_DEGRADED_DPI = int(os.getenv("MEMORY_DEGRADED_DPI", "150"))
+
+    # Execution Settings
+    # "inline" runs extraction on the event loop, "thread" and "process" offload it to a pool
+    EXECUTION_MODE = os.getenv("EXECUTION_MODE", "process")
+    EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+    # Maximum number of extractions running or waiting for a worker; 0 means unbounded
+    EXTRACTION_QUEUE_LIMIT = int(os.getenv("EXTRACTION_QUEUE_LIMIT", "32"))
+    EXTRACTION_RETRY_AFTER = int(os.getenv("EXTRACTION_RETRY_AFTER", "5"))
+    # Two-lane scheduling: documents with a text layer (text PDFs, DOCX, CSV/TXT) run in the
+    # fast lane, images and PDFs with pages that need OCR in the OCR lane. Each lane has its
+    # own worker pool and queue, so text documents never wait behind OCR
+    FAST_LANE_WORKERS = int(os.getenv("FAST_LANE_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+    FAST_LANE_QUEUE_LIMIT = int(os.getenv("FAST_LANE_QUEUE_LIMIT", str(EXTRACTION_QUEUE_LIMIT)))
+    OCR_LANE_WORKERS = int(os.getenv("OCR_LANE_WORKERS", str(EXTRACTION_WORKERS)))
+    # In process mode every OCR-lane worker has its own OCR threads, each with a loaded
+    # Tesseract model, so by default the cores are shared out between the workers rather
+    # than each worker starting one thread per core
+    if OCR_WORKERS <= 0:
+        OCR_WORKERS = max(1, (os.cpu_count() or 1) // max(1, OCR_LANE_WORKERS)) if EXECUTION_MODE.lower() == "process" else (os.cpu_count() or 1)
+    # OCR submissions beyond this many running or waiting are shed with a 503
+    OCR_LANE_QUEUE_LIMIT = int(os.getenv("OCR_LANE_QUEUE_LIMIT", str(EXTRACTION_QUEUE_LIMIT)))
+    # Nice value added to OCR lane workers, so the fast lane wins the CPU when both are busy
+    OCR_LANE_NICE = int(os.getenv("OCR_LANE_NICE", "10"))
+    # Adaptive concurrency: a lane runs one job fewer at a time while its latency per page is
+    # more than this many times the usual latency of the same file type (a low percentile of
+    # its recent samples), and one more once it recovers
+    LANE_LATENCY_TOLERANCE = float(os.getenv("LANE_LATENCY_TOLERANCE", "2.0"))
+    # Start every extraction worker at startup and run a small embedded invoice through it
+    # (PyMuPDF, field patterns, OCR); /ready answers 503 until this has finished
+    WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+
+    # Callers and Quotas
+    # API keys as "key=caller,key=caller"; a request's X-API-Key must be one of them when sent.
+    # Without a key, the CALLER_HEADER header names the caller (unauthenticated), else "anonymous"
+    API_KEYS = os.getenv("API_KEYS", "")
+    CALLER_HEADER = os.getenv("CALLER_HEADER", "X-Caller-Id")
+    # Shares of the extraction workers and of the CPU quota, as "caller=weight,..."; default 1
+    CALLER_WEIGHTS = os.getenv("CALLER_WEIGHTS", "")
+    # CPU-seconds of extraction per second each caller may use (times its weight), with bursts of
+    # up to CALLER_CPU_BURST CPU-seconds; requests over it get a 429. 0 disables the limit
+    CALLER_CPU_RATE = float(os.getenv("CALLER_CPU_RATE", "0"))
+    CALLER_CPU_BURST = float(os.getenv("CALLER_CPU_BURST", "60"))
+
+    # Largest accepted document, after decompression (uploads) or Base64 decoding (JSON)
+    MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(64 * 1024 * 1024)))
+
+    # Batch Endpoint
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(os.cpu_count() or 1)))
+    # Attempts per batch item while the extraction queue is full
+    BATCH_QUEUE_FULL_RETRIES = int(os.getenv("BATCH_QUEUE_FULL_RETRIES", "5"))
+
+    # Asynchronous Jobs
+    JOBS_ENABLED = os.getenv("JOBS_ENABLED", "true").lower() == "true"
+    JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(OUTPUT_DIR, "jobs.sqlite3"))
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "5"))
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+    # A running job whose process stops renewing it for this long is re-queued
+    JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+    # Extraction Cache
+    CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(OUTPUT_DIR, "extraction_cache.sqlite3"))
+    CACHE_MEMORY_MAX_ENTRIES = int(os.getenv("CACHE_MEMORY_MAX_ENTRIES", "256"))
+    CACHE_DISK_MAX_ENTRIES = int(os.getenv("CACHE_DISK_MAX_ENTRIES", "10000"))
+    CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    # Also keep the full extracted text of each document in the cache
+    CACHE_STORE_TEXT = os.getenv("CACHE_STORE_TEXT", "false").lower() == "true"
+
+    # Results Store: an append-only audit log of every extraction response, one SQLite file
+    # per UTC day under RESULTS_DIR, written by a background thread in batches
+    RESULTS_STORE_ENABLED = os.getenv("RESULTS_STORE_ENABLED", "false").lower() == "true"
+    RESULTS_DIR = os.getenv("RESULTS_DIR", os.path.join(OUTPUT_DIR, "results"))
+    # Daily segments older than this are deleted; 0 keeps them forever
+    RESULTS_RETENTION_DAYS = int(os.getenv("RESULTS_RETENTION_DAYS", "90"))
+    RESULTS_BATCH_SIZE = int(os.getenv("RESULTS_BATCH_SIZE", "256"))
+    # Longest a result waits for its batch to fill before it is committed
+    RESULTS_FLUSH_INTERVAL = float(os.getenv("RESULTS_FLUSH_INTERVAL", "1.0"))
+    # Results waiting for the writer; beyond this they are dropped (and counted) rather than block requests
+    RESULTS_QUEUE_LIMIT = int(os.getenv("RESULTS_QUEUE_LIMIT", "10000"))
+
+    # Metrics: per-stage latency histograms served from /metrics
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
 
     # Extraction Regex Patterns
     EXTRACTION_PATTERNS = {
@@ -33,6 +170,23 @@ class Settings:
         "TDS": r"TDS\s*(?:u/s\s*194H)?\s*(?:@?\s*[\d\.]+\s*%?)?\s*[:\-]?\s*[₹■]?\s*([\d,]+(?:\.\d{1,2})?)",
     }
 
+    # Label anchors located in a single pass before each value pattern is applied.
+    # Each anchor must be the literal prefix of its pattern; fields whose pattern
+    # does not start with its anchor (e.g. overridden via env) fall back to a full scan.
+    EXTRACTION_ANCHORS = {
+        "CP_Name": r"Channel Partner",
+        "PAN": r"\bPAN",
+        "GSTIN": r"\bGSTIN",
+        "Agreement_Amount": r"Agreement Value",
+        "Brokerage_Amount": r"(?:Commission|Brokerage)",
+        "CGST": r"CGST",
+        "SGST": r"SGST",
+        "Total_Invoice_Amount": r"Total Invoice Amount",
+        "TDS": r"TDS",
+    }
+    # Characters after an anchor searched for its value
+    EXTRACTION_WINDOW = int(os.getenv("EXTRACTION_WINDOW", "1024"))
+
     # Scoring Weights
     WEIGHT_CP_NAME = int(os.getenv("WEIGHT_CP_NAME", "5"))
     WEIGHT_PAN = int(os.getenv("WEIGHT_PAN", "15"))
@@ -1,27 +1,148 @@
-
+import atexit
+import json
 import logging
+import logging.handlers
+import multiprocessing.util
+import queue
+import random
 import sys
+import threading
+import zlib
+from typing import Optional
+
 from core.config import settings
+from core.request_context import request_id_var
+
+# Attributes every LogRecord has; anything else on a record came in through `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+class RequestContextFilter(logging.Filter):
+    """
+    Stamp each record with the current request id and sample DEBUG records.
+    Runs in the logging thread, where the request's context is still set.
+    Sampling is decided per request id, so a sampled request keeps all of its
+    DEBUG records and the others keep none.
+    """
+
+    def __init__(self, debug_sample_rate: float):
+        super().__init__()
+        self.threshold = int(max(0.0, min(1.0, debug_sample_rate)) * 2 ** 32)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = request_id_var.get()
+        record.request_id = request_id or "-"
+        if record.levelno > logging.DEBUG or self.threshold >= 2 ** 32:
+            return True
+        if request_id is None:
+            return random.random() * 2 ** 32 < self.threshold
+        return zlib.crc32(request_id.encode()) < self.threshold
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including fields passed with `extra=`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to the writer thread without ever waiting: when the queue is
+    full the record is dropped, and the number dropped is reported with the
+    next record that gets through.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments here, while they cannot change, but leave the
+        # rest of the formatting (time, JSON, traceback layout) to the writer
+        record = logging.makeLogRecord(vars(record))
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        if self.dropped:
+            with self._lock:
+                dropped, self.dropped = self.dropped, 0
+            notice = logging.makeLogRecord({
+                "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING", "request_id": "-",
+                "msg": f"Dropped {dropped} log records: the log queue was full.",
+            })
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                with self._lock:
+                    self.dropped += dropped
+
+_handler: Optional[NonBlockingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def _build_formatter() -> logging.Formatter:
+    if settings.LOG_FORMAT.lower() == "json":
+        return JsonFormatter()
+    return logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] - %(message)s')
+
+def _stop_listener() -> None:
+    """Write out whatever is still queued; safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def _get_handler() -> NonBlockingQueueHandler:
+    """The process-wide queue handler, starting the stdout writer thread on first use."""
+    global _handler, _listener
+    if _handler is None:
+        log_queue: queue.Queue = queue.Queue(maxsize=max(0, settings.LOG_QUEUE_SIZE))
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setLevel(settings.LOG_LEVEL)
+        stream.setFormatter(_build_formatter())
+        _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+        _listener.start()
+        # atexit for the server; multiprocessing workers exit without running atexit hooks
+        atexit.register(_stop_listener)
+        multiprocessing.util.Finalize(None, _stop_listener, exitpriority=0)
+        _handler = NonBlockingQueueHandler(log_queue)
+        _handler.setLevel(settings.LOG_LEVEL)
+        _handler.addFilter(RequestContextFilter(settings.LOG_DEBUG_SAMPLE_RATE))
+    return _handler
 
 def setup_logger(name: str) -> logging.Logger:
     """
     Configure and return a logger instance.
-    Logs are directed to stdout to be captured by Docker.
+    Logs are directed to stdout to be captured by Docker, by a background
+    thread: logging calls only queue the record. Pass arguments lazily
+    (logger.debug("x %s", y)) so disabled levels cost no formatting.
     """
     logger = logging.getLogger(name)
-    
     # Prevent duplicate handlers if logger is already configured
     if not logger.handlers:
         logger.setLevel(settings.LOG_LEVEL)
-        
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(settings.LOG_LEVEL)
-        
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        handler.setFormatter(formatter)
-        
-        logger.addHandler(handler)
-        
+        logger.addHandler(_get_handler())
     return logger
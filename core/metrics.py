@@ -0,0 +1,138 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from core.config import settings
+
+# Upper bounds (seconds) of the stage latency buckets
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Histogram:
+    """A labelled histogram rendered in the Prometheus text exposition format."""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str], buckets: Sequence[float] = STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, labels: Tuple[str, ...]) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (counts, total, count) in series:
+            label_text = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+class StageTimer:
+    """Collects (stage, seconds) spans for one document."""
+
+    def __init__(self):
+        self.spans: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # list.append is atomic, so OCR pool threads can share a timer
+            self.spans.append((stage, time.perf_counter() - start))
+
+    def add(self, stage: str, seconds: float) -> None:
+        """Record a span timed by the caller, e.g. the sum of many short steps."""
+        self.spans.append((stage, seconds))
+
+class _NullTimer:
+    """Stand-in used when metrics are disabled: spans cost one attribute lookup."""
+
+    spans: Tuple[Tuple[str, float], ...] = ()
+    _span = nullcontext()
+
+    def span(self, stage: str):
+        return self._span
+
+    def add(self, stage: str, seconds: float) -> None:
+        pass
+
+NULL_TIMER = _NullTimer()
+
+def stage_timer():
+    """Return a fresh StageTimer, or the shared no-op timer when METRICS_ENABLED is off."""
+    return StageTimer() if settings.METRICS_ENABLED else NULL_TIMER
+
+_cpu_meters = threading.local()
+
+class CpuMeter:
+    """
+    CPU time spent on one document: the CPU time of the thread that started
+    the meter, plus whatever work handed to helper threads (the OCR pool)
+    reports with add(). Only the starting thread may add to or read it.
+    """
+
+    def __init__(self):
+        self._start = time.thread_time()
+        self._helpers = 0.0
+        self._previous: Optional["CpuMeter"] = None
+
+    def start(self) -> "CpuMeter":
+        """Make this the calling thread's current meter (see current_cpu_meter)."""
+        self._previous = getattr(_cpu_meters, "current", None)
+        _cpu_meters.current = self
+        return self
+
+    def stop(self) -> None:
+        _cpu_meters.current = self._previous
+
+    def add(self, seconds: float) -> None:
+        self._helpers += seconds
+
+    def seconds(self) -> float:
+        return time.thread_time() - self._start + self._helpers
+
+def current_cpu_meter() -> Optional[CpuMeter]:
+    """The meter started on the calling thread, if any."""
+    return getattr(_cpu_meters, "current", None)
+
+stage_duration = Histogram(
+    "invoice_stage_duration_seconds",
+    "Time spent in each invoice processing stage.",
+    ("stage", "extraction_method", "file_type"),
+)
+
+def record_stages(spans: Iterable[Tuple[str, float]], extraction_method: str, file_type: str) -> None:
+    """Feed a document's spans into the stage histogram."""
+    if not settings.METRICS_ENABLED:
+        return
+    method = extraction_method or "unknown"
+    for stage, seconds in spans:
+        stage_duration.observe(seconds, (stage, method, file_type))
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(stage_duration.render()) + "\n"
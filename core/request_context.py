@@ -0,0 +1,63 @@
+import contextvars
+import re
+import uuid
+from typing import Any, Callable, Optional
+
+from core.config import settings
+
+# Id of the request (or job) the current code runs for; stamped on every log record
+request_id_var: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar("request_id", default=None)
+
+# Client-supplied ids are echoed into logs and headers, so only short, plain ones are kept
+_VALID_ID = re.compile(r"[\w.:-]{1,64}")
+
+def new_request_id(supplied: Optional[str] = None) -> str:
+    """`supplied` when it is a usable id, else a fresh random one."""
+    if supplied and _VALID_ID.fullmatch(supplied):
+        return supplied
+    return uuid.uuid4().hex
+
+def run_with_request_id(request_id: Optional[str], func: Callable[..., Any], *args: Any) -> Any:
+    """
+    Call `func(*args)` with `request_id` as the current request id. Pool
+    threads and worker processes do not inherit the submitter's context, so
+    work handed to them is wrapped in this (it is picklable).
+    """
+    token = request_id_var.set(request_id)
+    try:
+        return func(*args)
+    finally:
+        request_id_var.reset(token)
+
+class RequestIdMiddleware:
+    """
+    Give every HTTP request an id: the REQUEST_ID_HEADER header when the
+    client sent a usable one, else a random one. It is set as the current
+    request id for the request's logs and returned in the same header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.header = settings.REQUEST_ID_HEADER.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        supplied = None
+        for name, value in scope["headers"]:
+            if name == self.header:
+                supplied = value.decode("latin-1")
+                break
+        request_id = new_request_id(supplied)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), (self.header, request_id.encode("latin-1"))]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
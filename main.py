@@ -1,25 +1,83 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+from core.config import settings
 from core.logger import setup_logger
+from core.metrics import render_metrics
+from core.request_context import RequestIdMiddleware
 from router.invoice_router import router as invoice_router
+from service.cache import close_extraction_cache, get_extraction_cache
+from service.executor import LANES, get_extraction_executor, shutdown_extraction_executor
+from service.invoice_service import InvoiceService
+from service.job_queue import JobWorkers, close_job_store, get_job_store
+from service.results_store import close_results_store, get_results_store
 
 # Setup logger
 logger = setup_logger(__name__)
 
-app = FastAPI()
-
-# Include the invoice router
-app.include_router(invoice_router, prefix="/extract")
+async def warm_up(app: FastAPI) -> None:
+    """Start the extraction workers (running the warm-up sample in each) and open the cache, then report ready."""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        await asyncio.to_thread(get_extraction_cache)
+        await asyncio.gather(*(get_extraction_executor(lane).start() for lane in LANES))
+    except Exception as e:
+        logger.warning("Warm-up failed; staying not ready: %s", e)
+        return
+    app.state.ready = True
+    logger.info("Ready after %.1fs of warm-up.", loop.time() - start)
 
-@app.on_event("startup")
-async def startup_event():
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     logger.info("Starting up Invoice Extraction API...")
+    # One service for the whole process, shared by the routes and the job workers
+    app.state.invoice_service = InvoiceService()
+    # Starts the results writer thread when the store is enabled
+    get_results_store()
+    app.state.ready = not settings.WARMUP_ENABLED
+    warm_up_task = asyncio.create_task(warm_up(app)) if settings.WARMUP_ENABLED else None
+    app.state.job_workers = None
+    if settings.JOBS_ENABLED:
+        app.state.job_workers = JobWorkers(get_job_store(), app.state.invoice_service)
+        app.state.job_workers.start()
+
+    yield
 
-@app.on_event("shutdown")
-async def shutdown_event():
     logger.info("Shutting down Invoice Extraction API...")
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    if app.state.job_workers is not None:
+        await app.state.job_workers.stop()
+        close_job_store()
+    shutdown_extraction_executor()
+    close_extraction_cache()
+    # After everything that records results: flushes what is still queued
+    close_results_store()
+
+app = FastAPI(lifespan=lifespan)
+# Tags each request's log records with its id and returns the id in a response header
+app.add_middleware(RequestIdMiddleware)
+
+# Include the invoice router
+app.include_router(invoice_router, prefix="/extract")
 
 @app.get("/")
 def read_root():
     logger.info("Health check endpoint called.")
     return {"status": "Invoice Extraction API is running"}
+
+@app.get("/ready")
+def readiness():
+    """Readiness probe: 503 until the startup warm-up has finished."""
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "warming up"})
+    return {"status": "ready"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Per-stage latency histograms in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,20 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Any, AsyncIterator, Dict, Optional
 
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from core.config import settings
 from core.logger import setup_logger
-from schemas.invoice import InvoiceExtractionRequest, InvoiceExtractionResponse
-from service.invoice_service import InvoiceService
+from schemas.invoice import (
+    InvoiceBatchRequest,
+    InvoiceExpectedValues,
+    InvoiceExtractionRequest,
+    InvoiceExtractionResponse,
+    JobStatusResponse,
+    JobSubmitResponse,
+)
+from service.cache import get_extraction_cache
+from service.classifier import UnsupportedDocumentError
+from service.executor import QueueFullError, extraction_lane_stats
+from service.invoice_service import InvoiceService, decode_base64_blob
+from service.job_queue import get_job_store
+from service.results_store import get_results_store
+from service.quota import Caller, RateLimitedError, UnknownApiKeyError, get_caller_quotas, identify_caller
+from service.upload import PayloadTooLargeError, UnsupportedEncodingError, read_capped, read_multipart
 
 logger = setup_logger(__name__)
 
 router = APIRouter()
 
-def get_invoice_service() -> InvoiceService:
-    return InvoiceService()
+def get_invoice_service(request: Request) -> InvoiceService:
+    """The process-wide service created by the application lifespan."""
+    return request.app.state.invoice_service
+
+def get_caller(request: Request) -> Caller:
+    """The caller a request is accounted to (X-API-Key, else the CALLER_HEADER header)."""
+    try:
+        return identify_caller(request.headers.get("x-api-key"), request.headers.get(settings.CALLER_HEADER))
+    except UnknownApiKeyError as e:
+        logger.warning("Rejected request: %s", e)
+        raise HTTPException(status_code=401, detail=str(e))
 
 @router.post("/invoice", response_model=InvoiceExtractionResponse)
 async def extract_invoice(
     request: InvoiceExtractionRequest,
-    service: InvoiceService = Depends(get_invoice_service)
+    service: InvoiceService = Depends(get_invoice_service),
+    caller: Caller = Depends(get_caller)
 ):
     """
     Extract invoice data from a base64 encoded file and compare with expected values.
@@ -22,11 +51,211 @@ async def extract_invoice(
     logger.info("Received invoice extraction request via JSON.")
     
     try:
-        result = await service.process_invoice(request)
+        result = await service.process_invoice(request, caller)
         return result
+    except PayloadTooLargeError as e:
+        logger.warning("Rejected document: %s", e)
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedDocumentError as e:
+        logger.warning("Rejected document: %s", e)
+        raise HTTPException(status_code=415, detail=str(e))
+    except QueueFullError as e:
+        logger.warning("Rejected request: %s", e)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except RateLimitedError as e:
+        logger.warning("Rejected request: %s", e)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ValueError as e:
+        logger.warning("Validation error: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Internal server error: %s", e)
+        raise HTTPException(status_code=500, detail="An error occurred during invoice processing.")
+
+def _expected_header(field: str) -> str:
+    """Header carrying an expected value for raw uploads, e.g. CP_Name -> X-Expected-CP-Name."""
+    return "x-expected-" + field.replace("_", "-").lower()
+
+@router.post("/invoice/upload", response_model=InvoiceExtractionResponse)
+async def extract_invoice_upload(
+    request: Request,
+    service: InvoiceService = Depends(get_invoice_service),
+    caller: Caller = Depends(get_caller)
+):
+    """
+    Extract invoice data from a binary upload and compare with expected values.
+
+    Accepts either a multipart form (a `file` part plus the expected values as
+    form fields) or the raw document as the request body, with the expected
+    values in `X-Expected-<Field>` headers (e.g. `X-Expected-PAN`) and an
+    optional `X-Correlation-Id`. Bodies may be gzip or zstd compressed via
+    Content-Encoding; the decoded size is capped at MAX_UPLOAD_BYTES.
+    """
+    logger.info("Received invoice extraction request via binary upload.")
+    content_type = request.headers.get("content-type", "")
+    content_length = request.headers.get("content-length")
+
+    try:
+        if content_type.startswith("multipart/form-data"):
+            # Parsed as it streams in, so the cap applies to the file part before it is buffered
+            upload = await read_multipart(
+                request.stream(), content_type, expected_size=int(content_length) if content_length else None
+            )
+            data = upload.data
+            expected = InvoiceExpectedValues(**{
+                field: upload.fields[field] for field in InvoiceExpectedValues.model_fields if field in upload.fields
+            })
+        else:
+            encoding = request.headers.get("content-encoding")
+            data = await read_capped(
+                request.stream(),
+                encoding=encoding,
+                expected_size=int(content_length) if content_length and not encoding else None,
+            )
+            values = {field: request.headers.get(_expected_header(field)) for field in InvoiceExpectedValues.model_fields}
+            values["correlation_id"] = request.headers.get("x-correlation-id")
+            expected = InvoiceExpectedValues(**values)
+        if not data:
+            raise ValueError("Uploaded document is empty.")
+
+        return await service.process_document(data, expected, caller=caller)
+    except PayloadTooLargeError as e:
+        logger.warning("Rejected upload: %s", e)
+        raise HTTPException(status_code=413, detail=str(e))
+    except (UnsupportedEncodingError, UnsupportedDocumentError) as e:
+        logger.warning("Rejected upload: %s", e)
+        raise HTTPException(status_code=415, detail=str(e))
+    except QueueFullError as e:
+        logger.warning("Rejected request: %s", e)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except RateLimitedError as e:
+        logger.warning("Rejected request: %s", e)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
-        logger.warning(f"Validation error: {str(e)}")
+        logger.warning("Validation error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Internal server error: {str(e)}")
-        raise HTTPException(status_code=500, detail="An error occurred during invoice processing.")
\ No newline at end of file
+        logger.error("Internal server error: %s", e)
+        raise HTTPException(status_code=500, detail="An error occurred during invoice processing.")
+
+@router.post("/invoices")
+async def extract_invoices(
+    batch: InvoiceBatchRequest,
+    service: InvoiceService = Depends(get_invoice_service),
+    caller: Caller = Depends(get_caller)
+):
+    """
+    Extract a batch of invoices concurrently.
+    Streams one InvoiceBatchResult per line (NDJSON) as each invoice finishes.
+    """
+    logger.info("Received batch extraction request with %s invoices.", len(batch.invoices))
+    if len(batch.invoices) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds the limit of {settings.BATCH_MAX_ITEMS} invoices.")
+
+    async def stream() -> AsyncIterator[str]:
+        async for item in service.process_batch(batch.invoices, caller):
+            yield item.model_dump_json() + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/cache/stats")
+def extraction_cache_stats() -> Dict[str, Any]:
+    """
+    Hit/miss counters and sizes of the extraction cache.
+    """
+    cache = get_extraction_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@router.get("/lanes/stats")
+def extraction_lanes_stats() -> Dict[str, Any]:
+    """
+    Concurrency limit, occupancy, shed count and latency of the fast and OCR lanes.
+    """
+    return extraction_lane_stats()
+
+@router.get("/callers/stats")
+def extraction_callers_stats() -> Dict[str, Any]:
+    """
+    Admitted and rate-limited extractions, CPU-seconds used and quota balance per caller.
+    """
+    return get_caller_quotas().stats()
+
+@router.get("/results")
+def query_results(
+    document_hash: Optional[str] = Query(None, description="SHA-256 (hex) of the decoded document"),
+    date: Optional[str] = Query(None, description="UTC day the result was recorded, YYYY-MM-DD"),
+    limit: int = Query(100, ge=1, le=1000),
+) -> Dict[str, Any]:
+    """
+    Stored extraction results, newest first, by document hash, by day or both.
+    """
+    store = get_results_store()
+    if store is None:
+        raise HTTPException(status_code=404, detail="The results store is disabled (RESULTS_STORE_ENABLED).")
+    if not document_hash and not date:
+        raise HTTPException(status_code=400, detail="Pass a document_hash, a date or both.")
+    try:
+        return {"results": store.query(document_hash.lower() if document_hash else None, date, limit)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/results/stats")
+def results_store_stats() -> Dict[str, Any]:
+    """
+    Rows written, queued and dropped by the results store, and its segments.
+    """
+    store = get_results_store()
+    if store is None:
+        return {"enabled": False}
+    return {"enabled": True, **store.stats()}
+
+@router.post("/jobs", response_model=JobSubmitResponse, status_code=202)
+async def submit_extraction_job(request: InvoiceExtractionRequest, caller: Caller = Depends(get_caller)):
+    """
+    Queue an invoice for background extraction and return a job id immediately.
+    """
+    if not settings.JOBS_ENABLED:
+        raise HTTPException(status_code=404, detail="Asynchronous jobs are disabled (JOBS_ENABLED).")
+    logger.info("Received asynchronous extraction job.")
+    try:
+        decoded_data = decode_base64_blob(request.blob_64)
+        if len(decoded_data) > settings.MAX_UPLOAD_BYTES:
+            raise PayloadTooLargeError(f"Document of {len(decoded_data)} bytes exceeds the limit of {settings.MAX_UPLOAD_BYTES} bytes.")
+        # Callers over their quota are turned away now rather than filling the job queue
+        get_caller_quotas().check(caller)
+    except PayloadTooLargeError as e:
+        logger.warning("Rejected document: %s", e)
+        raise HTTPException(status_code=413, detail=str(e))
+    except RateLimitedError as e:
+        logger.warning("Rejected request: %s", e)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ValueError as e:
+        logger.warning("Validation error: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    expected = InvoiceExpectedValues(**request.model_dump(exclude={"blob_64"}))
+    job_id = await run_in_threadpool(get_job_store().submit, decoded_data, expected, caller.name)
+    return JobSubmitResponse(job_id=job_id, status="queued")
+
+@router.get("/jobs/metrics")
+def extraction_job_metrics() -> Dict[str, Any]:
+    """
+    Queue depth and job counts per status.
+    """
+    if not settings.JOBS_ENABLED:
+        return {"enabled": False}
+    return get_job_store().metrics()
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+def get_extraction_job(job_id: str):
+    """
+    Status of a job, with the extraction response once it is done.
+    """
+    if not settings.JOBS_ENABLED:
+        raise HTTPException(status_code=404, detail="Asynchronous jobs are disabled (JOBS_ENABLED).")
+    job = get_job_store().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return JobStatusResponse(job_id=job.pop("id"), **job)
\ No newline at end of file
@@ -1,8 +1,7 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from pydantic import BaseModel, Field
 
-class InvoiceExtractionRequest(BaseModel):
-    blob_64: str = Field(..., description="Base64 encoded file content")
+class InvoiceExpectedValues(BaseModel):
     CP_Name: Optional[str] = None
     PAN: Optional[str] = None
     GSTIN: Optional[str] = None
@@ -12,6 +11,10 @@ class InvoiceExtractionRequest(BaseModel):
     SGST: Optional[str] = None
     Total_Invoice_Amount: Optional[str] = None
     TDS: Optional[str] = None
+    correlation_id: Optional[str] = Field(None, description="Caller-supplied id echoed back in batch results")
+
+class InvoiceExtractionRequest(InvoiceExpectedValues):
+    blob_64: str = Field(..., description="Base64 encoded file content")
 
 class ComparisonValue(BaseModel):
     expected: Optional[str] = None
@@ -23,3 +26,29 @@ class InvoiceExtractionResponse(BaseModel):
     score: str
     remarks: str
     recommendedAction: str
+    extractionMethod: Optional[str] = None
+    pageMethods: Optional[List[str]] = Field(None, description="Per-page extraction method ('text', 'ocr', 'blank' or 'skipped') for PDFs and images")
+    extractionTruncated: bool = Field(False, description="True when some pages were not read (early exit or fast reject)")
+
+class InvoiceBatchRequest(BaseModel):
+    invoices: List[InvoiceExtractionRequest]
+
+class InvoiceBatchResult(BaseModel):
+    index: int = Field(..., description="Position of the invoice in the batch request")
+    correlation_id: Optional[str] = None
+    status: str = Field(..., description="OK or ERROR")
+    result: Optional[InvoiceExtractionResponse] = None
+    error: Optional[str] = None
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str = Field(..., description="queued, running, done or failed")
+    attempts: int
+    created_at: float
+    updated_at: float
+    error: Optional[str] = None
+    result: Optional[InvoiceExtractionResponse] = None
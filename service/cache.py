@@ -0,0 +1,200 @@
+import hashlib
+import importlib.util
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from core.config import settings
+from core.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Result keys worth keeping; the generated file name differs on every request
+CACHED_KEYS = ("extraction_method", "page_methods", "extracted_fields", "full_text", "truncated", "stop_reason")
+
+def document_hash(data: bytes) -> str:
+    """Content hash of a decoded document."""
+    return hashlib.sha256(data).hexdigest()
+
+def extraction_config_version() -> str:
+    """
+    Fingerprint of every setting that changes extraction output.
+    Cached entries written under a different configuration are never served.
+    """
+    config = {
+        "patterns": settings.EXTRACTION_PATTERNS,
+        "ocr_dpi": settings.OCR_DPI,
+        "ocr_backend": settings.OCR_BACKEND,
+        "ocr_lang": settings.OCR_LANG,
+        # service.preprocess.preprocessing_available(), without importing numpy into the API process
+        "ocr_preprocess": settings.OCR_PREPROCESS and importlib.util.find_spec("numpy") is not None,
+        "ocr_bilevel": settings.OCR_BILEVEL,
+        "ocr_low_dpi": settings.OCR_LOW_DPI,
+        "ocr_min_confidence": settings.OCR_MIN_CONFIDENCE,
+        "page_ocr_threshold": settings.PAGE_OCR_THRESHOLD,
+        "early_exit_mode": settings.EARLY_EXIT_MODE,
+        "early_exit_max_pages": settings.EARLY_EXIT_MAX_PAGES,
+        "max_pages": settings.MAX_PAGES,
+        "ocr_max_render_bytes": settings.OCR_MAX_RENDER_BYTES,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+class ExtractionCache:
+    """
+    Two-tier cache of extraction results keyed by document content.
+
+    A bounded in-memory LRU sits in front of a SQLite table. Both tiers expire
+    entries after `ttl_seconds`; the disk tier also evicts least recently used
+    rows beyond `disk_max_entries`. Disk eviction is a sweep over the table,
+    so it runs when the table has outgrown `disk_max_entries` by
+    EVICTION_SLACK or EVICTION_INTERVAL seconds after the last sweep, not on
+    every put. get() and put() block on SQLite: call them off the event loop.
+    """
+
+    # Fraction of disk_max_entries the table may grow past it before a sweep
+    EVICTION_SLACK = 0.1
+    # Longest time between sweeps while entries are being added, in seconds
+    EVICTION_INTERVAL = 300.0
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        memory_max_entries: Optional[int] = None,
+        disk_max_entries: Optional[int] = None,
+        ttl_seconds: Optional[int] = None,
+    ):
+        self.db_path = db_path or settings.CACHE_DB_PATH
+        self.memory_max_entries = settings.CACHE_MEMORY_MAX_ENTRIES if memory_max_entries is None else memory_max_entries
+        self.disk_max_entries = settings.CACHE_DISK_MAX_ENTRIES if disk_max_entries is None else disk_max_entries
+        self.ttl_seconds = settings.CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.config_version = extraction_config_version()
+
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extraction_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_access ON extraction_cache (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_created_at ON extraction_cache (created_at)")
+        # Rows on disk, counting every put as new (replacements are corrected by the next sweep)
+        self._disk_entries = self._conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+        self._last_eviction = time.time()
+
+    def key_for(self, data: bytes, digest: Optional[str] = None) -> str:
+        """Cache key for a document (or its precomputed document_hash) under the current extraction configuration."""
+        return f"{digest or document_hash(data)}:{self.config_version}"
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl_seconds) and now - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached extraction result for `key`, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if not self._is_expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT value, created_at FROM extraction_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            if self._is_expired(row[1], now):
+                self._conn.execute("DELETE FROM extraction_cache WHERE key = ?", (key,))
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE extraction_cache SET last_access = ? WHERE key = ?", (now, key))
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            self._stats["disk_hits"] += 1
+            return value
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        """Store an extraction result in both tiers."""
+        value = {k: result.get(k) for k in CACHED_KEYS}
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self._disk_entries += 1
+            over_limit = self.disk_max_entries and self._disk_entries > self.disk_max_entries * (1 + self.EVICTION_SLACK)
+            if over_limit or now - self._last_eviction >= self.EVICTION_INTERVAL:
+                self._evict_disk(now)
+
+    def _remember(self, key: str, created_at: float, value: Dict[str, Any]) -> None:
+        if self.memory_max_entries <= 0:
+            return
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _evict_disk(self, now: float) -> None:
+        self._last_eviction = now
+        if self.ttl_seconds:
+            cursor = self._conn.execute("DELETE FROM extraction_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._stats["expired"] += max(cursor.rowcount, 0)
+        if self.disk_max_entries:
+            cursor = self._conn.execute(
+                "DELETE FROM extraction_cache WHERE key IN ("
+                " SELECT key FROM extraction_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,),
+            )
+            self._stats["evictions"] += max(cursor.rowcount, 0)
+        self._disk_entries = self._conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current tier sizes."""
+        with self._lock:
+            disk_entries = self._conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+            lookups = self._stats["memory_hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            return {
+                **self._stats,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+                "config_version": self.config_version,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+_cache: Optional[ExtractionCache] = None
+
+def get_extraction_cache() -> Optional[ExtractionCache]:
+    """Return the process-wide extraction cache, or None when caching is disabled."""
+    global _cache
+    if _cache is None and settings.CACHE_ENABLED:
+        _cache = ExtractionCache()
+    return _cache
+
+def close_extraction_cache() -> None:
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
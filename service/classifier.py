@@ -0,0 +1,114 @@
+import io
+import zipfile
+from typing import Optional
+
+from core.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Raster formats Pillow can open, by magic number; they are OCR'd directly
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"II*\x00", ".tiff"),
+    (b"MM\x00*", ".tiff"),
+    (b"BM", ".bmp"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".gif", ".webp"}
+
+# Byte order marks, longest first (UTF-32 LE starts with the UTF-16 LE mark)
+TEXT_BOMS = (
+    (b"\xff\xfe\x00\x00", "utf-32"),
+    (b"\x00\x00\xfe\xff", "utf-32"),
+    (b"\xef\xbb\xbf", "utf-8-sig"),
+    (b"\xff\xfe", "utf-16"),
+    (b"\xfe\xff", "utf-16"),
+)
+
+# Formats recognised only to be turned away with a clear message
+UNSUPPORTED_SIGNATURES = (
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "legacy Office (.doc/.xls) document"),
+    (b"\x1f\x8b", "gzip archive"),
+    (b"Rar!", "RAR archive"),
+    (b"7z\xbc\xaf\x27\x1c", "7-Zip archive"),
+    (b"{\\rtf", "RTF document"),
+)
+
+# Leading bytes inspected when deciding whether a document is text
+TEXT_SAMPLE_BYTES = 4096
+
+class UnsupportedDocumentError(ValueError):
+    """Raised for documents that are not a PDF, DOCX, raster image or text."""
+
+def _zip_extension(data: bytes) -> str:
+    """Tell DOCX apart from the other ZIP-based formats by the archive's entries."""
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            names = set(archive.namelist())
+            if "word/document.xml" in names:
+                return ".docx"
+            if "mimetype" in names:
+                kind = archive.read("mimetype").decode("ascii", errors="replace").strip()
+                raise UnsupportedDocumentError(f"Unsupported document type: OpenDocument file ({kind}).")
+    except zipfile.BadZipFile as e:
+        raise UnsupportedDocumentError(f"Unsupported document type: corrupt ZIP/DOCX archive ({str(e)}).")
+    if any(name.startswith("xl/") for name in names):
+        raise UnsupportedDocumentError("Unsupported document type: Excel workbook (.xlsx).")
+    if any(name.startswith("ppt/") for name in names):
+        raise UnsupportedDocumentError("Unsupported document type: PowerPoint presentation (.pptx).")
+    raise UnsupportedDocumentError("Unsupported document type: ZIP archive.")
+
+def text_encoding(data: bytes) -> Optional[str]:
+    """
+    The encoding of a text document, or None when the bytes do not look like
+    text. BOMs are honoured; without one, UTF-8 is tried, then UTF-16 LE
+    (Windows "Unicode" exports) and finally cp1252 when the sample has
+    (almost) no control characters.
+    """
+    for bom, encoding in TEXT_BOMS:
+        if data.startswith(bom):
+            return encoding
+    sample = data[:TEXT_SAMPLE_BYTES]
+    if b"\x00" in sample:
+        odd_nuls = sample[1::2].count(0)
+        if odd_nuls >= len(sample) // 4 and sample[0::2].count(0) == 0:
+            return "utf-16-le"
+        return None
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the end of the sample is fine
+        if len(sample) == TEXT_SAMPLE_BYTES and e.start >= len(sample) - 3:
+            return "utf-8"
+    control = sum(1 for byte in sample if byte < 32 and byte not in b"\t\n\r\f")
+    return "cp1252" if control <= len(sample) // 100 else None
+
+def detect_extension(data: bytes) -> str:
+    """
+    Classify a document by its content and return the extension it is routed
+    by: ".pdf", ".docx", a raster image extension (".png", ".jpg", ".tiff",
+    ".bmp", ".gif", ".webp"), ".csv" or ".txt".
+    Raises UnsupportedDocumentError for anything else.
+    """
+    # Some producers put junk before the header; readers accept it within the first KB
+    if b"%PDF-" in data[:1024]:
+        return ".pdf"
+    if data.startswith(b"PK\x03\x04"):
+        return _zip_extension(data)
+    for signature, extension in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    for signature, description in UNSUPPORTED_SIGNATURES:
+        if data.startswith(signature):
+            raise UnsupportedDocumentError(f"Unsupported document type: {description}.")
+
+    encoding = text_encoding(data)
+    if encoding is None:
+        raise UnsupportedDocumentError("Unsupported document type: unrecognised binary data.")
+    head = data[:TEXT_SAMPLE_BYTES].decode(encoding, errors="ignore")
+    return ".csv" if "," in head[:200] else ".txt"  # Heuristic for CSV
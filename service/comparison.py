@@ -0,0 +1,22 @@
+from typing import Any, Dict, Optional
+
+def normalize_value(val: Any) -> Any:
+    """Normalize string or float values for comparison."""
+    if val is None:
+        return ""
+    val = str(val).strip()
+    try:
+        # Try to convert to float for numeric comparison
+        # Remove commas and currency symbols if present
+        cleaned = val.replace(",", "").replace("₹", "").replace("■", "").strip()
+        float_val = float(cleaned)
+        return float_val
+    except ValueError:
+        return val.lower()
+
+def compare_field(expected: Optional[str], actual: Optional[str]) -> Dict[str, Any]:
+    """Compare two values and return result object."""
+    if normalize_value(expected) == normalize_value(actual):
+        return {"expected": expected, "actual": actual, "result": "MATCH"}
+    else:
+        return {"expected": expected, "actual": actual, "result": "DISCREPANCY"}
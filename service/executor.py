@@ -0,0 +1,441 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import multiprocessing
+import os
+import pickle
+import statistics
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from core.config import settings
+from core.logger import setup_logger
+from core.request_context import request_id_var, run_with_request_id
+
+logger = setup_logger(__name__)
+
+EXECUTION_MODES = ("inline", "thread", "process")
+
+# Text-layer documents run in the fast lane, anything that needs OCR in the OCR lane
+LANES = ("fast", "ocr")
+
+class QueueFullError(RuntimeError):
+    """Raised when the extraction queue has no room for another submission."""
+
+    def __init__(self, retry_after: int, lane: Optional[str] = None):
+        queue = f"The {lane} extraction lane" if lane else "Extraction queue"
+        super().__init__(f"{queue} is full. Please retry later.")
+        self.retry_after = retry_after
+        self.lane = lane
+
+class WorkerCrashedError(RuntimeError):
+    """Raised when a worker process died while running a job; the job itself may well succeed on retry."""
+
+class AdaptiveLimit:
+    """
+    A concurrency limit between 1 and `maximum` that follows observed latency.
+
+    Each sample (seconds per unit of work) is compared with the usual latency
+    of its own kind of document: the BASELINE_PERCENTILE of that kind's last
+    WINDOW samples. Every `value` samples the median of these ratios, the
+    latency gradient, moves the limit: above `tolerance` it drops by one,
+    otherwise it grows by one up to `maximum`. Mixed traffic (one-page PDFs
+    between slow DOCX files) keeps a gradient near 1; only latency rising
+    for the kinds being run, as under contention, lowers the limit.
+    """
+
+    WINDOW = 100
+    BASELINE_PERCENTILE = 0.25
+    # Samples of a kind needed before its latency is judged
+    MIN_SAMPLES = 5
+    # Kinds whose latency history is kept
+    MAX_KINDS = 64
+
+    def __init__(self, maximum: int, tolerance: float):
+        self.maximum = max(1, maximum)
+        self.value = self.maximum
+        self.tolerance = tolerance
+        self.gradient: Optional[float] = None
+        self._history: Dict[str, Deque[float]] = {}
+        self._ratios: List[float] = []
+
+    def baseline(self, kind: str = "") -> Optional[float]:
+        """The usual seconds per unit of `kind`, or None while it has too few samples."""
+        history = self._history.get(kind)
+        if history is None or len(history) < self.MIN_SAMPLES:
+            return None
+        ordered = sorted(history)
+        return ordered[int(self.BASELINE_PERCENTILE * (len(ordered) - 1))]
+
+    def baselines(self) -> Dict[str, float]:
+        """Baseline of every kind with enough samples."""
+        baselines = {kind: self.baseline(kind) for kind in list(self._history)}
+        return {kind: seconds for kind, seconds in baselines.items() if seconds is not None}
+
+    def record(self, seconds: float, kind: str = "") -> None:
+        baseline = self.baseline(kind)
+        history = self._history.pop(kind, None)
+        if history is None:
+            history = deque(maxlen=self.WINDOW)
+            if len(self._history) >= self.MAX_KINDS:
+                del self._history[next(iter(self._history))]
+        history.append(seconds)
+        # Most recently seen kinds last, so the least recently seen one is dropped first
+        self._history[kind] = history
+        if baseline is None:
+            return
+        self._ratios.append(seconds / baseline if baseline > 0 else 1.0)
+        if len(self._ratios) < self.value:
+            return
+        self.gradient = statistics.median(self._ratios)
+        self._ratios = []
+        if self.gradient > self.tolerance:
+            self.value = max(1, self.value - 1)
+        else:
+            self.value = min(self.maximum, self.value + 1)
+
+class FairQueue:
+    """
+    Weighted fair queueing of waiting jobs between callers (start-time fair
+    queueing, with job cost in CPU-seconds).
+
+    Each job is tagged when it arrives: it starts at the later of the
+    virtual clock and the finish tag of the caller's previous job, and
+    finishes its estimated cost / weight later. Waiting jobs are dispatched
+    lowest start tag first and the virtual clock follows the dispatched
+    tags, so a caller with twice the weight gets twice the CPU time, and a
+    caller who floods the queue only delays its own jobs. The estimate is
+    the caller's average cost so far; once a job has run, its caller's
+    finish tag is corrected by the difference to the actual cost.
+    """
+
+    SMOOTHING = 0.3
+    # Cost estimate for a caller's first job when nothing has run yet
+    DEFAULT_COST = 1.0
+    # Callers whose cost estimate is remembered
+    MAX_CALLERS = 1024
+
+    def __init__(self):
+        self.virtual = 0.0
+        self._finish: Dict[str, float] = {}
+        self._costs: Dict[str, float] = {}
+        self._mean_cost: Optional[float] = None
+        self._heap: List[Tuple[float, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def tag(self, caller: str, weight: float) -> Tuple[float, float]:
+        """Tag a new job of `caller`; returns (start tag, estimated cost)."""
+        estimate = self._costs.get(caller, self._mean_cost or self.DEFAULT_COST)
+        start = max(self.virtual, self._finish.get(caller, 0.0))
+        self._finish[caller] = start + estimate / weight
+        return start, estimate
+
+    def push(self, start: float, waiter: asyncio.Future) -> None:
+        heapq.heappush(self._heap, (start, next(self._sequence), waiter))
+
+    def pop(self) -> asyncio.Future:
+        """The waiter with the lowest start tag; the virtual clock moves to its tag."""
+        start, _, waiter = heapq.heappop(self._heap)
+        self.virtual = max(self.virtual, start)
+        return waiter
+
+    def remove(self, waiter: asyncio.Future) -> None:
+        self._heap = [entry for entry in self._heap if entry[2] is not waiter]
+        heapq.heapify(self._heap)
+
+    def dispatched(self, start: float) -> None:
+        """A job started without waiting."""
+        self.virtual = max(self.virtual, start)
+
+    def completed(self, caller: str, weight: float, estimate: float, cost: float) -> None:
+        """Correct the caller's finish tag and cost estimate with a job's actual cost."""
+        self._correct(caller, weight, cost - estimate)
+        previous = self._costs.pop(caller, None)
+        self._costs[caller] = cost if previous is None else previous + self.SMOOTHING * (cost - previous)
+        if len(self._costs) > self.MAX_CALLERS:
+            del self._costs[next(iter(self._costs))]
+        self._mean_cost = cost if self._mean_cost is None else self._mean_cost + self.SMOOTHING * (cost - self._mean_cost)
+
+    def abandoned(self, caller: str, weight: float, estimate: float) -> None:
+        """A tagged job left without running: take its estimate back off the caller's finish tag."""
+        self._correct(caller, weight, -estimate)
+
+    def _correct(self, caller: str, weight: float, difference: float) -> None:
+        if caller in self._finish:
+            self._finish[caller] += difference / weight
+            if self._finish[caller] <= self.virtual:
+                # Idle callers start again from the virtual clock
+                del self._finish[caller]
+
+def _initialize_worker(nice: int, initializer: Optional[Callable[[], None]]) -> None:
+    """Pool initializer: lower the worker's CPU priority by `nice`, then run `initializer`."""
+    if nice:
+        try:
+            os.nice(nice)
+        except OSError as e:
+            logger.warning("Could not lower extraction worker priority: %s", e)
+    if initializer is not None:
+        initializer()
+
+class ExtractionExecutor:
+    """
+    Runs blocking extraction work off the event loop.
+
+    At most `limit.value` jobs run at once (`max_workers` unless `adaptive`
+    lets observed latency lower it); the rest wait in a FairQueue, FIFO per
+    caller and weighted-fair between callers. Submissions are bounded: once
+    `queue_limit` jobs are running or waiting, further submissions fail fast
+    with QueueFullError.
+    """
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        queue_limit: Optional[int] = None,
+        initializer: Optional[Callable[[], None]] = None,
+        lane: Optional[str] = None,
+        nice: int = 0,
+        adaptive: bool = False,
+    ):
+        self.mode = (mode or settings.EXECUTION_MODE).lower()
+        if self.mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode '{self.mode}'. Expected one of {EXECUTION_MODES}.")
+        self.lane = lane
+        self.name = f"{lane}-lane" if lane else "extraction"
+        self.max_workers = max(1, max_workers or settings.EXTRACTION_WORKERS)
+        self.queue_limit = settings.EXTRACTION_QUEUE_LIMIT if queue_limit is None else queue_limit
+        # Run once in every worker process/thread as it starts (and in-process for "inline")
+        self.initializer = initializer
+        self.nice = nice
+        self.adaptive = adaptive
+        self.limit = AdaptiveLimit(self.max_workers, settings.LANE_LATENCY_TOLERANCE)
+        self.completed = 0
+        self.shed = 0
+        self._pool: Optional[Executor] = None
+        self._running = 0
+        self._waiters = FairQueue()
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs currently running or waiting for a worker."""
+        return self._running + len(self._waiters)
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            initializer = None
+            if self.nice or self.initializer is not None:
+                initializer = functools.partial(_initialize_worker, self.nice, self.initializer)
+            if self.mode == "process":
+                # Spawned workers do not inherit the event loop or open sockets of the server
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=initializer,
+                )
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=self.name,
+                    initializer=initializer,
+                )
+            logger.info("Started %s %s pool with %s workers.", self.mode, self.name, self.max_workers)
+        return self._pool
+
+    async def start(self) -> None:
+        """
+        Start every worker now instead of on first use and wait until each
+        has run the initializer.
+        """
+        if self.mode == "inline":
+            if self.initializer is not None:
+                await asyncio.to_thread(self.initializer)
+            return
+        pool = self._get_pool()
+        loop = asyncio.get_running_loop()
+        # Submitted together, so no worker is idle yet and the pool starts a new one for each
+        await asyncio.gather(*(loop.run_in_executor(pool, _noop) for _ in range(self.max_workers)))
+        logger.info("All %s %s workers started.", self.max_workers, self.name)
+
+    async def _acquire(self, start: float) -> None:
+        """Wait for a free slot under the concurrency limit; `start` is the job's fair-queue tag."""
+        if self._running < self.limit.value and not self._waiters:
+            self._running += 1
+            self._waiters.dispatched(start)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.push(start, waiter)
+        try:
+            await waiter
+        except BaseException:
+            if not waiter.done() or waiter.cancelled():
+                self._waiters.remove(waiter)
+            else:
+                # Cancelled just after being handed a slot: pass it on
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self._running -= 1
+        # Hand freed slots to waiters in fair-queue order; the slot is counted on their behalf
+        while self._waiters and self._running < self.limit.value:
+            waiter = self._waiters.pop()
+            if not waiter.done():
+                self._running += 1
+                waiter.set_result(None)
+
+    async def run(
+        self,
+        func: Callable[..., Any],
+        *args: Any,
+        units: Optional[Callable[[Any], int]] = None,
+        caller: str = "",
+        weight: float = 1.0,
+        cost: Optional[Callable[[Any], float]] = None,
+        kind: str = "",
+    ) -> Any:
+        """
+        Run `func(*args)` according to the configured execution mode.
+        `units(result)` is the amount of work done (e.g. pages), used to
+        normalise latency samples when `adaptive` is set; samples are judged
+        against earlier ones of the same `kind` (e.g. file type). `caller` and
+        `weight` place the job in the fair queue; `cost(result)` is what it
+        actually cost in CPU-seconds (wall time when not given). A job that
+        fails is charged what it used before failing: the error's
+        `cpu_seconds` when it has one, else the time it ran.
+        """
+        if self.queue_limit and self.pending >= self.queue_limit:
+            self.shed += 1
+            logger.warning("Queue of the %s pool full (%s/%s). Rejecting submission.", self.name, self.pending, self.queue_limit)
+            raise QueueFullError(settings.EXTRACTION_RETRY_AFTER, self.lane)
+
+        tag, estimate = self._waiters.tag(caller, weight)
+        try:
+            await self._acquire(tag)
+        except BaseException:
+            # Cancelled while waiting; the job never ran
+            self._waiters.abandoned(caller, weight, estimate)
+            raise
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            if self.mode == "inline":
+                result = func(*args)
+            else:
+                try:
+                    # The worker's log records carry this request's id
+                    entry = _call_in_worker if self.mode == "process" else run_with_request_id
+                    call = functools.partial(entry, request_id_var.get(), func, *args)
+                    result = await loop.run_in_executor(self._get_pool(), call)
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM-killed); drop the pool so the next submission gets a fresh one
+                    logger.error("The %s process pool is broken. Recreating it on next submission.", self.name)
+                    self._reset_pool()
+                    raise WorkerCrashedError("Extraction worker terminated unexpectedly.")
+        except BaseException as e:
+            spent = getattr(e, "cpu_seconds", None) if cost else None
+            self._waiters.completed(caller, weight, estimate, loop.time() - start if spent is None else spent)
+            raise
+        else:
+            self.completed += 1
+            self._waiters.completed(caller, weight, estimate, cost(result) if cost else loop.time() - start)
+            if self.adaptive:
+                previous = self.limit.value
+                self.limit.record((loop.time() - start) / max(1, units(result) if units else 1), kind)
+                if self.limit.value != previous:
+                    logger.info("Concurrency limit of the %s pool: %s -> %s", self.name, previous, self.limit.value)
+            return result
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Current limit, occupancy and latency figures, for the lane stats endpoint."""
+        return {
+            "mode": self.mode,
+            "workers": self.max_workers,
+            "concurrency_limit": self.limit.value,
+            "running": self._running,
+            "waiting": len(self._waiters),
+            "queue_limit": self.queue_limit,
+            "completed": self.completed,
+            "shed": self.shed,
+            "latency_gradient": round(self.limit.gradient, 2) if self.limit.gradient is not None else None,
+            "baseline_ms_per_unit": {kind or "other": round(seconds * 1000, 1) for kind, seconds in self.limit.baselines().items()},
+        }
+
+    def _reset_pool(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        """Stop the worker pool, waiting for running jobs to finish."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+            logger.info("The %s pool shut down.", self.name)
+
+def _noop() -> None:
+    pass
+
+def _call_in_worker(request_id: Optional[str], func: Callable[..., Any], *args: Any) -> Any:
+    """
+    Entry point of jobs in worker processes. An exception is sent back to the
+    server pickled, and one that cannot be unpickled there (e.g. pytesseract's
+    TesseractNotFoundError) breaks the pool and fails every job in flight; such
+    exceptions are replaced by a RuntimeError with the same message.
+    """
+    try:
+        return run_with_request_id(request_id, func, *args)
+    except Exception as e:
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            raise RuntimeError(f"{type(e).__name__}: {e}") from None
+        raise
+
+_executors: Dict[str, ExtractionExecutor] = {}
+
+def get_extraction_executor(lane: str) -> ExtractionExecutor:
+    """Return the process-wide executor of a lane ("fast" or "ocr"), creating it on first use."""
+    if lane not in LANES:
+        raise ValueError(f"Unknown extraction lane '{lane}'. Expected one of {LANES}.")
+    if lane not in _executors:
+        initializer = None
+        if settings.WARMUP_ENABLED:
+            from service.warmup import warm_up_worker
+
+            # Fast-lane workers never OCR, so they skip loading Tesseract
+            initializer = functools.partial(warm_up_worker, ocr=lane == "ocr")
+        if lane == "ocr":
+            _executors[lane] = ExtractionExecutor(
+                max_workers=settings.OCR_LANE_WORKERS,
+                queue_limit=settings.OCR_LANE_QUEUE_LIMIT,
+                initializer=initializer,
+                lane=lane,
+                nice=settings.OCR_LANE_NICE,
+                adaptive=True,
+            )
+        else:
+            _executors[lane] = ExtractionExecutor(
+                max_workers=settings.FAST_LANE_WORKERS,
+                queue_limit=settings.FAST_LANE_QUEUE_LIMIT,
+                initializer=initializer,
+                lane=lane,
+                adaptive=True,
+            )
+    return _executors[lane]
+
+def extraction_lane_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats of every lane started so far."""
+    return {lane: executor.stats() for lane, executor in _executors.items()}
+
+def shutdown_extraction_executor() -> None:
+    for lane in list(_executors):
+        _executors.pop(lane).shutdown()
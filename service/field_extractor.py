@@ -0,0 +1,324 @@
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern, Set, Union
+
+from core.config import settings
+from core.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Fields whose values are summed over every occurrence instead of taking the first
+SUMMED_FIELDS = ("TDS",)
+
+# Characters that IGNORECASE matches against ASCII letters but str.lower() does not map to them
+_CASE_FOLD_EXCEPTIONS = ("İ", "ı", "ſ", "K")
+
+def _clean_amount(val: str) -> str:
+    """Remove commas and currency symbols from an extracted amount."""
+    return val.replace(",", "").replace("₹", "").replace("■", "").strip()
+
+def _anchor_literals(anchor: str) -> Optional[List[str]]:
+    """
+    Lower-cased literal labels an anchor can start with, e.g. `\\bPAN` -> ["pan"]
+    and `(?:Commission|Brokerage)` -> ["commission", "brokerage"].
+    Returns None when the anchor is not a plain literal or literal alternation.
+    """
+    if anchor.startswith(r"\b"):
+        anchor = anchor[2:]
+    if anchor.startswith("(?:") and anchor.endswith(")"):
+        alternatives = anchor[3:-1].split("|")
+    else:
+        alternatives = [anchor]
+    if not all(alt and re.escape(alt) == alt for alt in alternatives):
+        return None
+    return [alt.lower() for alt in alternatives]
+
+class FieldExtractor:
+    """
+    Precompiled, anchor-driven field extraction.
+
+    Every pattern starts with a label anchor ("PAN", "GSTIN", "CGST", ...).
+    Instead of running each full pattern over the whole text, the label
+    occurrences are located with plain substring search on a lower-cased copy
+    of the text, and the value pattern is matched only at those offsets,
+    within a window of `window` characters, stopping at the first anchor that
+    yields a value. Summed fields (TDS) use the precompiled pattern's own
+    findall, which is faster than visiting every anchor. Results are identical to
+    `re.search` / `re.findall` with the full patterns over the whole text.
+    """
+
+    def __init__(self, patterns: Dict[str, str], anchors: Dict[str, str], window: int):
+        self.window = window
+        self.fields: List[str] = list(patterns)
+        self.patterns: Dict[str, Pattern] = {
+            key: re.compile(pattern, re.IGNORECASE) for key, pattern in patterns.items()
+        }
+        self.anchor_regexes: Dict[str, Pattern] = {}
+        self.anchor_literals: Dict[str, List[str]] = {}
+        self.full_scan_fields: List[str] = []
+
+        for key, pattern in patterns.items():
+            anchor = anchors.get(key)
+            if not anchor or not pattern.startswith(anchor):
+                logger.warning("No usable anchor for field '%s'. It will be extracted with a full-text scan.", key)
+                self.full_scan_fields.append(key)
+                continue
+            self.anchor_regexes[key] = re.compile(anchor, re.IGNORECASE)
+            literals = _anchor_literals(anchor)
+            if literals:
+                self.anchor_literals[key] = literals
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Collapse every whitespace run to a single space (same result as re.sub(r"\\s+", " ", text))."""
+        if not text:
+            return text
+        collapsed = " ".join(text.split())
+        if text[0].isspace():
+            collapsed = " " + collapsed
+        if text[-1].isspace() and collapsed != " ":
+            collapsed = collapsed + " "
+        return collapsed
+
+    @staticmethod
+    def _lower_for_search(text: str) -> Optional[str]:
+        """Lower-cased copy with identical offsets, or None when case folding could shift or miss matches."""
+        if not text.isascii() and any(ch in text for ch in _CASE_FOLD_EXCEPTIONS):
+            return None
+        lowered = text.lower()
+        return lowered if len(lowered) == len(text) else None
+
+    def _anchor_positions(self, key: str, text: str, lowered: Optional[str], start: int = 0) -> Iterator[int]:
+        """Yield candidate start offsets for `key` at or after `start`, in ascending order."""
+        literals = self.anchor_literals.get(key)
+        if lowered is None or not literals:
+            for match in self.anchor_regexes[key].finditer(text, start):
+                yield match.start()
+            return
+
+        if len(literals) == 1:
+            literal = literals[0]
+            pos = lowered.find(literal, start)
+            while pos != -1:
+                yield pos
+                pos = lowered.find(literal, pos + 1)
+            return
+
+        next_pos = {literal: lowered.find(literal, start) for literal in literals}
+        while True:
+            found = [(pos, literal) for literal, pos in next_pos.items() if pos != -1]
+            if not found:
+                return
+            pos, literal = min(found)
+            yield pos
+            next_pos[literal] = lowered.find(literal, pos + 1)
+
+    def _match_at(self, regex: Pattern, text: str, pos: int) -> Optional[re.Match]:
+        end = min(len(text), pos + self.window)
+        match = regex.match(text, pos, end)
+        if match is not None and match.end() == end and end < len(text):
+            # The window may have cut the value (or satisfied `$`/`\b`) early; retry unbounded
+            match = regex.match(text, pos)
+        return match
+
+    def search(self, key: str, text: str, lowered: Optional[str] = None) -> Optional[re.Match]:
+        """Equivalent of `re.search(pattern, text, re.IGNORECASE)` for a normalized text."""
+        regex = self.patterns[key]
+        if key in self.full_scan_fields:
+            return regex.search(text)
+        for pos in self._anchor_positions(key, text, lowered):
+            match = self._match_at(regex, text, pos)
+            if match is not None:
+                return match
+        return None
+
+    def findall(self, key: str, text: str) -> List[str]:
+        """
+        Equivalent of `re.findall(pattern, text, re.IGNORECASE)`.
+        Summed fields need every occurrence, so the whole scan stays inside the
+        regex engine rather than visiting each anchor from Python.
+        """
+        return self.patterns[key].findall(text)
+
+    def extract(self, text: str) -> Dict[str, Optional[str]]:
+        """Extract all configured fields from raw document text."""
+        text = self.normalize(text)
+        lowered = self._lower_for_search(text)
+
+        extracted: Dict[str, Optional[str]] = {}
+        for key in self.fields:
+            if key in SUMMED_FIELDS:
+                extracted[key] = self.finalize(key, self.findall(key, text))
+            else:
+                match = self.search(key, text, lowered)
+                extracted[key] = self.finalize(key, match.group(1) if match else None)
+        return extracted
+
+    @staticmethod
+    def finalize(key: str, raw: Union[None, str, List[str]]) -> Optional[str]:
+        """Turn a raw match (or, for summed fields, every match) into the reported value."""
+        if key in SUMMED_FIELDS:
+            total = 0.0
+            for val in raw:
+                try:
+                    total += float(_clean_amount(val))
+                except ValueError:
+                    continue
+            value = f"{total:g}" if raw else None # :g removes trailing zeros
+        else:
+            value = raw.strip() if raw is not None else None
+
+            # Post-process CP_Name to stop at first comma
+            if key == "CP_Name" and value and "," in value:
+                value = value.split(",")[0].strip()
+
+        logger.debug("Extracted %s: %s", key, value)
+        return value
+
+    def accumulator(self) -> "FieldAccumulator":
+        """Start an incremental extraction fed one page at a time."""
+        return FieldAccumulator(self)
+
+    def extract_pages(self, pages: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Same result as `extract("".join(pages))` without building the joined text."""
+        accumulator = self.accumulator()
+        for page_text in pages:
+            accumulator.feed(page_text)
+        return accumulator.finish()
+
+class FieldAccumulator:
+    """
+    Incremental counterpart of FieldExtractor.extract.
+
+    Page texts are fed in order and normalized as they arrive. A field is
+    resolved once its value can no longer change: its label occurrence lies
+    more than `window` characters before the end of the text seen so far and
+    the match does not run into that end. Until then, `current` reports the
+    value `extract` would return for the text fed so far, which is what
+    callers that stop reading early end up with. Only the text still needed
+    by unresolved fields is kept, so memory stays bounded by a page plus the
+    window instead of growing with the document. Results equal `extract` on
+    the joined text for values shorter than the window.
+    """
+
+    def __init__(self, extractor: FieldExtractor):
+        self.extractor = extractor
+        self.values: Dict[str, str] = {}
+        self._buffer = ""
+        self._started = False
+        self._scan: Dict[str, int] = {key: 0 for key in extractor.fields}
+        self._summed: Dict[str, List[str]] = {key: [] for key in extractor.fields if key in SUMMED_FIELDS}
+        # Values (and summed fields with a match) not settled yet
+        self._tentative: Dict[str, str] = {}
+        self._seen: Set[str] = set()
+
+    @property
+    def missing(self) -> List[str]:
+        """Fields without a value yet; summed fields count as found after one occurrence."""
+        return [
+            key for key in self.extractor.fields
+            if not (self._summed[key] or key in self._seen if key in self._summed else self.current(key) is not None)
+        ]
+
+    def current(self, key: str) -> Optional[str]:
+        """Raw value of a non-summed field in the text fed so far, settled or not."""
+        return self.values.get(key, self._tentative.get(key))
+
+    def feed(self, text: str) -> None:
+        if not self._started:
+            # The joined text is stripped, so leading whitespace of the document is dropped
+            text = text.lstrip()
+            if not text:
+                return
+            self._started = True
+        chunk = self.extractor.normalize(text)
+        if chunk.startswith(" ") and self._buffer.endswith(" "):
+            chunk = chunk[1:]
+        self._buffer += chunk
+        self._advance(final=False)
+
+    def finish(self) -> Dict[str, Optional[str]]:
+        """Resolve every remaining field against the complete text and return all values."""
+        if self._buffer.endswith(" "):
+            self._buffer = self._buffer[:-1]
+        self._advance(final=True)
+        extracted: Dict[str, Optional[str]] = {}
+        for key in self.extractor.fields:
+            raw = self._summed[key] if key in self._summed else self.values.get(key)
+            extracted[key] = self.extractor.finalize(key, raw)
+        return extracted
+
+    def _settled(self, match: re.Match, settle: int, final: bool) -> bool:
+        return final or (match.start() < settle and match.end() < len(self._buffer))
+
+    def _advance(self, final: bool) -> None:
+        text = self._buffer
+        size = len(text)
+        settle = size if final else size - self.extractor.window
+        lowered = self.extractor._lower_for_search(text)
+
+        for key in [k for k in self.extractor.fields if k not in self._summed and k not in self.values]:
+            regex = self.extractor.patterns[key]
+            scan = self._scan[key]
+            if key in self.extractor.full_scan_fields:
+                matches = [regex.search(text, scan)]
+                positions = [matches[0].start()] if matches[0] else []
+            else:
+                matches = None
+                positions = self.extractor._anchor_positions(key, text, lowered, scan)
+
+            open_pos: Optional[int] = None
+            tentative: Optional[str] = None
+            for pos in positions:
+                match = matches[0] if matches else self.extractor._match_at(regex, text, pos)
+                decided = final or pos < settle
+                if match is not None and decided and (final or match.end() < size):
+                    self.values[key] = match.group(1)
+                    break
+                if decided and match is None:
+                    continue
+                # This occurrence may still match, or match differently, once more text arrives
+                if open_pos is None:
+                    open_pos = pos
+                if match is not None:
+                    tentative = match.group(1)
+                    break
+
+            if key in self.values:
+                self._tentative.pop(key, None)
+                continue
+            self._scan[key] = open_pos if open_pos is not None else max(scan, settle)
+            if tentative is None:
+                self._tentative.pop(key, None)
+            else:
+                self._tentative[key] = tentative
+
+        for key, found in self._summed.items():
+            regex = self.extractor.patterns[key]
+            pos = self._scan[key]
+            while True:
+                match = regex.search(text, pos)
+                if match is None:
+                    pos = max(pos, settle)
+                    break
+                if not self._settled(match, settle, final):
+                    self._seen.add(key)
+                    pos = max(pos, min(match.start(), settle))
+                    break
+                found.append(match.group(1))
+                pos = match.end() if match.end() > match.start() else match.end() + 1
+            self._scan[key] = pos
+
+        # Keep one character before the earliest pending offset for `\b` look-behind
+        pending = [self._scan[k] for k in self.extractor.fields if k in self._summed or k not in self.values]
+        keep_from = max(0, min(pending, default=size) - 1)
+        if keep_from:
+            self._buffer = text[keep_from:]
+            for key in self._scan:
+                self._scan[key] = max(0, self._scan[key] - keep_from)
+
+# Compiled once per process at import time
+field_extractor = FieldExtractor(
+    settings.EXTRACTION_PATTERNS,
+    settings.EXTRACTION_ANCHORS,
+    settings.EXTRACTION_WINDOW,
+)
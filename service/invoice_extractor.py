@@ -1,67 +1,321 @@
 import io
 import os
-import re
-from typing import Any, Dict, Optional
-
-import docx  # python-docx
-import fitz  # PyMuPDF
-import pytesseract
-from PIL import Image
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 from core.config import settings
 from core.logger import setup_logger
+from core.metrics import NULL_TIMER, CpuMeter, stage_timer
+from service.classifier import IMAGE_EXTENSIONS, detect_extension, text_encoding
+from service.comparison import compare_field
+from service.field_extractor import field_extractor
+from service.memory import NULL_BUDGET, request_budget
+
+# The format backends (PyMuPDF, python-docx, Pillow and the OCR stack) are imported on
+# first use of their format, so that importing this module (the API process, a freshly
+# spawned worker) stays cheap; see test/bench_startup.py
+if TYPE_CHECKING:
+    import fitz  # PyMuPDF
 
 logger = setup_logger(__name__)
 
-def extract_text_normal(pdf_path: str) -> str:
+# Extractors accept either a file path or the raw document bytes
+DocumentSource = Union[str, bytes]
+
+# Font-less pages whose images cover less than this fraction of the page (and that
+# have no vector drawings) have nothing for OCR to read
+MIN_OCR_IMAGE_COVERAGE = 0.02
+
+# Extensions routed by name; anything else is classified by content
+KNOWN_EXTENSIONS = {".pdf", ".docx", ".doc", ".csv", ".txt", *IMAGE_EXTENSIONS}
+
+# Pages already read from a PDF's text layer: page number -> (text, method)
+KnownPages = Dict[int, Tuple[str, str]]
+
+class OcrRequiredError(Exception):
+    """
+    Raised by an extraction with OCR disallowed (the fast lane) when the
+    document needs OCR. `pages` holds the PDF pages read so far that did not
+    need it, so the OCR lane does not have to read them again, and
+    `cpu_seconds` the CPU time spent before giving up, charged to the caller
+    along with the OCR lane's.
+    """
+
+    def __init__(self, message: str, pages: Optional[KnownPages] = None, cpu_seconds: float = 0.0):
+        super().__init__(message)
+        self.pages: KnownPages = pages or {}
+        self.cpu_seconds = cpu_seconds
+
+    def __reduce__(self):
+        # Sent back from worker processes pickled, pages and CPU time included
+        return type(self), (str(self), self.pages, self.cpu_seconds)
+
+def _open_pdf(source: DocumentSource) -> "fitz.Document":
+    """Open a PDF from a file path or from in-memory bytes."""
+    import fitz  # PyMuPDF
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def extract_text_normal(source: DocumentSource) -> str:
     """Extract text from a PDF using PyMuPDF (fitz)."""
-    text = ""
     try:
-        doc = fitz.open(pdf_path)
-        for page in doc:
-            text += page.get_text()
-        logger.debug(f"Extracted {len(text)} characters using normal extraction.")
+        with _open_pdf(source) as doc:
+            text = "".join(page.get_text() for page in doc)
+        logger.debug("Extracted %s characters using normal extraction.", len(text))
         return text.strip()
     except Exception as e:
-        logger.error(f"Error in normal text extraction: {str(e)}")
+        logger.error("Error in normal text extraction: %s", e)
         raise
 
-def extract_text_ocr(pdf_path: str) -> str:
-    """Extract text from a PDF using OCR (PyMuPDF -> Image -> Tesseract)."""
-    text = ""
+def extract_text_ocr(source: DocumentSource) -> str:
+    """Extract text from a PDF using OCR (PyMuPDF -> grayscale samples -> Tesseract), pages in parallel."""
+    from service.ocr import ocr_pages
+
     try:
-        doc = fitz.open(pdf_path)
-        for page_num, page in enumerate(doc):
-            pix = page.get_pixmap(dpi=settings.OCR_DPI)
-            img = Image.open(io.BytesIO(pix.tobytes("png")))
-            page_text = pytesseract.image_to_string(img)
-            text += page_text + "\n"
-            logger.debug(f"OCR processed page {page_num + 1}")
-        logger.debug(f"Extracted {len(text)} characters using OCR.")
+        with _open_pdf(source) as doc:
+            text = "\n".join(ocr_pages(doc))
+        logger.debug("Extracted %s characters using OCR.", len(text))
         return text.strip()
     except Exception as e:
-        logger.error(f"Error in OCR text extraction: {str(e)}")
+        logger.error("Error in OCR text extraction: %s", e)
         raise
 
-def extract_text_docx(file_path: str) -> str:
-    """Extract text from a .docx file."""
+def _has_graphics(page: "fitz.Page") -> bool:
+    """True when a page carries something OCR could read: sizeable images or vector drawings."""
+    page_area = abs(page.rect) or 1.0
+    covered = sum(abs(page.rect & info["bbox"]) for info in page.get_image_info())
+    return covered / page_area >= MIN_OCR_IMAGE_COVERAGE or bool(page.get_drawings())
+
+def _read_pages(
+    doc: "fitz.Document",
+    page_numbers: range,
+    timer,
+    budget=NULL_BUDGET,
+    allow_ocr: bool = True,
+    known_pages: Optional[KnownPages] = None,
+) -> Tuple[List[str], List[str]]:
+    """
+    Text and method for each page in `page_numbers`. Pages without fonts skip
+    text extraction; pages with too little text are OCR'd ("ocr") when they
+    carry images or drawings and are otherwise reported as "blank". Pages in
+    `known_pages` are taken from there. Without `allow_ocr`, a page that
+    needs OCR raises OcrRequiredError instead, carrying the other pages.
+    """
+    threshold = settings.PAGE_OCR_THRESHOLD
+    page_texts: List[str] = []
+    page_methods: List[str] = []
+    ocr_indexes: List[int] = []
+
+    with timer.span("pdf_text"):
+        for index, page_no in enumerate(page_numbers):
+            if known_pages and page_no in known_pages:
+                page_text, method = known_pages[page_no]
+                page_texts.append(page_text)
+                page_methods.append(method)
+                continue
+            page = doc[page_no]
+            # Listing fonts is ~10x cheaper than extracting text: no fonts, no text layer
+            page_text = page.get_text() if page.get_fonts() else ""
+            page_texts.append(page_text)
+            if len(page_text.strip()) >= threshold:
+                page_methods.append("text")
+            elif _has_graphics(page):
+                ocr_indexes.append(index)
+                page_methods.append("ocr")
+            else:
+                page_methods.append("blank")
+
+    if ocr_indexes:
+        if not allow_ocr:
+            raise OcrRequiredError(
+                f"Page {page_numbers[ocr_indexes[0]] + 1} has no usable text layer.",
+                {page_no: page for page_no, page in zip(page_numbers, zip(page_texts, page_methods)) if page[1] != "ocr"},
+            )
+        from service.ocr import ocr_pages
+
+        logger.info("OCR required for %s of %s pages (text layer < %s chars).", len(ocr_indexes), len(page_numbers), threshold)
+        ocr_numbers = [page_numbers[i] for i in ocr_indexes]
+        for index, page_text in zip(ocr_indexes, ocr_pages(doc, ocr_numbers, timer=timer, budget=budget)):
+            page_texts[index] = page_text + "\n"
+    return page_texts, page_methods
+
+def iter_pdf_pages(
+    doc: "fitz.Document",
+    timer=NULL_TIMER,
+    max_pages: int = 0,
+    step: Optional[int] = None,
+    budget=NULL_BUDGET,
+    allow_ocr: bool = True,
+    known_pages: Optional[KnownPages] = None,
+) -> Iterator[Tuple[int, str, str]]:
+    """
+    Yield (page_no, text, method) for the pages of an open PDF, in order.
+
+    Pages are read `step` at a time (4 x OCR_WORKERS by default): pages of a
+    step whose text layer is shorter than PAGE_OCR_THRESHOLD are OCR'd in
+    parallel and reported as "ocr", the rest as "text". Only one step of page
+    texts is held at a time. Pages beyond `max_pages` (when > 0) are not read,
+    and closing the generator early stops reading after the current step.
+    No further step is started once the memory `budget` is exceeded.
+    Pages in `known_pages` (from OcrRequiredError) are not read again.
+    Without `allow_ocr`, the first page that needs OCR raises OcrRequiredError
+    carrying every page read until then.
+    """
+    limit = min(doc.page_count, max_pages) if max_pages > 0 else doc.page_count
+    step = max(1, step or 4 * settings.OCR_WORKERS)
+    # Without OCR the pages read so far are kept, for the OcrRequiredError
+    read: KnownPages = {}
+    for start in range(0, limit, step):
+        if budget.check() == "exceeded":
+            return
+        page_numbers = range(start, min(start + step, limit))
+        try:
+            texts, methods = _read_pages(doc, page_numbers, timer, budget, allow_ocr, known_pages)
+        except OcrRequiredError as e:
+            e.pages = {**read, **e.pages}
+            raise
+        if not allow_ocr:
+            read.update(zip(page_numbers, zip(texts, methods)))
+        yield from zip(page_numbers, texts, methods)
+
+def extract_text_hybrid(doc: "fitz.Document", timer=NULL_TIMER) -> Tuple[str, List[str]]:
+    """
+    Extract text page by page from an open PDF.
+    Pages whose text layer is shorter than PAGE_OCR_THRESHOLD are OCR'd; the
+    rest keep their text layer. Returns the text and the method used per page.
+    """
+    pages = list(iter_pdf_pages(doc, timer))
+    text = "".join(page_text for _, page_text, _ in pages).strip()
+    logger.debug("Extracted %s characters using hybrid extraction.", len(text))
+    return text, [method for _, _, method in pages]
+
+def extract_pdf(
+    doc: "fitz.Document",
+    timer=NULL_TIMER,
+    hard_stop_expected: Optional[Dict[str, Optional[str]]] = None,
+    include_text: bool = False,
+    budget=NULL_BUDGET,
+    allow_ocr: bool = True,
+    known_pages: Optional[KnownPages] = None,
+) -> Dict[str, Any]:
+    """
+    Read an open PDF page by page, feeding each page to the field extractor
+    as it arrives instead of building the whole text first.
+
+    Reading stops early when the EARLY_EXIT_MODE rule is met, after MAX_PAGES
+    pages, when the memory `budget` is exceeded or, with `hard_stop_expected`
+    (field -> expected value), at the first certain mismatch on one of those
+    fields. Incremental modes read OCR_WORKERS pages per step so OCR stays
+    parallel. Pages never read are reported as "skipped" and "stop_reason"
+    says why. The joined text is only kept when `include_text` is set.
+    Without `allow_ocr`, a page that needs OCR raises OcrRequiredError;
+    passing its pages back as `known_pages` spares reading them again.
+    """
+    mode = settings.EARLY_EXIT_MODE
+    caps = [cap for cap in (settings.EARLY_EXIT_MAX_PAGES if mode != "off" else 0, settings.MAX_PAGES) if cap > 0]
+    max_pages = min(caps) if caps else 0
+    incremental = mode == "all_found" or bool(hard_stop_expected) or budget.enabled
+    accumulator = field_extractor.accumulator()
+    pending_checks = dict(hard_stop_expected or {})
+    texts: Optional[List[str]] = [] if include_text else None
+    page_methods: List[str] = []
+    hard_stop_field: Optional[str] = None
+    field_seconds = 0.0
+
+    step = max(1, settings.OCR_WORKERS) if incremental else None
+    pages = iter_pdf_pages(doc, timer, max_pages, step, budget, allow_ocr, known_pages)
+    try:
+        for _, page_text, method in pages:
+            page_methods.append(method)
+            if texts is not None:
+                texts.append(page_text)
+            start = time.perf_counter()
+            accumulator.feed(page_text)
+            field_seconds += time.perf_counter() - start
+
+            # The first occurrence decides a field's value, and reading stops right here,
+            # so the mismatch is certain for the response being built
+            for field in [f for f in pending_checks if accumulator.current(f) is not None]:
+                actual = field_extractor.finalize(field, accumulator.current(field))
+                if compare_field(pending_checks.pop(field), actual)["result"] != "MATCH":
+                    hard_stop_field = field
+            if hard_stop_field or (mode == "all_found" and not accumulator.missing):
+                break
+    finally:
+        pages.close()
+
+    start = time.perf_counter()
+    fields = accumulator.finish()
+    timer.add("extract_fields", field_seconds + time.perf_counter() - start)
+
+    skipped = doc.page_count - len(page_methods)
+    stop_reason: Optional[str] = None
+    if skipped:
+        if hard_stop_field:
+            stop_reason, reason = "hard_stop", f"hard-stop mismatch on {hard_stop_field}"
+        elif budget.exceeded:
+            stop_reason, reason = "memory_budget", f"memory budget of {settings.MEMORY_BUDGET_MB} MB exceeded"
+        elif settings.MAX_PAGES and len(page_methods) == settings.MAX_PAGES:
+            stop_reason, reason = "page_cap", f"MAX_PAGES={settings.MAX_PAGES}"
+        else:
+            stop_reason, reason = "early_exit", f"early exit ({mode})"
+        logger.info("Stopped after %s of %s pages: %s.", len(page_methods), doc.page_count, reason)
+        page_methods.extend(["skipped"] * skipped)
+
+    return {
+        "fields": fields,
+        "page_methods": page_methods,
+        "text": "".join(texts).strip() if texts is not None else None,
+        "hard_stop_field": hard_stop_field,
+        "stop_reason": stop_reason,
+    }
+
+def extract_text_docx(source: DocumentSource) -> str:
+    """Extract text from a .docx file or in-memory .docx bytes."""
+    import docx  # python-docx
+
     try:
-        doc = docx.Document(file_path)
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        doc = docx.Document(source)
         full_text = []
         for para in doc.paragraphs:
             full_text.append(para.text)
         return "\n".join(full_text).strip()
     except Exception as e:
-        logger.error(f"Error in DOCX text extraction: {str(e)}")
+        logger.error("Error in DOCX text extraction: %s", e)
         raise
 
-def extract_text_plain(file_path: str) -> str:
-    """Extract text from plain text files (.csv, .txt)."""
+def extract_text_plain(source: DocumentSource) -> str:
+    """Extract text from plain text files (.csv, .txt) or in-memory text bytes, in their detected encoding."""
     try:
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            return f.read().strip()
+        if not isinstance(source, (bytes, bytearray, memoryview)):
+            with open(source, 'rb') as f:
+                source = f.read()
+        data = bytes(source)
+        return data.decode(text_encoding(data) or "utf-8", errors="ignore").strip()
     except Exception as e:
-        logger.error(f"Error in plain text extraction: {str(e)}")
+        logger.error("Error in plain text extraction: %s", e)
+        raise
+
+def extract_text_image(source: DocumentSource, timer=NULL_TIMER, budget=NULL_BUDGET) -> Tuple[List[str], int]:
+    """
+    OCR a raster image file (PNG, JPEG, TIFF, ...) directly: one text per
+    frame, for at most MAX_PAGES frames. Returns the texts and the frame count.
+    """
+    from PIL import Image
+
+    from service.ocr import ocr_image_frames
+
+    try:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        with Image.open(source) as img:
+            return ocr_image_frames(img, timer, settings.MAX_PAGES, budget), getattr(img, "n_frames", 1)
+    except Exception as e:
+        logger.error("Error in image OCR: %s", e)
         raise
 
 def is_scanned_pdf(text: str) -> bool:
@@ -70,89 +324,136 @@ def is_scanned_pdf(text: str) -> bool:
     threshold = settings.SCANNED_PDF_THRESHOLD
     is_scanned = len(text.strip()) < threshold
     if is_scanned:
-        logger.info(f"PDF detected as scanned (text length < {threshold}).")
+        logger.info("PDF detected as scanned (text length < %s).", threshold)
     return is_scanned
 
-def extract_fields(text: str) -> Dict[str, Optional[str]]:
-    """Extract fields from text using Regex patterns from settings."""
-    text = re.sub(r"\s+", " ", text)
-    
-    patterns = settings.EXTRACTION_PATTERNS
-
-    extracted = {}
-    for key, pattern in patterns.items():
-        if key == "TDS":
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            total_tds = 0.0
-            if matches:
-                for val in matches:
-                    try:
-                        # Clean value (remove commas, currency symbols)
-                        clean_val = val.replace(",", "").replace("₹", "").replace("■", "").strip()
-                        total_tds += float(clean_val)
-                    except ValueError:
-                        continue
-                value = f"{total_tds:g}" # Format as needed, :g removes trailing zeros
-            else:
-                value = None
-        else:
-            match = re.search(pattern, text, re.IGNORECASE)
-            value = match.group(1).strip() if match else None
-            
-            # Post-process CP_Name to stop at first comma
-            if key == "CP_Name" and value and "," in value:
-                value = value.split(",")[0].strip()
-        
-        extracted[key] = value
-        logger.debug(f"Extracted {key}: {value}")
-
-    return extracted
+def extract_fields(text: Union[str, Iterable[str]]) -> Dict[str, Optional[str]]:
+    """
+    Extract fields using the precompiled patterns from settings, from a text
+    or incrementally from an iterable of page texts (same result as their join).
+    """
+    if isinstance(text, str):
+        return field_extractor.extract(text)
+    return field_extractor.extract_pages(text)
 
-def process_invoice_from_path(file_path: str) -> Dict[str, Any]:
+def process_invoice_from_bytes(
+    data: bytes,
+    file_name: str,
+    hard_stop_expected: Optional[Dict[str, Optional[str]]] = None,
+    include_text: bool = False,
+    allow_ocr: bool = True,
+    known_pages: Optional[KnownPages] = None,
+) -> Dict[str, Any]:
     """
-    Main function to process an invoice file.
-    Routes to appropriate extractor based on file extension.
+    Process an in-memory invoice document.
+    Routes to appropriate extractor based on the extension of `file_name`,
+    or on the content (see service.classifier) when the extension is unknown.
+    Stage timings are returned under "timings" when metrics are enabled.
+
+    With `hard_stop_expected` (field -> expected value), PDF pages stop being
+    read at the first certain mismatch on one of those fields; the result is
+    then marked "truncated" and names the field in "hard_stop_field".
+    Pages are also skipped past MAX_PAGES or the MEMORY_BUDGET_MB budget;
+    "stop_reason" says why reading stopped. "full_text" is only filled in
+    when `include_text` is set. Without `allow_ocr` (the fast lane), images
+    and PDFs with a page that needs OCR raise OcrRequiredError; its `pages`
+    can be passed back as `known_pages` so they are not read twice.
     """
-    logger.info(f"Processing invoice from path: {file_path}")
+    logger.info("Processing invoice %s (%s bytes) from memory", file_name, len(data))
     
-    ext = os.path.splitext(file_path)[1].lower()
-    text = ""
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext not in KNOWN_EXTENSIONS:
+        ext = detect_extension(data)
+    text: Optional[str] = None
     extraction_method = ""
+    page_methods: Optional[List[str]] = None
+    hard_stop_field: Optional[str] = None
+    stop_reason: Optional[str] = None
+    extracted_data: Optional[Dict[str, Optional[str]]] = None
+    timer = stage_timer()
+    budget = request_budget()
+    # CPU-seconds of this extraction (OCR threads included), charged to the caller's quota
+    meter = CpuMeter().start()
 
     try:
         if ext == ".pdf":
             try:
-                text = extract_text_normal(file_path)
-                extraction_method = "PyMuPDF"
-                if is_scanned_pdf(text):
-                    logger.info("Switching to OCR extraction...")
-                    text = extract_text_ocr(file_path)
-                    extraction_method = "PyMuPDF + OCR"
+                with _open_pdf(data) as doc:
+                    pdf = extract_pdf(doc, timer, hard_stop_expected, include_text, budget, allow_ocr, known_pages)
+                extracted_data, text = pdf["fields"], pdf["text"]
+                page_methods, hard_stop_field, stop_reason = pdf["page_methods"], pdf["hard_stop_field"], pdf["stop_reason"]
+                extraction_method = "PyMuPDF + OCR" if "ocr" in page_methods else "PyMuPDF"
+            except OcrRequiredError:
+                raise
             except Exception as pdf_error:
-                logger.warning(f"PDF processing failed for {file_path}. Falling back to plain text reader. Error: {str(pdf_error)}")
-                text = extract_text_plain(file_path)
+                logger.warning("PDF processing failed for %s. Falling back to plain text reader. Error: %s", file_name, pdf_error)
+                page_methods, hard_stop_field, stop_reason = None, None, None
+                with timer.span("plain_text"):
+                    text = extract_text_plain(data)
                 extraction_method = "Fallback Text Reader (Corrupt PDF)"
+        elif ext in IMAGE_EXTENSIONS:
+            if not allow_ocr:
+                raise OcrRequiredError(f"{ext} images are OCR'd.")
+            # Photos and scans go straight to OCR, no PDF render step
+            page_texts, frames = extract_text_image(data, timer, budget)
+            page_methods = ["ocr"] * len(page_texts) + ["skipped"] * (frames - len(page_texts))
+            stop_reason = "page_cap" if frames > len(page_texts) else None
+            with timer.span("extract_fields"):
+                extracted_data = extract_fields(page_text + "\n" for page_text in page_texts)
+            text = "".join(page_text + "\n" for page_text in page_texts).strip()
+            extraction_method = "OCR (image)"
         elif ext in [".docx", ".doc"]:
-            text = extract_text_docx(file_path)
+            with timer.span("docx_text"):
+                text = extract_text_docx(data)
             extraction_method = "python-docx"
         elif ext in [".csv", ".txt"]:
-            text = extract_text_plain(file_path)
+            with timer.span("plain_text"):
+                text = extract_text_plain(data)
             extraction_method = "Plain Text Reader"
         else:
             # Try plain text as fallback for unknown extensions
-            logger.warning(f"Unknown extension {ext}. Attempting plain text extraction.")
-            text = extract_text_plain(file_path)
+            logger.warning("Unknown extension %s. Attempting plain text extraction.", ext)
+            with timer.span("plain_text"):
+                text = extract_text_plain(data)
             extraction_method = "Fallback Text Reader"
 
-        extracted_data = extract_fields(text)
+        if page_methods is None:
+            with timer.span("extract_fields"):
+                extracted_data = extract_fields(text)
 
         result = {
-            "file_name": os.path.basename(file_path),
+            "file_name": file_name,
             "extraction_method": extraction_method,
+            "page_methods": page_methods,
             "extracted_fields": extracted_data,
-            "full_text": text
+            "full_text": text if include_text else None,
+            "truncated": bool(page_methods) and "skipped" in page_methods,
+            "hard_stop_field": hard_stop_field,
+            "stop_reason": stop_reason,
+            "timings": list(timer.spans),
+            "cpu_seconds": meter.seconds(),
         }
+        if budget.enabled:
+            logger.info("Peak RSS growth for %s: %.0f MB of %s MB budget", file_name, budget.peak / 2 ** 20, settings.MEMORY_BUDGET_MB)
         return result
+    except OcrRequiredError as e:
+        logger.info("%s needs OCR: %s", file_name, e)
+        e.cpu_seconds = meter.seconds()
+        raise
     except Exception as e:
-        logger.error(f"Failed to process invoice {file_path}: {str(e)}")
+        logger.error("Failed to process invoice %s: %s", file_name, e)
         raise
+    finally:
+        meter.stop()
+
+def process_invoice_from_path(
+    file_path: str, include_text: bool = False, hard_stop_expected: Optional[Dict[str, Optional[str]]] = None
+) -> Dict[str, Any]:
+    """
+    Main function to process an invoice file.
+    Reads the file and delegates to process_invoice_from_bytes.
+    """
+    logger.info("Processing invoice from path: %s", file_path)
+    with open(file_path, "rb") as f:
+        data = f.read()
+    return process_invoice_from_bytes(data, os.path.basename(file_path), hard_stop_expected, include_text=include_text)
@@ -1,38 +1,152 @@
+import asyncio
 import base64
-import json
+import logging
 import os
 import shutil
 import uuid
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from core.config import settings
 from core.logger import setup_logger
-from schemas.invoice import ComparisonValue, InvoiceExtractionRequest, InvoiceExtractionResponse
-from service.invoice_extractor import process_invoice_from_path
-from service.scoring import calculate_score
+from core.metrics import NULL_TIMER, record_stages, stage_timer
+from schemas.invoice import (
+    ComparisonValue,
+    InvoiceBatchResult,
+    InvoiceExpectedValues,
+    InvoiceExtractionRequest,
+    InvoiceExtractionResponse,
+)
+from service.cache import ExtractionCache, document_hash, get_extraction_cache
+from service.comparison import compare_field, normalize_value  # noqa: F401 (re-exported)
+from service.executor import QueueFullError, WorkerCrashedError, get_extraction_executor
+from service.classifier import IMAGE_EXTENSIONS, UnsupportedDocumentError, detect_extension
+from service.invoice_extractor import OcrRequiredError, process_invoice_from_bytes
+from service.quota import ANONYMOUS, Caller, get_caller_quotas
+from service.results_store import get_results_store
+from service.upload import PayloadTooLargeError
+from service.scoring import HARD_STOP_FIELDS, calculate_score
 
 logger = setup_logger(__name__)
 
-def normalize_value(val: Any) -> Any:
-    """Normalize string or float values for comparison."""
-    if val is None:
-        return ""
-    val = str(val).strip()
+class ExtractionError(RuntimeError):
+    """Raised when a document cannot be extracted (e.g. it is corrupt); retrying it fails the same way."""
+
+def _pages_read(result: Dict[str, Any]) -> int:
+    """Pages (or frames) actually read for an extraction result; 1 for formats without pages."""
+    methods = result.get("page_methods") or ()
+    return max(1, sum(method != "skipped" for method in methods))
+
+def _cpu_seconds(result: Dict[str, Any]) -> float:
+    return result.get("cpu_seconds", 0.0)
+
+def _cache_lookup(cache: Optional[ExtractionCache], decoded_data: bytes) -> Tuple[str, Optional[str], Optional[Dict[str, Any]]]:
+    """The document's hash, its cache key and its cached extraction result, if any. Blocking."""
+    digest = document_hash(decoded_data)
+    if cache is None:
+        return digest, None, None
+    cache_key = cache.key_for(decoded_data, digest)
+    return digest, cache_key, cache.get(cache_key)
+
+async def extract_in_lanes(
+    decoded_data: bytes, file_name: str, hard_stop_expected, include_text: bool, caller: Optional[Caller] = None
+) -> Dict[str, Any]:
+    """
+    Run process_invoice_from_bytes in the extraction lanes. Images go
+    straight to the OCR lane; everything else is tried in the fast lane with
+    OCR disallowed and moves to the OCR lane when a page turns out to need it,
+    along with the pages the fast lane has read, which are not read again;
+    the result's cpu_seconds then covers both lanes. Within a lane, waiting documents are ordered fairly between callers.
+    Raises QueueFullError when the lane it needs is full.
+    """
+    caller = caller or Caller(ANONYMOUS)
+    extension = os.path.splitext(file_name)[1]
+    # Latency is judged per file type, so a mix of quick and slow formats does not look like overload
+    kind = extension.lstrip(".")
+    known_pages = None
+    fast_cpu_seconds = 0.0
+    if extension not in IMAGE_EXTENSIONS:
+        try:
+            return await get_extraction_executor("fast").run(
+                process_invoice_from_bytes, decoded_data, file_name, hard_stop_expected, include_text, False,
+                units=_pages_read, caller=caller.name, weight=caller.weight, cost=_cpu_seconds, kind=kind,
+            )
+        except OcrRequiredError as e:
+            known_pages, fast_cpu_seconds = e.pages, e.cpu_seconds
+            logger.info("%s needs OCR; moving it to the OCR lane with %s pages already read", file_name, len(known_pages))
+    result = await get_extraction_executor("ocr").run(
+        process_invoice_from_bytes, decoded_data, file_name, hard_stop_expected, include_text, True, known_pages,
+        units=_pages_read, caller=caller.name, weight=caller.weight, cost=_cpu_seconds, kind=kind,
+    )
+    result["cpu_seconds"] = _cpu_seconds(result) + fast_cpu_seconds
+    return result
+
+def build_response(extracted_data: Dict[str, Any], expected: InvoiceExpectedValues, timer=NULL_TIMER) -> InvoiceExtractionResponse:
+    """
+    Compare an extraction result (process_invoice_from_bytes) with the
+    expected values and score it. Shared by the API and the bulk CLI.
+    """
+    # Perform Comparison
+    extracted_fields = extracted_data.get("extracted_fields", {})
+    
+    with timer.span("compare"):
+        comparisons_raw = {
+            "CP_Name": compare_field(expected.CP_Name, extracted_fields.get("CP_Name")),
+            "PAN": compare_field(expected.PAN, extracted_fields.get("PAN")),
+            "GSTIN": compare_field(expected.GSTIN, extracted_fields.get("GSTIN")),
+            "Agreement_Amount": compare_field(expected.Agreement_Amount, extracted_fields.get("Agreement_Amount")),
+            "Brokerage_Amount": compare_field(expected.Brokerage_Amount, extracted_fields.get("Brokerage_Amount")),
+            "CGST": compare_field(expected.CGST, extracted_fields.get("CGST")),
+            "SGST": compare_field(expected.SGST, extracted_fields.get("SGST")),
+            "Total_Invoice_Amount": compare_field(expected.Total_Invoice_Amount, extracted_fields.get("Total_Invoice_Amount")),
+            "TDS": compare_field(expected.TDS, extracted_fields.get("TDS")),
+        }
+    
+    comparisons = {k: ComparisonValue(**v) for k, v in comparisons_raw.items()}
+
+    # Calculate Score
+    with timer.span("score"):
+        score_result = calculate_score(comparisons_raw)
+
+    remarks = score_result.get("remarks")
+    if extracted_data.get("hard_stop_field") and extracted_data.get("truncated"):
+        remarks += " Remaining pages were not processed after the hard-stop mismatch."
+    elif extracted_data.get("stop_reason") == "page_cap":
+        remarks += f" Only the first {settings.MAX_PAGES} pages were processed (page limit)."
+    elif extracted_data.get("stop_reason") == "memory_budget":
+        remarks += " Remaining pages were not processed: the memory budget was exhausted."
+
+    result_data = {
+        "comparisons": comparisons,
+        "score": score_result.get("score"),
+        "remarks": remarks,
+        "recommendedAction": score_result.get("recommendedAction"),
+        "extractionMethod": extracted_data.get("extraction_method"),
+        "pageMethods": extracted_data.get("page_methods"),
+        "extractionTruncated": bool(extracted_data.get("truncated")),
+    }
+    
+    return InvoiceExtractionResponse(**result_data)
+
+def decode_base64_blob(blob_64: str) -> bytes:
+    """Decode a (possibly data-URL prefixed, unpadded) Base64 document."""
     try:
-        # Try to convert to float for numeric comparison
-        # Remove commas and currency symbols if present
-        cleaned = val.replace(",", "").replace("₹", "").replace("■", "").strip()
-        float_val = float(cleaned)
-        return float_val
-    except ValueError:
-        return val.lower()
-
-def compare_field(expected: Optional[str], actual: Optional[str]) -> Dict[str, Any]:
-    """Compare two values and return result object."""
-    if normalize_value(expected) == normalize_value(actual):
-        return {"expected": expected, "actual": actual, "result": "MATCH"}
-    else:
-        return {"expected": expected, "actual": actual, "result": "DISCREPANCY"}
+        # 1. Strip Data URL prefix if present
+        if "," in blob_64:
+            blob_64 = blob_64.split(",")[-1]
+        
+        # 2. Clean whitespace/newlines
+        blob_64 = blob_64.strip()
+
+        # 3. Fix missing padding
+        missing_padding = len(blob_64) % 4
+        if missing_padding:
+            blob_64 += "=" * (4 - missing_padding)
+
+        # 4. Decode
+        return base64.b64decode(blob_64)
+    except Exception as e:
+        logger.error("Base64 decoding failed: %s", e)
+        raise ValueError(f"Invalid Base64 string or format: {str(e)}")
 
 class InvoiceService:
     def __init__(self):
@@ -40,120 +154,160 @@ class InvoiceService:
         os.makedirs(settings.INPUT_DIR, exist_ok=True)
         os.makedirs(settings.OUTPUT_DIR, exist_ok=True)
 
-    async def process_invoice(self, request: InvoiceExtractionRequest) -> InvoiceExtractionResponse:
+    async def process_invoice(self, request: InvoiceExtractionRequest, caller: Optional[Caller] = None) -> InvoiceExtractionResponse:
         logger.info("Starting invoice processing in InvoiceService.")
-        
-        file_path = ""
-        original_filename = ""
-        
-        try:
-            # Handle Base64 String
-            blob_64 = request.blob_64
-            try:
-                # 1. Strip Data URL prefix if present
-                if "," in blob_64:
-                    blob_64 = blob_64.split(",")[-1]
-                
-                # 2. Clean whitespace/newlines
-                blob_64 = blob_64.strip()
-
-                # 3. Fix missing padding
-                missing_padding = len(blob_64) % 4
-                if missing_padding:
-                    blob_64 += "=" * (4 - missing_padding)
-
-                # 4. Decode
-                decoded_data = base64.b64decode(blob_64)
-                
-                # 5. Sniff extension based on signature
-                extension = ".txt" # Default
-                if decoded_data.startswith(b"%PDF"):
-                    extension = ".pdf"
-                elif decoded_data.startswith(b"PK\x03\x04"):
-                    extension = ".docx"
-                elif b"," in decoded_data[:200]: # Heuristic for CSV
-                    extension = ".csv"
-                
-                # Generate a unique filename with detected extension
-                original_filename = f"blob_{uuid.uuid4().hex}{extension}"
-                file_path = os.path.join(settings.INPUT_DIR, original_filename)
-                
-                with open(file_path, "wb") as buffer:
-                    buffer.write(decoded_data)
-                logger.info(f"Base64 blob decoded and saved as {extension} at {file_path}")
-                
-            except Exception as e:
-                logger.error(f"Base64 decoding failed: {str(e)}")
-                raise ValueError(f"Invalid Base64 string or format: {str(e)}")
+        timer = stage_timer()
+        with timer.span("decode_base64"):
+            decoded_data = decode_base64_blob(request.blob_64)
+        if len(decoded_data) > settings.MAX_UPLOAD_BYTES:
+            raise PayloadTooLargeError(f"Document of {len(decoded_data)} bytes exceeds the limit of {settings.MAX_UPLOAD_BYTES} bytes.")
+        return await self.process_document(decoded_data, request, timer, caller)
 
-            # Process the file
-            try:
-                extracted_data = process_invoice_from_path(file_path)
-            except Exception as e:
-                logger.error(f"Failed to process invoice: {str(e)}")
-                raise RuntimeError(f"Failed to process invoice: {str(e)}")
-
-            # Perform Comparison
-            extracted_fields = extracted_data.get("extracted_fields", {})
-            
-            comparisons_raw = {
-                "CP_Name": compare_field(request.CP_Name, extracted_fields.get("CP_Name")),
-                "PAN": compare_field(request.PAN, extracted_fields.get("PAN")),
-                "GSTIN": compare_field(request.GSTIN, extracted_fields.get("GSTIN")),
-                "Agreement_Amount": compare_field(request.Agreement_Amount, extracted_fields.get("Agreement_Amount")),
-                "Brokerage_Amount": compare_field(request.Brokerage_Amount, extracted_fields.get("Brokerage_Amount")),
-                "CGST": compare_field(request.CGST, extracted_fields.get("CGST")),
-                "SGST": compare_field(request.SGST, extracted_fields.get("SGST")),
-                "Total_Invoice_Amount": compare_field(request.Total_Invoice_Amount, extracted_fields.get("Total_Invoice_Amount")),
-                "TDS": compare_field(request.TDS, extracted_fields.get("TDS")),
-            }
-            
-            comparisons = {k: ComparisonValue(**v) for k, v in comparisons_raw.items()}
-
-            # Calculate Score
-            score_result = calculate_score(comparisons_raw)
-            
-            result_data = {
-                "comparisons": comparisons,
-                "score": score_result.get("score"),
-                "remarks": score_result.get("remarks"),
-                "recommendedAction": score_result.get("recommendedAction")
-            }
-            
-            # Save result to output_json/ (Optional, but kept for parity with old code)
-            base_filename = os.path.splitext(original_filename)[0]
-            output_filename = f"{base_filename}.json"
-            output_path = os.path.join(settings.OUTPUT_DIR, output_filename)
-            
+    async def process_document(
+        self, decoded_data: bytes, expected: InvoiceExpectedValues, timer=None, caller: Optional[Caller] = None
+    ) -> InvoiceExtractionResponse:
+        """
+        Extract a decoded document and compare it against the expected values.
+        Stage timings collected on `timer` (and by the extractor) feed the /metrics histograms.
+
+        Extractions count against `caller`'s CPU quota (cache hits are free):
+        RateLimitedError is raised before extracting when it is used up.
+        """
+        timer = stage_timer() if timer is None else timer
+        caller = caller or Caller(ANONYMOUS)
+        with timer.span("sniff_type"):
+            extension = detect_extension(decoded_data)
+        original_filename = f"blob_{uuid.uuid4().hex}{extension}"
+        logger.info("Document sniffed as %s (%s bytes)", extension, len(decoded_data))
+
+        # Resubmitted documents are served from the extraction cache
+        cache = get_extraction_cache()
+        results_store = get_results_store()
+        digest = cache_key = extracted_data = None
+        if cache or results_store:
+            with timer.span("cache_lookup"):
+                # Hashing (up to MAX_UPLOAD_BYTES) and the SQLite lookup run off the event loop
+                digest, cache_key, extracted_data = await asyncio.to_thread(_cache_lookup, cache, decoded_data)
+        cache_hit = extracted_data is not None
+
+        if extracted_data is not None:
+            logger.info("Extraction cache hit for %s", cache_key)
+        else:
+            quotas = get_caller_quotas()
+            quotas.admit(caller)
+            # Fast reject: the worker stops reading pages at the first hard-stop mismatch
+            hard_stop_expected = (
+                {field: getattr(expected, field) for field in HARD_STOP_FIELDS} if settings.FAST_REJECT_ENABLED else None
+            )
+            # Process the document in memory, off the event loop, in the fast or the OCR lane
             try:
-                with open(output_path, "w", encoding="utf-8") as f:
-                    # Need to serialize slightly differently for ComparisonValue objects
-                    json_data = {
-                        "comparisons": {k: v.model_dump() for k, v in comparisons.items()},
-                        "score": result_data["score"],
-                        "remarks": result_data["remarks"],
-                        "recommendedAction": result_data["recommendedAction"]
-                    }
-                    json.dump(json_data, f, indent=2, ensure_ascii=False)
+                # Wall time including queueing; the worker reports its own stages
+                with timer.span("extraction"):
+                    extracted_data = await extract_in_lanes(
+                        decoded_data,
+                        original_filename,
+                        hard_stop_expected,
+                        bool(cache) and settings.CACHE_STORE_TEXT,
+                        caller,
+                    )
+            except QueueFullError:
+                # Shed before it ran: the caller is not charged for it
+                quotas.refund(caller)
+                raise
+            except (WorkerCrashedError, TimeoutError, UnsupportedDocumentError):
+                # Transient, or already a permanent error of its own
+                raise
             except Exception as e:
-                logger.warning(f"Failed to save result JSON: {str(e)}")
+                logger.error("Failed to process invoice: %s", e)
+                raise ExtractionError(f"Failed to process invoice: {str(e)}") from e
+            quotas.charge(caller, extracted_data.get("cpu_seconds", 0.0))
 
-            # Cleanup
+            # A result cut short by a mismatch depends on the expected values, and one cut short
+            # by the memory budget on the worker's state at the time, so neither is cached
+            rejected_early = extracted_data.get("truncated") and extracted_data.get("hard_stop_field")
+            if cache and not rejected_early and extracted_data.get("stop_reason") != "memory_budget":
+                try:
+                    await asyncio.to_thread(cache.put, cache_key, extracted_data)
+                except Exception as e:
+                    logger.warning("Failed to cache extraction result: %s", e)
+
+        response = build_response(extracted_data, expected, timer)
+
+        if results_store:
+            # Queued for the background writer; serialised here, while the response cannot change
+            results_store.record(
+                document_hash=digest,
+                document_type=extension.lstrip("."),
+                size_bytes=len(decoded_data),
+                caller=caller.name,
+                correlation_id=expected.correlation_id,
+                score=response.score,
+                recommended_action=response.recommendedAction,
+                extraction_method=response.extractionMethod,
+                cache_hit=cache_hit,
+                # Only the expected values: `expected` may be the whole request, document included
+                expected=expected.model_dump_json(include=set(InvoiceExpectedValues.model_fields)),
+                response=response.model_dump_json(),
+            )
+
+        record_stages(
+            [*timer.spans, *extracted_data.get("timings", ())],
+            extracted_data.get("extraction_method"),
+            extension.lstrip("."),
+        )
+        if logger.isEnabledFor(logging.INFO):
+            # One structured record per document (LOG_FORMAT=json), with its stage timings in ms
+            stages: Dict[str, float] = {}
+            for stage, seconds in [*timer.spans, *extracted_data.get("timings", ())]:
+                stages[stage] = stages.get(stage, 0.0) + seconds * 1000
+            logger.info(
+                "Processed %s document: score %s, %s.", extension.lstrip("."), response.score, response.recommendedAction,
+                extra={
+                    "caller": caller.name,
+                    "cache_hit": cache_hit,
+                    "extraction_method": response.extractionMethod,
+                    "stages_ms": {stage: round(ms, 2) for stage, ms in stages.items()},
+                },
+            )
+        return response
+
+    async def _process_with_retry(self, request: InvoiceExtractionRequest, caller: Optional[Caller]) -> InvoiceExtractionResponse:
+        """Process one invoice, waiting and retrying while the extraction queue is full."""
+        attempt = 0
+        while True:
             try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                if os.path.exists(output_path):
-                    os.remove(output_path)
-            except Exception as e:
-                logger.warning(f"Failed to cleanup files: {str(e)}")
+                return await self.process_invoice(request, caller)
+            except QueueFullError:
+                attempt += 1
+                if attempt >= settings.BATCH_QUEUE_FULL_RETRIES:
+                    raise
+                await asyncio.sleep(0.2 * 2 ** attempt)
 
-            return InvoiceExtractionResponse(**result_data)
+    async def process_batch(
+        self, requests: List[InvoiceExtractionRequest], caller: Optional[Caller] = None
+    ) -> AsyncIterator[InvoiceBatchResult]:
+        """
+        Process invoices concurrently (up to BATCH_CONCURRENCY) and yield each
+        result as soon as it finishes. A failed item yields an ERROR result
+        instead of failing the batch.
+        """
+        logger.info("Starting batch of %s invoices.", len(requests))
+        semaphore = asyncio.Semaphore(max(1, settings.BATCH_CONCURRENCY))
 
-        except Exception as e:
-            # Ensure cleanup on failure if file_path was set
-            if file_path and os.path.exists(file_path):
+        async def run(index: int, request: InvoiceExtractionRequest) -> InvoiceBatchResult:
+            async with semaphore:
                 try:
-                    os.remove(file_path)
-                except:
-                    pass
-            raise e
+                    response = await self._process_with_retry(request, caller)
+                    return InvoiceBatchResult(index=index, correlation_id=request.correlation_id, status="OK", result=response)
+                except Exception as e:
+                    logger.warning("Batch item %s failed: %s", index, e)
+                    return InvoiceBatchResult(index=index, correlation_id=request.correlation_id, status="ERROR", error=str(e))
+
+        tasks = [asyncio.create_task(run(i, r)) for i, r in enumerate(requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Stop outstanding work if the client goes away mid-stream
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,310 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+from core.logger import setup_logger
+from core.request_context import request_id_var
+from schemas.invoice import InvoiceExpectedValues
+from service.executor import QueueFullError, WorkerCrashedError
+from service.invoice_service import ExtractionError
+from service.quota import ANONYMOUS, Caller, RateLimitedError, caller_weight
+
+logger = setup_logger(__name__)
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+class JobStore:
+    """
+    Persistent job queue backed by SQLite.
+
+    Jobs hold the decoded document and the expected values until they
+    finish; the result (or error) is kept afterwards so clients can poll
+    for it across restarts. Several processes may share the database: a
+    claimed job is leased to the claiming store (`owner`) for
+    JOB_LEASE_SECONDS and renewed while it runs, and only jobs whose lease
+    has run out are taken back.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.JOB_DB_PATH
+        self.owner = uuid.uuid4().hex
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, document BLOB, expected TEXT NOT NULL,"
+            f" caller TEXT NOT NULL DEFAULT '{ANONYMOUS}',"
+            " attempts INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL, available_at REAL NOT NULL,"
+            " owner TEXT, lease_until REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, available_at, created_at)")
+        # Job databases created before per-caller quotas and leases; fails harmlessly when the column exists
+        for column in (f"caller TEXT NOT NULL DEFAULT '{ANONYMOUS}'", "owner TEXT", "lease_until REAL"):
+            try:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass
+
+    def submit(self, document: bytes, expected: InvoiceExpectedValues, caller: str = ANONYMOUS) -> str:
+        """Queue a document for extraction on behalf of `caller` and return its job id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, document, expected, caller, created_at, updated_at, available_at)"
+                " VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, bytes(document), expected.model_dump_json(), caller, now, now, now),
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically move the oldest runnable job to 'running', leased to this store, and return it."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, document, expected, caller, attempts FROM jobs"
+                    " WHERE status = 'queued' AND available_at <= ? ORDER BY created_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, owner = ?, lease_until = ?,"
+                        " updated_at = ? WHERE id = ?",
+                        (self.owner, now + settings.JOB_LEASE_SECONDS, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "document": row["document"],
+            "expected": json.loads(row["expected"]),
+            "caller": row["caller"],
+            "attempts": row["attempts"] + 1,
+        }
+
+    def renew(self, job_id: str) -> bool:
+        """Extend the lease on a running job; False when this store no longer holds it."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running' AND owner = ?",
+                (now + settings.JOB_LEASE_SECONDS, job_id, self.owner),
+            )
+        return cursor.rowcount > 0
+
+    # complete(), fail() and defer() only touch jobs this store still holds, so a
+    # process whose lease ran out cannot overwrite the outcome of the one that took over
+
+    def complete(self, job_id: str, result_json: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, document = NULL, owner = NULL, updated_at = ?"
+                " WHERE id = ? AND owner = ?",
+                (result_json, time.time(), job_id, self.owner),
+            )
+
+    def fail(self, job_id: str, error: str, retry_in: Optional[float] = None) -> None:
+        """Record a failure; with `retry_in` the job is re-queued after that many seconds."""
+        now = time.time()
+        with self._lock:
+            if retry_in is not None:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, owner = NULL, updated_at = ?, available_at = ?"
+                    " WHERE id = ? AND owner = ?",
+                    (error, now, now + retry_in, job_id, self.owner),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, document = NULL, owner = NULL, updated_at = ?"
+                    " WHERE id = ? AND owner = ?",
+                    (error, now, job_id, self.owner),
+                )
+
+    def defer(self, job_id: str, delay: float) -> None:
+        """
+        Re-queue a claimed job after `delay` seconds without counting the
+        attempt (rate-limited caller, or shutting down mid-job).
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = attempts - 1, owner = NULL, updated_at = ?, available_at = ?"
+                " WHERE id = ? AND owner = ?",
+                (now, now + delay, job_id, self.owner),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, attempts, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def requeue_expired(self) -> int:
+        """
+        Return running jobs whose lease has run out (their process died or
+        hung) to the queue; jobs from before leases count as expired.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, updated_at = ?"
+                " WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?)",
+                (now, now),
+            )
+        return max(cursor.rowcount, 0)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Job counts per status and the age of the oldest queued job."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+            oldest = self._conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({row[0]: row[1] for row in rows})
+        return {
+            "queue_depth": counts["queued"],
+            **counts,
+            "oldest_queued_age_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class JobWorkers:
+    """Background asyncio workers that drain a JobStore through an InvoiceService."""
+
+    def __init__(self, store: JobStore, service: Any, workers: Optional[int] = None):
+        self.store = store
+        self.service = service
+        self.workers = max(1, workers or settings.JOB_WORKERS)
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+        self._next_requeue = 0.0
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._run(i)) for i in range(self.workers)]
+        logger.info("Started %s job workers.", self.workers)
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _requeue_expired(self) -> None:
+        # Once per lease period, by whichever worker gets here first
+        now = time.monotonic()
+        if now < self._next_requeue:
+            return
+        self._next_requeue = now + settings.JOB_LEASE_SECONDS
+        requeued = await asyncio.to_thread(self.store.requeue_expired)
+        if requeued:
+            logger.warning("Re-queued %s jobs whose lease ran out.", requeued)
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """Renew the job's lease while it runs."""
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            try:
+                if not await asyncio.to_thread(self.store.renew, job_id):
+                    logger.warning("Lost the lease on job %s; another process may run it again.", job_id)
+                    return
+            except Exception as e:
+                logger.error("Failed to renew the lease on job %s: %s", job_id, e)
+
+    async def _run(self, worker_id: int) -> None:
+        while not self._stopping.is_set():
+            try:
+                await self._requeue_expired()
+                job = await asyncio.to_thread(self.store.claim)
+            except Exception as e:
+                logger.error("Job worker %s failed to claim a job: %s", worker_id, e)
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._process(job)
+
+    async def _process(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        # The job's log records, down to the extraction workers, carry this id
+        token = request_id_var.set(f"job-{job_id}")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await self._run_job(job_id, job)
+        finally:
+            heartbeat.cancel()
+            request_id_var.reset(token)
+
+    async def _run_job(self, job_id: str, job: Dict[str, Any]) -> None:
+        logger.info("Processing job %s (attempt %s).", job_id, job['attempts'])
+        try:
+            expected = InvoiceExpectedValues(**job["expected"])
+            caller = Caller(job["caller"], caller_weight(job["caller"]))
+            response = await self.service.process_document(job["document"], expected, caller=caller)
+            await asyncio.to_thread(self.store.complete, job_id, response.model_dump_json())
+            logger.info("Job %s completed.", job_id)
+        except asyncio.CancelledError:
+            # Shutting down mid-job: hand it back now rather than when the lease runs out
+            self.store.defer(job_id, 0)
+            raise
+        except RateLimitedError as e:
+            logger.info("Job %s deferred for %ss: caller '%s' is over its CPU quota.", job_id, e.retry_after, e.caller)
+            await asyncio.to_thread(self.store.defer, job_id, e.retry_after)
+        except (ValueError, ExtractionError) as e:
+            logger.warning("Job %s failed permanently: %s", job_id, e)
+            await asyncio.to_thread(self.store.fail, job_id, str(e))
+        except (QueueFullError, WorkerCrashedError, TimeoutError) as e:
+            # Transient: pool saturation, a worker crash or a timeout. Anything else (a corrupt
+            # or unsupported document, an ExtractionError) fails the same way every time
+            if job["attempts"] < settings.JOB_MAX_ATTEMPTS:
+                delay = settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1)
+                logger.warning("Job %s failed (attempt %s), retrying in %ss: %s", job_id, job['attempts'], delay, e)
+                await asyncio.to_thread(self.store.fail, job_id, str(e), delay)
+            else:
+                logger.error("Job %s failed after %s attempts: %s", job_id, job['attempts'], e)
+                await asyncio.to_thread(self.store.fail, job_id, str(e))
+        except Exception as e:
+            logger.error("Job %s failed with an unexpected error: %s", job_id, e)
+            await asyncio.to_thread(self.store.fail, job_id, str(e))
+
+_job_store: Optional[JobStore] = None
+
+def get_job_store() -> JobStore:
+    """Return the process-wide job store, creating it on first use."""
+    global _job_store
+    if _job_store is None:
+        _job_store = JobStore()
+    return _job_store
+
+def close_job_store() -> None:
+    global _job_store
+    if _job_store is not None:
+        _job_store.close()
+        _job_store = None
@@ -0,0 +1,91 @@
+import ctypes
+import os
+import sys
+from typing import Optional
+
+from core.config import settings
+from core.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def _load_malloc_trim():
+    """glibc's malloc_trim, which returns freed heap pages to the kernel; None elsewhere."""
+    try:
+        # The process's own symbols include libc's; find_library would shell out to ldconfig
+        trim = ctypes.CDLL(None).malloc_trim
+    except (OSError, AttributeError):
+        return None
+    trim.argtypes = [ctypes.c_size_t]
+    trim.restype = ctypes.c_int
+    return trim
+
+_malloc_trim = _load_malloc_trim()
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes, from /proc/self/statm; None where that is unavailable."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+def release_memory() -> None:
+    """Hand freed memory back to the OS: empty MuPDF's object store and trim the C heap."""
+    fitz = sys.modules.get("fitz")
+    # Nothing to empty before the first PDF; do not import PyMuPDF just for this
+    if fitz is not None:
+        fitz.TOOLS.store_shrink(100)
+    if _malloc_trim is not None:
+        _malloc_trim(0)
+
+class MemoryBudget:
+    """
+    RSS budget for one request, measured as growth over the RSS when the
+    request started. `check()` reports "ok", "degrade" (past
+    MEMORY_DEGRADE_RATIO of the budget) or "exceeded"; once exceeded, the
+    budget stays exceeded.
+    """
+
+    def __init__(self, limit_bytes: int):
+        self.limit = limit_bytes
+        self.baseline = current_rss() if limit_bytes > 0 else None
+        self.peak = 0
+        self.exceeded = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0 and self.baseline is not None
+
+    def used(self) -> int:
+        """Current RSS growth in bytes."""
+        rss = current_rss()
+        if not self.enabled or rss is None:
+            return 0
+        growth = max(0, rss - self.baseline)
+        self.peak = max(self.peak, growth)
+        return growth
+
+    def check(self) -> str:
+        if not self.enabled:
+            return "ok"
+        if self.exceeded:
+            return "exceeded"
+        degrade_at = self.limit * settings.MEMORY_DEGRADE_RATIO
+        if self.used() < degrade_at:
+            return "ok"
+        # Buffers already freed may still count towards RSS; give them back before judging
+        release_memory()
+        used = self.used()
+        if used >= self.limit:
+            self.exceeded = True
+            logger.warning("Memory budget exceeded: RSS grew by %.0f MB (budget %.0f MB).", used / 2 ** 20, self.limit / 2 ** 20)
+            return "exceeded"
+        return "degrade" if used >= degrade_at else "ok"
+
+NULL_BUDGET = MemoryBudget(0)
+
+def request_budget() -> MemoryBudget:
+    """A fresh budget of MEMORY_BUDGET_MB, or the shared no-op budget when it is 0."""
+    return MemoryBudget(settings.MEMORY_BUDGET_MB * 2**20) if settings.MEMORY_BUDGET_MB > 0 else NULL_BUDGET
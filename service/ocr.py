@@ -0,0 +1,232 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from statistics import mean
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from core.config import settings
+from core.logger import setup_logger
+from core.metrics import NULL_TIMER, current_cpu_meter
+from service.memory import NULL_BUDGET
+from service.preprocess import capped_dpi, np, prepare_image, render_page_for_ocr
+from service.tesseract import TesseractUnavailableError, load_library, thread_api
+
+logger = setup_logger(__name__)
+
+_ocr_pool: Optional[ThreadPoolExecutor] = None
+_backend: Optional[str] = None
+
+def ocr_backend() -> str:
+    """
+    The OCR engine in use: "capi" (a warm libtesseract handle per OCR thread)
+    or "pytesseract" (one tesseract process per page), per OCR_BACKEND.
+    """
+    global _backend
+    if _backend is None:
+        if settings.OCR_BACKEND in ("auto", "capi") and load_library() is not None:
+            _backend = "capi"
+        else:
+            if settings.OCR_BACKEND == "capi":
+                logger.warning("OCR_BACKEND=capi but libtesseract is unavailable; falling back to pytesseract.")
+            _backend = "pytesseract"
+        logger.info("OCR backend: %s", _backend)
+        if settings.OCR_PREPROCESS and np is None:
+            logger.warning("OCR_PREPROCESS is on but numpy is not installed; page images will not be preprocessed.")
+    return _backend
+
+def _warm_up_thread() -> None:
+    """Load the Tesseract model when an OCR thread starts, not on its first page."""
+    if ocr_backend() == "capi":
+        try:
+            thread_api()
+        except TesseractUnavailableError as e:
+            logger.warning("Could not initialise Tesseract in OCR thread: %s", e)
+
+def _get_ocr_pool() -> ThreadPoolExecutor:
+    """Return the shared OCR thread pool, creating it on first use."""
+    global _ocr_pool
+    if _ocr_pool is None:
+        # Tesseract runs outside the GIL (ctypes releases it), so threads are enough to use every core
+        _ocr_pool = ThreadPoolExecutor(
+            max_workers=max(1, settings.OCR_WORKERS), thread_name_prefix="ocr", initializer=_warm_up_thread
+        )
+    return _ocr_pool
+
+def warm_up_ocr(img: Image.Image, dpi: Optional[int] = None) -> None:
+    """
+    Start every OCR pool thread and OCR `img` once on each, so the first
+    real pages pay for neither the model load nor the first recognition.
+    """
+    pool = _get_ocr_pool()
+    # Submitted together, so each task finds no idle thread and starts a new one
+    futures = [pool.submit(ocr_image, img, dpi) for _ in range(max(1, settings.OCR_WORKERS))]
+    for future in futures:
+        future.result()
+
+def render_page_gray(page: fitz.Page, dpi: int) -> Image.Image:
+    """Render a page straight to an 8-bit grayscale image, without an encode/decode round trip."""
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+def _pytesseract_recognize(img: Image.Image, dpi: Optional[int], with_confidence: bool) -> Tuple[str, int]:
+    import pytesseract  # Only needed without the C API; it pulls in numpy (and pandas when installed)
+
+    config = f"--dpi {dpi}" if dpi else ""
+    if not with_confidence:
+        return pytesseract.image_to_string(img, lang=settings.OCR_LANG, config=config), -1
+    # One tesseract run for both: rebuild the text from the word boxes, a line per Tesseract line
+    data = pytesseract.image_to_data(img, lang=settings.OCR_LANG, config=config, output_type=pytesseract.Output.DICT)
+    lines: Dict[tuple, List[str]] = {}
+    confidences = []
+    for block, par, line, word, conf in zip(data["block_num"], data["par_num"], data["line_num"], data["text"], data["conf"]):
+        if float(conf) < 0 or not word.strip():
+            continue
+        lines.setdefault((block, par, line), []).append(word)
+        confidences.append(float(conf))
+    text = "\n".join(" ".join(words) for words in lines.values())
+    return text, round(mean(confidences)) if confidences else 0
+
+def ocr_image_with_confidence(img: Image.Image, dpi: Optional[int] = None, with_confidence: bool = True) -> Tuple[str, int]:
+    """Run Tesseract on a single image; returns (text, mean word confidence 0-100, or -1 when not computed)."""
+    global _backend
+    if ocr_backend() == "capi":
+        try:
+            return thread_api().recognize(img, dpi, with_confidence)
+        except TesseractUnavailableError as e:
+            logger.warning("Tesseract C API failed, falling back to pytesseract: %s", e)
+            _backend = "pytesseract"
+    return _pytesseract_recognize(img, dpi, with_confidence)
+
+def ocr_image(img: Image.Image, dpi: Optional[int] = None) -> str:
+    """Run Tesseract on a single image with the configured backend."""
+    return ocr_image_with_confidence(img, dpi, with_confidence=False)[0]
+
+def _ocr_concurrently(
+    count: int, render: Callable[[int, int], Tuple[Image.Image, int]], dpi: int, low_dpi: int, timer, budget
+) -> List[str]:
+    """
+    OCR `count` images produced by `render(index, dpi)` on the OCR pool;
+    `render` returns the image and the DPI it was actually rendered at.
+
+    `render` runs on the calling thread, one image at a time; at most two
+    images per worker are kept in flight so they do not pile up in memory.
+    With `low_dpi`, images are first rendered at that resolution and only
+    rendered again at `dpi` when Tesseract's confidence is below
+    OCR_MIN_CONFIDENCE. When the memory `budget` is under pressure, images
+    are OCR'd one at a time at MEMORY_DEGRADED_DPI. Texts are returned in
+    index order.
+    """
+    pool = _get_ocr_pool()
+    max_in_flight = 2 * max(1, settings.OCR_WORKERS)
+    # Tesseract's CPU time is spent on pool threads; it is reported to this thread's meter
+    meter = current_cpu_meter()
+
+    texts: List[str] = [""] * count
+    # future -> (image index, whether this is the low-DPI first pass)
+    pending: Dict[Future, Tuple[int, bool]] = {}
+
+    def run_ocr(img: Image.Image, image_dpi: int, first_pass: bool) -> Tuple[str, int, float]:
+        start = time.thread_time()
+        with timer.span("ocr_tesseract"):
+            text, confidence = ocr_image_with_confidence(img, image_dpi, with_confidence=first_pass)
+        return text, confidence, time.thread_time() - start
+
+    def submit(index: int, image_dpi: int, first_pass: bool) -> None:
+        with timer.span("ocr_render"):
+            img, image_dpi = render(index, image_dpi)
+        pending[pool.submit(run_ocr, img, image_dpi, first_pass)] = (index, first_pass)
+
+    def collect(futures: Iterable[Future]) -> None:
+        for future in futures:
+            index, first_pass = pending.pop(future)
+            text, confidence, cpu_seconds = future.result()
+            if meter is not None:
+                meter.add(cpu_seconds)
+            if first_pass and confidence < settings.OCR_MIN_CONFIDENCE and budget.check() == "ok":
+                logger.debug("OCR confidence %s on image %s at %s dpi; re-rendering at %s dpi", confidence, index + 1, low_dpi, dpi)
+                submit(index, dpi, False)
+                continue
+            texts[index] = text
+            logger.debug("OCR processed image %s", index + 1)
+
+    def wait_until_fewer_than(limit: int) -> None:
+        while len(pending) >= limit:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    try:
+        for index in range(count):
+            if budget.check() == "ok":
+                submit(index, low_dpi or dpi, bool(low_dpi))
+                wait_until_fewer_than(max_in_flight)
+            else:
+                # Memory pressure: let in-flight images go before rendering another, smaller one
+                wait_until_fewer_than(1)
+                submit(index, min(dpi, settings.MEMORY_DEGRADED_DPI), False)
+        wait_until_fewer_than(1)
+    finally:
+        for future in pending:
+            future.cancel()
+
+    return texts
+
+def ocr_pages(
+    doc: fitz.Document,
+    page_numbers: Optional[Iterable[int]] = None,
+    dpi: Optional[int] = None,
+    timer=NULL_TIMER,
+    budget=NULL_BUDGET,
+) -> List[str]:
+    """
+    OCR the given pages of an open document concurrently.
+
+    Pages are rendered on the calling thread (PyMuPDF documents are not
+    thread-safe), preprocessed (see service.preprocess) and handed to the OCR
+    pool. With adaptive DPI (OCR_LOW_DPI) pages are first read at the low
+    resolution and only re-rendered at `dpi` when Tesseract's confidence is poor.
+    Pages too large for OCR_MAX_RENDER_BYTES are rendered at a lower DPI.
+    Texts are returned in the order of `page_numbers`. Per-page render and
+    Tesseract times are recorded on `timer`.
+    """
+    page_numbers = list(range(doc.page_count) if page_numbers is None else page_numbers)
+    dpi = dpi or settings.OCR_DPI
+    low_dpi = settings.OCR_LOW_DPI if 0 < settings.OCR_LOW_DPI < dpi else 0
+
+    def render(index: int, page_dpi: int) -> Tuple[Image.Image, int]:
+        page = doc[page_numbers[index]]
+        page_dpi = capped_dpi(page.rect.width / 72, page.rect.height / 72, page_dpi)
+        return render_page_for_ocr(page, page_dpi), page_dpi
+
+    return _ocr_concurrently(len(page_numbers), render, dpi, low_dpi, timer, budget)
+
+def image_dpi(img: Image.Image) -> int:
+    """The resolution recorded in an image file, or OCR_DPI when it is missing or implausible (e.g. 72 dpi photos)."""
+    x_dpi = (img.info.get("dpi") or (0, 0))[0]
+    return int(round(x_dpi)) if 100 <= x_dpi <= 1200 else settings.OCR_DPI
+
+def ocr_image_frames(img: Image.Image, timer=NULL_TIMER, max_frames: int = 0, budget=NULL_BUDGET) -> List[str]:
+    """
+    OCR a decoded raster image directly, without going through a PDF render;
+    multi-frame images (e.g. multi-page TIFFs) return one text per frame, for
+    at most `max_frames` frames when > 0. Frames larger than
+    OCR_MAX_RENDER_BYTES, or above the DPI asked for under memory pressure,
+    are scaled down.
+    """
+    dpi = image_dpi(img)
+    frames = getattr(img, "n_frames", 1)
+    if max_frames > 0:
+        frames = min(frames, max_frames)
+
+    def render(index: int, target_dpi: int) -> Tuple[Image.Image, int]:
+        img.seek(index)
+        # Frames share one decoder: hand the pool a copy, not the image being seeked
+        frame = img.copy()
+        scaled_dpi = min(target_dpi, capped_dpi(frame.width / dpi, frame.height / dpi, dpi))
+        if scaled_dpi < dpi:
+            scale = scaled_dpi / dpi
+            frame = frame.resize((max(1, int(frame.width * scale)), max(1, int(frame.height * scale))), Image.BILINEAR)
+        return prepare_image(frame, scaled_dpi), scaled_dpi
+
+    return _ocr_concurrently(frames, render, dpi, 0, timer, budget)
@@ -0,0 +1,174 @@
+import math
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from core.config import settings
+from core.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+try:
+    import numpy as np  # Optional: enables OCR image preprocessing
+except ImportError:
+    np = None
+
+# Adaptive binarisation: a pixel is ink when it is this much darker than its neighbourhood mean
+BINARIZE_OFFSET = 0.15
+# Deskew search range and step, in degrees
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.25
+# Ink pixels sampled when estimating the skew angle
+DESKEW_SAMPLES = 20_000
+# Rotations smaller than this are not worth the resampling
+DESKEW_MIN_ANGLE = 0.2
+
+def preprocessing_available() -> bool:
+    """True when OCR_PREPROCESS is on and numpy is installed."""
+    return settings.OCR_PREPROCESS and np is not None
+
+def pixmap_to_gray(pix: fitz.Pixmap) -> "np.ndarray":
+    """
+    View a pixmap's sample buffer as an (height, width) uint8 array, converting
+    colour to luma. Grayscale pixmaps are not copied: the array is only valid
+    while `pix` is alive.
+    """
+    samples = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    if pix.n == 1:
+        return samples[:, :pix.width]
+    channels = samples[:, :pix.width * pix.n].reshape(pix.height, pix.width, pix.n)
+    # ITU-R 601 luma, in integer arithmetic
+    luma = (channels[..., 0].astype(np.uint32) * 299 + channels[..., 1] * 587 + channels[..., 2] * 114) // 1000
+    return luma.astype(np.uint8)
+
+def _box_mean(values: "np.ndarray", radius: int) -> "np.ndarray":
+    """Mean over the (2 * radius + 1)^2 window around each element, clipped at the edges."""
+    height, width = values.shape
+    rows, cols = np.arange(height), np.arange(width)
+    top, bottom = np.clip(rows - radius, 0, height), np.clip(rows + radius + 1, 0, height)
+    left, right = np.clip(cols - radius, 0, width), np.clip(cols + radius + 1, 0, width)
+    # Running sums, one axis at a time; float64 keeps them exact
+    running = np.zeros((height + 1, width), dtype=np.float64)
+    np.cumsum(values, axis=0, out=running[1:])
+    column_sums = running[bottom] - running[top]
+    running = np.zeros((height, width + 1), dtype=np.float64)
+    np.cumsum(column_sums, axis=1, out=running[:, 1:])
+    window_sums = running[:, right] - running[:, left]
+    return window_sums / ((bottom - top)[:, None] * (right - left)[None, :])
+
+def binarize(gray: "np.ndarray", block: int) -> "np.ndarray":
+    """
+    Adaptive (Bradley) thresholding: each pixel is compared with the mean of
+    the `block` x `block` window around it, so shading and uneven scans do
+    not wash out text. Returns a boolean array, True for ink.
+
+    The local mean is smooth, so it is computed on a grid `cell` times
+    coarser than the page and scaled back up; only the final comparison
+    touches every pixel.
+    """
+    height, width = gray.shape
+    cell = max(1, block // 16)
+    grid_h, grid_w = -(-height // cell), -(-width // cell)
+    padded = np.pad(gray, ((0, grid_h * cell - height), (0, grid_w * cell - width)), mode="edge")
+    cells = padded.reshape(grid_h, cell, grid_w, cell).sum(axis=(1, 3), dtype=np.uint32) / (cell * cell)
+    threshold = np.ceil(_box_mean(cells, block // (2 * cell)) * (1 - BINARIZE_OFFSET)).astype(np.uint8)
+    threshold = threshold.repeat(cell, axis=0).repeat(cell, axis=1)[:height, :width]
+    # gray is an integer, so gray < t exactly when gray < ceil(t)
+    return gray < threshold
+
+def estimate_skew(ink: "np.ndarray") -> float:
+    """
+    Skew angle of the text lines in degrees (positive when lines fall to the
+    right), found as the shear under which ink pixels pile up into the
+    sharpest row profile.
+    """
+    ys, xs = np.nonzero(ink)
+    if len(ys) < 100:
+        return 0.0
+    stride = max(1, len(ys) // DESKEW_SAMPLES)
+    ys = ys[::stride].astype(np.float64)
+    xs = xs[::stride].astype(np.float64)
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + DESKEW_STEP / 2, DESKEW_STEP):
+        rows = np.rint(ys - xs * math.tan(math.radians(angle))).astype(np.int64)
+        profile = np.bincount(rows - rows.min()).astype(np.float64)
+        score = float(np.dot(profile, profile))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+def trim_margins(ink: "np.ndarray", padding: int) -> tuple:
+    """(top, bottom, left, right) bounds of the ink on the page, padded by `padding` pixels."""
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+    height, width = ink.shape
+    if not len(rows):
+        return 0, height, 0, width
+    return (
+        max(0, rows[0] - padding), min(height, rows[-1] + padding + 1),
+        max(0, cols[0] - padding), min(width, cols[-1] + padding + 1),
+    )
+
+def preprocess_gray(gray: "np.ndarray", dpi: int) -> Image.Image:
+    """
+    Turn a grayscale page into a smaller, straighter image for Tesseract.
+
+    The page is adaptively binarised to find the ink, which drives the deskew
+    angle and the margin trim. The trimmed, deskewed grayscale is what gets
+    OCR'd: Tesseract's own thresholding reads anti-aliased glyphs better than
+    a hard bilevel image (see test/bench_preprocess.py). OCR_BILEVEL passes
+    the binarised image instead, which can help on shaded or stained scans.
+    """
+    # Windows of about a quarter inch span several text lines at any DPI
+    ink = binarize(gray, block=max(15, dpi // 4) | 1)
+    angle = estimate_skew(ink)
+    top, bottom, left, right = trim_margins(ink, padding=max(8, dpi // 10))
+
+    if settings.OCR_BILEVEL:
+        img = Image.fromarray(np.where(ink[top:bottom, left:right], 0, 255).astype(np.uint8), "L")
+        resample = Image.NEAREST
+    else:
+        # Copy: `gray` may be a view of a pixmap that is freed right after this call
+        img = Image.fromarray(gray[top:bottom, left:right].copy(), "L")
+        resample = Image.BILINEAR
+    if abs(angle) >= DESKEW_MIN_ANGLE:
+        logger.debug("Deskewing page by %.2f degrees", angle)
+        img = img.rotate(angle, resample=resample, expand=True, fillcolor=255)
+    return img
+
+def preprocess_pixmap(pix: fitz.Pixmap, dpi: int) -> Image.Image:
+    """Preprocess a rendered page, reading the pixmap's samples in place."""
+    return preprocess_gray(pixmap_to_gray(pix), dpi)
+
+def capped_dpi(width_inches: float, height_inches: float, dpi: int) -> int:
+    """`dpi`, lowered when needed so the rendered 8-bit image stays within OCR_MAX_RENDER_BYTES."""
+    limit = settings.OCR_MAX_RENDER_BYTES
+    pixels = width_inches * height_inches * dpi * dpi
+    if limit <= 0 or pixels <= limit:
+        return dpi
+    return max(1, int(dpi * math.sqrt(limit / pixels)))
+
+def render_page_for_ocr(page: fitz.Page, dpi: int) -> Image.Image:
+    """
+    Render a page to grayscale and, when available, preprocess it for OCR.
+    Only the returned image outlives the call; the pixmap is freed on return.
+    """
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    # MuPDF keeps decoded page images in its store for reuse; a scan's image never is
+    fitz.TOOLS.store_shrink(100)
+    if preprocessing_available():
+        return preprocess_pixmap(pix, dpi)
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples_mv)
+
+def prepare_image(img: Image.Image, dpi: int) -> Image.Image:
+    """Convert a decoded raster image (a photo or scan upload) to grayscale and, when available, preprocess it."""
+    if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        # Transparent areas become paper, not black
+        background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(background, img.convert("RGBA"))
+    if img.mode != "L":
+        img = img.convert("L")
+    if preprocessing_available():
+        return preprocess_gray(np.asarray(img), dpi)
+    return img
@@ -0,0 +1,195 @@
+import math
+import secrets
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+from core.config import settings
+from core.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Requests that carry neither an API key nor a caller header share this identity
+ANONYMOUS = "anonymous"
+
+class Caller(NamedTuple):
+    """Who a request is accounted to, and their share of the extraction workers (CALLER_WEIGHTS)."""
+
+    name: str
+    weight: float = 1.0
+
+class UnknownApiKeyError(ValueError):
+    """Raised when a request presents an API key that is not in API_KEYS."""
+
+class RateLimitedError(RuntimeError):
+    """Raised when a caller has used up its CPU-time allowance."""
+
+    def __init__(self, caller: str, retry_after: int):
+        super().__init__(f"Caller '{caller}' has exceeded its extraction CPU quota. Please retry later.")
+        self.caller = caller
+        self.retry_after = retry_after
+
+def parse_pairs(value: str) -> Dict[str, str]:
+    """Parse "a=1,b=2" settings into a dict; entries without '=' are ignored."""
+    pairs = {}
+    for item in value.split(","):
+        key, sep, val = item.partition("=")
+        if sep and key.strip():
+            pairs[key.strip()] = val.strip()
+    return pairs
+
+def caller_weight(name: str) -> float:
+    """The caller's share from CALLER_WEIGHTS (default 1)."""
+    try:
+        return max(0.01, float(parse_pairs(settings.CALLER_WEIGHTS).get(name, 1.0)))
+    except ValueError:
+        logger.warning("Invalid weight for caller '%s' in CALLER_WEIGHTS; using 1.", name)
+        return 1.0
+
+def identify_caller(api_key: Optional[str], caller_id: Optional[str]) -> Caller:
+    """
+    Who is asking: the caller an X-API-Key maps to in API_KEYS, else the
+    value of the CALLER_HEADER header, else ANONYMOUS. An API key that is
+    not configured raises UnknownApiKeyError rather than falling back.
+    """
+    if api_key:
+        for key, name in parse_pairs(settings.API_KEYS).items():
+            if secrets.compare_digest(key.encode(), api_key.encode()):
+                return Caller(name, caller_weight(name))
+        raise UnknownApiKeyError("Unknown API key.")
+    name = (caller_id or "").strip()[:64] or ANONYMOUS
+    return Caller(name, caller_weight(name))
+
+class TokenBucket:
+    """
+    CPU-seconds a caller may spend: refills at `rate` per second up to
+    `burst`. The cost of an extraction is only known once it has run, so
+    admission needs a positive balance and the actual cost is charged
+    afterwards; an expensive document can take the balance negative, and
+    the caller then waits until the refill has paid the debt back.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until the balance is positive again; 0 when it already is."""
+        self._refill()
+        return 0.0 if self.tokens > 0 else (-self.tokens + 1e-3) / self.rate
+
+    def charge(self, seconds: float) -> None:
+        self._refill()
+        self.tokens -= seconds
+
+class CallerQuotas:
+    """
+    Per-caller CPU-time rate limits: each caller's bucket refills at
+    CALLER_CPU_RATE x weight CPU-seconds per second, up to CALLER_CPU_BURST
+    x weight. With CALLER_CPU_RATE = 0 nobody is limited, but CPU use is
+    still counted for the stats endpoint. Caller ids come from a header, so
+    at most MAX_CALLERS are tracked: a new caller past that evicts the least
+    recently seen one whose bucket has refilled (nothing is lost by starting
+    it over).
+    """
+
+    MAX_CALLERS = 1024
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None):
+        self.rate = settings.CALLER_CPU_RATE if rate is None else rate
+        self.burst = settings.CALLER_CPU_BURST if burst is None else burst
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._usage: Dict[str, Dict[str, float]] = {}
+
+    def _bucket(self, caller: Caller) -> TokenBucket:
+        bucket = self._buckets.get(caller.name)
+        if bucket is None:
+            bucket = self._buckets[caller.name] = TokenBucket(self.rate * caller.weight, self.burst * caller.weight)
+        return bucket
+
+    def _caller_usage(self, caller: Caller) -> Dict[str, float]:
+        # Re-inserted on every use, so the dict runs from least to most recently seen
+        usage = self._usage.pop(caller.name, None)
+        if usage is None:
+            usage = {"admitted": 0, "rejected": 0, "cpu_seconds": 0.0}
+            if len(self._usage) >= self.MAX_CALLERS:
+                self._evict()
+        self._usage[caller.name] = usage
+        return usage
+
+    def _evict(self) -> None:
+        victim = next(iter(self._usage))
+        for name in self._usage:
+            bucket = self._buckets.get(name)
+            if bucket is None:
+                victim = name
+                break
+            bucket._refill()
+            if bucket.tokens >= bucket.burst:
+                victim = name
+                break
+        # With every bucket in debt the oldest goes anyway: the tables must stay bounded
+        del self._usage[victim]
+        self._buckets.pop(victim, None)
+
+    def check(self, caller: Caller) -> None:
+        """Raise RateLimitedError when `caller` has no CPU time left."""
+        with self._lock:
+            self._check(caller)
+
+    def _check(self, caller: Caller) -> None:
+        usage = self._caller_usage(caller)
+        if self.rate > 0:
+            wait = self._bucket(caller).wait_time()
+            if wait > 0:
+                usage["rejected"] += 1
+                raise RateLimitedError(caller.name, max(1, math.ceil(wait)))
+
+    def admit(self, caller: Caller) -> None:
+        """Let an extraction for `caller` start, or raise RateLimitedError."""
+        with self._lock:
+            self._check(caller)
+            self._caller_usage(caller)["admitted"] += 1
+
+    def refund(self, caller: Caller) -> None:
+        """Undo admit() for an extraction that never ran (e.g. its lane was full)."""
+        with self._lock:
+            self._caller_usage(caller)["admitted"] -= 1
+
+    def charge(self, caller: Caller, cpu_seconds: float) -> None:
+        """Debit the CPU time an admitted extraction actually used."""
+        with self._lock:
+            self._caller_usage(caller)["cpu_seconds"] += cpu_seconds
+            if self.rate > 0:
+                self._bucket(caller).charge(cpu_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            callers = {}
+            for name, usage in self._usage.items():
+                bucket = self._buckets.get(name)
+                if bucket is not None:
+                    bucket._refill()
+                callers[name] = {
+                    **usage,
+                    "cpu_seconds": round(usage["cpu_seconds"], 3),
+                    "balance_cpu_seconds": round(bucket.tokens, 3) if bucket is not None else None,
+                }
+        return {"cpu_rate": self.rate, "cpu_burst": self.burst, "callers": callers}
+
+_caller_quotas: Optional[CallerQuotas] = None
+
+def get_caller_quotas() -> CallerQuotas:
+    """Return the process-wide caller quotas, creating them on first use."""
+    global _caller_quotas
+    if _caller_quotas is None:
+        _caller_quotas = CallerQuotas()
+    return _caller_quotas
@@ -0,0 +1,246 @@
+import datetime
+import glob
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+from core.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+SEGMENT_PATTERN = re.compile(r"results-(\d{4}-\d{2}-\d{2})\.sqlite3$")
+
+# Columns of a stored result, in table order
+COLUMNS = (
+    "recorded_at", "document_hash", "document_type", "size_bytes", "caller", "correlation_id",
+    "score", "recommended_action", "extraction_method", "cache_hit", "expected", "response",
+)
+
+_STOP = object()
+
+def _day(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime("%Y-%m-%d")
+
+class ResultsStore:
+    """
+    Append-only audit log of extraction results, kept off the request path.
+
+    record() only puts a row on a bounded in-memory queue. A writer thread
+    drains it and commits the rows in batches of up to `batch_size`, waiting
+    at most `flush_interval` seconds for a batch to fill, so a burst of
+    requests costs one transaction rather than one write each. Rows go to one
+    SQLite file (WAL) per UTC day under `directory`; segments older than
+    `retention_days` are deleted as days roll over. When the queue is full,
+    rows are dropped and counted instead of slowing requests down.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        retention_days: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        queue_limit: Optional[int] = None,
+    ):
+        self.directory = directory or settings.RESULTS_DIR
+        self.retention_days = settings.RESULTS_RETENTION_DAYS if retention_days is None else retention_days
+        self.batch_size = max(1, batch_size or settings.RESULTS_BATCH_SIZE)
+        self.flush_interval = settings.RESULTS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        queue_limit = settings.RESULTS_QUEUE_LIMIT if queue_limit is None else queue_limit
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(0, queue_limit))
+        self._stats = {"written": 0, "dropped": 0, "failed": 0, "batches": 0}
+        self._stats_lock = threading.Lock()
+        # Only the writer thread touches the open segment
+        self._segment_day: Optional[str] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writer = threading.Thread(target=self._run, name="results-writer", daemon=True)
+        self._writer.start()
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def record(self, **values: Any) -> None:
+        """Queue one result (keyword arguments named after COLUMNS) for the writer; never blocks."""
+        values.setdefault("recorded_at", time.time())
+        try:
+            self._queue.put_nowait(tuple(values.get(column) for column in COLUMNS))
+        except queue.Full:
+            self._count("dropped")
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            # Group commit: gather what arrives within flush_interval, up to batch_size rows
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+        # Shutting down: whatever is still queued goes out in one last batch
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                remaining.append(item)
+        if remaining:
+            self._write(remaining)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _write(self, batch: List[tuple]) -> None:
+        by_day: Dict[str, List[tuple]] = {}
+        for row in batch:
+            by_day.setdefault(_day(row[0]), []).append(row)
+        for day, rows in by_day.items():
+            try:
+                conn = self._segment(day)
+                with conn:
+                    conn.executemany(
+                        f"INSERT INTO results ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows
+                    )
+                self._count("written", len(rows))
+                self._count("batches")
+            except sqlite3.Error as e:
+                logger.error("Failed to write %s results to the results store: %s", len(rows), e)
+                self._count("failed", len(rows))
+
+    def segment_path(self, day: str) -> str:
+        return os.path.join(self.directory, f"results-{day}.sqlite3")
+
+    def _segment(self, day: str) -> sqlite3.Connection:
+        """The connection to `day`'s segment, rotating (and applying retention) when the day changes."""
+        if day == self._segment_day and self._conn is not None:
+            return self._conn
+        if self._conn is not None:
+            self._conn.close()
+        conn = sqlite3.connect(self.segment_path(day))
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " id INTEGER PRIMARY KEY, recorded_at REAL NOT NULL, document_hash TEXT NOT NULL, document_type TEXT,"
+            " size_bytes INTEGER, caller TEXT, correlation_id TEXT, score TEXT, recommended_action TEXT,"
+            " extraction_method TEXT, cache_hit INTEGER, expected TEXT, response TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_hash ON results (document_hash)")
+        self._conn, self._segment_day = conn, day
+        self._apply_retention()
+        return conn
+
+    def segment_days(self) -> List[str]:
+        """Days with a segment, newest first."""
+        days = []
+        for path in glob.glob(os.path.join(self.directory, "results-*.sqlite3")):
+            match = SEGMENT_PATTERN.search(os.path.basename(path))
+            if match:
+                days.append(match.group(1))
+        return sorted(days, reverse=True)
+
+    def _apply_retention(self) -> None:
+        if self.retention_days <= 0:
+            return
+        cutoff = _day(time.time() - self.retention_days * 86400)
+        for day in self.segment_days():
+            if day < cutoff:
+                for suffix in ("", "-wal", "-shm"):
+                    try:
+                        os.remove(self.segment_path(day) + suffix)
+                    except FileNotFoundError:
+                        pass
+                logger.info("Deleted results segment %s (older than %s days).", day, self.retention_days)
+
+    def query(self, document_hash: Optional[str] = None, day: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Stored results, newest first: those of one document (its SHA-256),
+        of one UTC day (YYYY-MM-DD), or both. Rows still queued are not seen.
+        """
+        if day and not re.fullmatch(r"\d{4}-\d{2}-\d{2}", day):
+            raise ValueError(f"Invalid date '{day}'. Expected YYYY-MM-DD.")
+        days = [day] if day else self.segment_days()
+        results: List[Dict[str, Any]] = []
+        for segment_day in days:
+            if len(results) >= limit:
+                break
+            path = self.segment_path(segment_day)
+            if not os.path.exists(path):
+                continue
+            sql = f"SELECT {', '.join(COLUMNS)} FROM results"
+            params: list = []
+            if document_hash:
+                sql += " WHERE document_hash = ?"
+                params.append(document_hash)
+            sql += " ORDER BY id DESC LIMIT ?"
+            params.append(limit - len(results))
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                rows = conn.execute(sql, params).fetchall()
+            finally:
+                conn.close()
+            for row in rows:
+                result = dict(zip(COLUMNS, row))
+                result["cache_hit"] = bool(result["cache_hit"])
+                result["expected"] = json.loads(result["expected"]) if result["expected"] else None
+                result["response"] = json.loads(result["response"])
+                results.append(result)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        days = self.segment_days()
+        return {
+            **stats,
+            "queued": self._queue.qsize(),
+            "segments": len(days),
+            "oldest_segment": days[-1] if days else None,
+            "retention_days": self.retention_days,
+        }
+
+    def close(self) -> None:
+        """Write everything still queued and stop the writer."""
+        while True:
+            try:
+                self._queue.put(_STOP, timeout=1.0)
+                break
+            except queue.Full:
+                if not self._writer.is_alive():
+                    break
+        self._writer.join()
+
+_results_store: Optional[ResultsStore] = None
+
+def get_results_store() -> Optional[ResultsStore]:
+    """Return the process-wide results store, or None when RESULTS_STORE_ENABLED is off."""
+    global _results_store
+    if _results_store is None and settings.RESULTS_STORE_ENABLED:
+        _results_store = ResultsStore()
+    return _results_store
+
+def close_results_store() -> None:
+    global _results_store
+    if _results_store is not None:
+        _results_store.close()
+        _results_store = None
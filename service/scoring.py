@@ -5,6 +5,9 @@ from core.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Fields whose mismatch rejects the invoice regardless of the score
+HARD_STOP_FIELDS = ("PAN", "GSTIN", "Agreement_Amount")
+
 def calculate_score(comparisons: Dict[str, Any]) -> Dict[str, Any]:
     """
     Calculate the confidence score based on field matches.
@@ -22,9 +25,9 @@ def calculate_score(comparisons: Dict[str, Any]) -> Dict[str, Any]:
     def is_match(field: str) -> bool:
         match = comparisons.get(field, {}).get("result") == "MATCH"
         if match:
-            logger.debug(f"Field '{field}' matched.")
+            logger.debug("Field '%s' matched.", field)
         else:
-            logger.debug(f"Field '{field}' did NOT match.")
+            logger.debug("Field '%s' did NOT match.", field)
             failed_fields.append(field)
         return match
 
@@ -105,7 +108,7 @@ def calculate_score(comparisons: Dict[str, Any]) -> Dict[str, Any]:
 
     remarks = " ".join(remarks_parts)
 
-    logger.info(f"Score calculation complete. Score: {score}, Decision: {decision}")
+    logger.info("Score calculation complete. Score: %s, Decision: %s", score, decision)
     
     return {
         "score": str(score),
@@ -0,0 +1,142 @@
+import ctypes
+import ctypes.util
+import os
+import threading
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from core.config import settings
+from core.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Parallelism comes from the OCR pool; keep each Tesseract call single-threaded
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# Page segmentation mode used by the tesseract CLI (and so by pytesseract): fully automatic
+PSM_AUTO = 3
+
+LIBRARY_CANDIDATES = ("libtesseract.so.5", "libtesseract.so.4", "libtesseract.dylib", "libtesseract-5.dll")
+
+class TesseractUnavailableError(RuntimeError):
+    """Raised when libtesseract cannot be loaded or initialised."""
+
+_lib: Optional[ctypes.CDLL] = None
+_lib_error: Optional[str] = None
+_lib_lock = threading.Lock()
+_local = threading.local()
+
+def _bind(lib: ctypes.CDLL) -> ctypes.CDLL:
+    """Declare the signatures of the C API functions used here."""
+    handle = ctypes.c_void_p
+    lib.TessBaseAPICreate.restype = handle
+    lib.TessBaseAPICreate.argtypes = []
+    lib.TessBaseAPIInit3.restype = ctypes.c_int
+    lib.TessBaseAPIInit3.argtypes = [handle, ctypes.c_char_p, ctypes.c_char_p]
+    lib.TessBaseAPISetPageSegMode.restype = None
+    lib.TessBaseAPISetPageSegMode.argtypes = [handle, ctypes.c_int]
+    lib.TessBaseAPISetImage.restype = None
+    lib.TessBaseAPISetImage.argtypes = [handle, ctypes.c_char_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int]
+    lib.TessBaseAPISetSourceResolution.restype = None
+    lib.TessBaseAPISetSourceResolution.argtypes = [handle, ctypes.c_int]
+    lib.TessBaseAPIGetUTF8Text.restype = ctypes.c_void_p
+    lib.TessBaseAPIGetUTF8Text.argtypes = [handle]
+    lib.TessBaseAPIMeanTextConf.restype = ctypes.c_int
+    lib.TessBaseAPIMeanTextConf.argtypes = [handle]
+    lib.TessDeleteText.restype = None
+    lib.TessDeleteText.argtypes = [ctypes.c_void_p]
+    lib.TessBaseAPIClear.restype = None
+    lib.TessBaseAPIClear.argtypes = [handle]
+    lib.TessBaseAPIEnd.restype = None
+    lib.TessBaseAPIEnd.argtypes = [handle]
+    lib.TessBaseAPIDelete.restype = None
+    lib.TessBaseAPIDelete.argtypes = [handle]
+    return lib
+
+def load_library() -> Optional[ctypes.CDLL]:
+    """Load libtesseract once per process; returns None (and logs why) when it is unavailable."""
+    global _lib, _lib_error
+    with _lib_lock:
+        if _lib is not None or _lib_error is not None:
+            return _lib
+        candidates = [settings.TESSERACT_LIBRARY] if settings.TESSERACT_LIBRARY else []
+        found = ctypes.util.find_library("tesseract")
+        if found:
+            candidates.append(found)
+        candidates.extend(LIBRARY_CANDIDATES)
+        for name in candidates:
+            try:
+                _lib = _bind(ctypes.CDLL(name))
+                logger.info("Loaded Tesseract C API from %s", name)
+                return _lib
+            except (OSError, AttributeError) as e:
+                _lib_error = str(e)
+        logger.warning("Tesseract C API unavailable, OCR will use pytesseract: %s", _lib_error)
+        return None
+
+class TesseractAPI:
+    """
+    A warm TessBaseAPI handle: the language model is loaded once and reused
+    for every page. Handles are not thread-safe; use one per thread
+    (see `thread_api`).
+    """
+
+    def __init__(self, lang: Optional[str] = None, datapath: Optional[str] = None):
+        lib = load_library()
+        if lib is None:
+            raise TesseractUnavailableError(f"libtesseract could not be loaded: {_lib_error}")
+        self._lib = lib
+        self._handle = lib.TessBaseAPICreate()
+        lang = lang or settings.OCR_LANG
+        if lib.TessBaseAPIInit3(self._handle, datapath.encode() if datapath else None, lang.encode()) != 0:
+            lib.TessBaseAPIDelete(self._handle)
+            self._handle = None
+            raise TesseractUnavailableError(f"Tesseract could not load language '{lang}' (check TESSDATA_PREFIX).")
+        lib.TessBaseAPISetPageSegMode(self._handle, PSM_AUTO)
+
+    def image_to_string(self, img: Image.Image, dpi: Optional[int] = None) -> str:
+        """OCR one image; 8-bit grayscale images are passed through without conversion."""
+        return self.recognize(img, dpi)[0]
+
+    def recognize(self, img: Image.Image, dpi: Optional[int] = None, with_confidence: bool = False) -> Tuple[str, int]:
+        """
+        OCR one image and return (text, mean word confidence 0-100). The
+        confidence is only computed when `with_confidence` is set; it is -1 otherwise.
+        """
+        if img.mode not in ("L", "RGB"):
+            img = img.convert("L")
+        bytes_per_pixel = 1 if img.mode == "L" else 3
+        data = img.tobytes()
+        lib = self._lib
+        lib.TessBaseAPISetImage(self._handle, data, img.width, img.height, bytes_per_pixel, img.width * bytes_per_pixel)
+        lib.TessBaseAPISetSourceResolution(self._handle, dpi or settings.OCR_DPI)
+        text_ptr = lib.TessBaseAPIGetUTF8Text(self._handle)
+        try:
+            text = ctypes.string_at(text_ptr).decode("utf-8", errors="replace") if text_ptr else ""
+            # Reads the results of the recognition above; must run before Clear
+            confidence = lib.TessBaseAPIMeanTextConf(self._handle) if with_confidence else -1
+            return text, confidence
+        finally:
+            if text_ptr:
+                lib.TessDeleteText(text_ptr)
+            lib.TessBaseAPIClear(self._handle)
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._lib.TessBaseAPIEnd(self._handle)
+            self._lib.TessBaseAPIDelete(self._handle)
+            self._handle = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+def thread_api() -> TesseractAPI:
+    """The calling thread's TesseractAPI, created (and warmed up) on first use."""
+    api = getattr(_local, "api", None)
+    if api is None:
+        api = _local.api = TesseractAPI()
+    return api
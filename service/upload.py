@@ -0,0 +1,270 @@
+import zlib
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Union
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from core.config import settings
+from core.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+try:
+    import zstandard  # Optional: enables zstd-compressed uploads
+except ImportError:
+    zstandard = None
+
+# Content types that imply a compressed file part in multipart uploads
+COMPRESSED_CONTENT_TYPES = {
+    "application/gzip": "gzip",
+    "application/x-gzip": "gzip",
+    "application/zstd": "zstd",
+}
+
+# Room for boundaries, part headers and expected-value fields in a multipart body
+MULTIPART_FIELDS_LIMIT = 64 * 1024
+
+class PayloadTooLargeError(ValueError):
+    """Raised when an upload (after decompression) exceeds MAX_UPLOAD_BYTES."""
+
+class UnsupportedEncodingError(ValueError):
+    """Raised for a Content-Encoding the service cannot decode."""
+
+class _CappedSink:
+    """Output side of the zstd decoder: collects what it writes and gives up past `limit` bytes."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.produced = 0
+        self.parts: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.produced += len(data)
+        if self.produced > self.limit:
+            # Raised from inside the decompressor, so a zstd bomb stops expanding here
+            raise PayloadTooLargeError(f"Upload exceeds the limit of {self.limit} bytes.")
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        out, self.parts = b"".join(self.parts), []
+        return out
+
+class _Decoder:
+    """Incremental decoder that never produces more than `limit + 1` bytes in total."""
+
+    def __init__(self, encoding: Optional[str], limit: int):
+        self.limit = limit
+        self.produced = 0
+        encoding = (encoding or "identity").strip().lower()
+        self.is_identity = encoding in ("identity", "")
+        if self.is_identity:
+            self._zlib = None
+            self._zstd = None
+        elif encoding in ("gzip", "x-gzip", "deflate"):
+            # 47 = auto-detect zlib or gzip header
+            self._zlib = zlib.decompressobj(47)
+            self._zstd = None
+        elif encoding == "zstd":
+            if zstandard is None:
+                raise UnsupportedEncodingError("zstd uploads require the 'zstandard' package.")
+            self._zlib = None
+            # A stream writer hands its output to the sink one block at a time, so the
+            # cap is enforced while decompressing rather than after a chunk has expanded
+            self._zstd_sink = _CappedSink(limit)
+            self._zstd = zstandard.ZstdDecompressor().stream_writer(self._zstd_sink)
+        else:
+            raise UnsupportedEncodingError(f"Unsupported Content-Encoding '{encoding}'.")
+
+    def _budget(self) -> int:
+        return self.limit - self.produced + 1
+
+    def decode(self, chunk: bytes) -> bytes:
+        if self._zlib is not None:
+            out = self._zlib.decompress(chunk, self._budget())
+            # Leftover input means the output budget was hit; check it before inflating more
+            while self._zlib.unconsumed_tail and len(out) <= self._budget() - 1:
+                out += self._zlib.decompress(self._zlib.unconsumed_tail, self._budget() - len(out))
+        elif self._zstd is not None:
+            self._zstd.write(chunk)
+            out = self._zstd_sink.take()
+        else:
+            out = chunk
+        self.produced += len(out)
+        return out
+
+    def flush(self) -> bytes:
+        out = self._zlib.flush() if self._zlib is not None else b""
+        self.produced += len(out)
+        return out
+
+async def read_capped(
+    chunks: AsyncIterator[bytes],
+    encoding: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    expected_size: Optional[int] = None,
+) -> Union[bytes, bytearray]:
+    """
+    Read an upload stream into a single buffer, decoding gzip/zstd on the fly.
+
+    The decoded size is capped at `max_bytes` (MAX_UPLOAD_BYTES by default);
+    a declared `expected_size` (Content-Length) over the cap is rejected
+    before anything is read. When the size is known and the body is not
+    encoded, chunks are copied straight into one preallocated buffer;
+    otherwise they are joined once at the end.
+    """
+    max_bytes = settings.MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    if expected_size is not None and expected_size > max_bytes:
+        raise PayloadTooLargeError(f"Upload of {expected_size} bytes exceeds the limit of {max_bytes} bytes.")
+
+    decoder = _Decoder(encoding, max_bytes)
+    preallocated = expected_size is not None and decoder.is_identity
+    buffer = bytearray(expected_size) if preallocated else None
+    parts: List[bytes] = []
+    size = 0
+
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        out = decoder.decode(chunk)
+        if size + len(out) > max_bytes:
+            raise PayloadTooLargeError(f"Upload exceeds the limit of {max_bytes} bytes.")
+        if buffer is not None:
+            if size + len(out) > len(buffer):
+                raise ValueError("Request body is longer than its declared Content-Length.")
+            buffer[size:size + len(out)] = out
+        else:
+            parts.append(out)
+        size += len(out)
+
+    tail = decoder.flush()
+    if tail:
+        if size + len(tail) > max_bytes:
+            raise PayloadTooLargeError(f"Upload exceeds the limit of {max_bytes} bytes.")
+        parts.append(tail)
+        size += len(tail)
+
+    logger.debug("Read upload of %s bytes (encoding: %s).", size, encoding or 'identity')
+    if buffer is not None:
+        if size != len(buffer):
+            raise ValueError("Request body is shorter than its declared Content-Length.")
+        return buffer
+    return b"".join(parts)
+
+class MultipartUpload(NamedTuple):
+    """The document and the text fields of a multipart/form-data upload."""
+
+    data: Union[bytes, bytearray]
+    fields: Dict[str, str]
+
+class _MultipartReader:
+    """
+    Callbacks for python-multipart's streaming parser: the `file` part goes
+    through a _Decoder as it arrives and the other parts are kept as fields.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.file_parts: List[bytes] = []
+        self.file_size = 0
+        self.files = 0
+        self.fields: Dict[str, bytearray] = {}
+        self.fields_size = 0
+        self._on_part_begin()
+
+    def callbacks(self) -> Dict[str, object]:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _append_file(self, out: bytes) -> None:
+        if self.file_size + len(out) > self.max_bytes:
+            raise PayloadTooLargeError(f"Upload exceeds the limit of {self.max_bytes} bytes.")
+        self.file_parts.append(out)
+        self.file_size += len(out)
+
+    def _on_part_begin(self) -> None:
+        self._headers: Dict[str, str] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._field: Optional[bytearray] = None
+        self._decoder: Optional[_Decoder] = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.decode("latin-1").lower()] = self._header_value.decode("latin-1")
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, disposition = parse_options_header(self._headers.get("content-disposition"))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        if name != "file":
+            self._field = self.fields.setdefault(name, bytearray())
+            return
+        self.files += 1
+        if self.files > 1:
+            raise ValueError("Multipart upload must contain a single 'file' part.")
+        media_type, _ = parse_options_header(self._headers.get("content-type"))
+        encoding = self._headers.get("content-encoding") or COMPRESSED_CONTENT_TYPES.get(media_type.decode("latin-1"))
+        self._decoder = _Decoder(encoding, self.max_bytes)
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._decoder is not None:
+            out = self._decoder.decode(data[start:end])
+            if out:
+                self._append_file(out)
+        elif self._field is not None:
+            self.fields_size += end - start
+            if self.fields_size > MULTIPART_FIELDS_LIMIT:
+                raise PayloadTooLargeError(f"Form fields exceed the limit of {MULTIPART_FIELDS_LIMIT} bytes.")
+            self._field += data[start:end]
+
+    def _on_part_end(self) -> None:
+        if self._decoder is not None:
+            tail = self._decoder.flush()
+            if tail:
+                self._append_file(tail)
+
+async def read_multipart(
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+    max_bytes: Optional[int] = None,
+    expected_size: Optional[int] = None,
+) -> MultipartUpload:
+    """
+    Stream a multipart/form-data body: the `file` part is decoded (per its
+    Content-Encoding or compressed content type) and capped at `max_bytes`
+    as it arrives, as read_capped does for raw bodies; the other parts are
+    text fields, limited to MULTIPART_FIELDS_LIMIT bytes in total. Nothing
+    is spooled to disk, and a declared `expected_size` (Content-Length) over
+    the cap plus that allowance is rejected before anything is read.
+    """
+    max_bytes = settings.MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    if expected_size is not None and expected_size > max_bytes + MULTIPART_FIELDS_LIMIT:
+        raise PayloadTooLargeError(f"Upload of {expected_size} bytes exceeds the limit of {max_bytes} bytes.")
+    _, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise ValueError("Multipart upload has no boundary.")
+
+    reader = _MultipartReader(max_bytes)
+    parser = MultipartParser(boundary, reader.callbacks())
+    async for chunk in chunks:
+        if chunk:
+            parser.write(chunk)
+    parser.finalize()
+    if not reader.files:
+        raise ValueError("Multipart upload must contain a 'file' part.")
+    logger.debug("Read multipart upload of %s bytes.", reader.file_size)
+    fields = {name: value.decode("utf-8", "replace") for name, value in reader.fields.items()}
+    return MultipartUpload(b"".join(reader.file_parts), fields)
@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Dict, Set
+
+from core.config import settings
+from core.logger import setup_logger
+from service.comparison import compare_field
+from service.invoice_extractor import process_invoice_from_bytes
+from service.scoring import calculate_score
+
+logger = setup_logger(__name__)
+
+# A made-up invoice in the layout the extraction patterns expect
+SAMPLE_FIELDS = {
+    "CP_Name": "Warmup Realty LLP",
+    "PAN": "ABCDE1234F",
+    "GSTIN": "27ABCDE1234F1Z5",
+    "Agreement_Amount": "1,000,000.00",
+    "Brokerage_Amount": "20,000.00",
+    "CGST": "1,800.00",
+    "SGST": "1,800.00",
+    "Total_Invoice_Amount": "23,600.00",
+    "TDS": "1000",
+}
+SAMPLE_LINES = [
+    f"Channel Partner (Bill From): {SAMPLE_FIELDS['CP_Name']}",
+    f"PAN: {SAMPLE_FIELDS['PAN']}",
+    f"GSTIN: {SAMPLE_FIELDS['GSTIN']}",
+    f"Agreement Value Amount: {SAMPLE_FIELDS['Agreement_Amount']}",
+    f"Brokerage @ 2% Amount: {SAMPLE_FIELDS['Brokerage_Amount']}",
+    f"CGST @ 9%: {SAMPLE_FIELDS['CGST']}",
+    f"SGST @ 9%: {SAMPLE_FIELDS['SGST']}",
+    f"Total Invoice Amount: {SAMPLE_FIELDS['Total_Invoice_Amount']}",
+    f"TDS u/s 194H @ 5%: {SAMPLE_FIELDS['TDS']}",
+]
+
+_warm_up_lock = threading.Lock()
+# Parts ("pdf", "ocr") already warmed up in this process; in thread mode both lanes share it
+_warmed_up: Set[str] = set()
+
+def sample_document() -> bytes:
+    """A one-page PDF of SAMPLE_LINES, on a page small enough to OCR in well under a second."""
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    page = doc.new_page(width=300, height=140)
+    page.insert_text((12, 18), "\n".join(SAMPLE_LINES), fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def _warm_up(parts: Set[str]) -> Dict[str, float]:
+    # Imported here: in process mode the API process only needs a reference to warm_up_worker
+    import fitz  # PyMuPDF
+
+    from service.ocr import warm_up_ocr
+    from service.preprocess import render_page_for_ocr
+
+    timings = {}
+    data = sample_document()
+    if "pdf" in parts:
+        _warm_up_pdf(data, timings)
+    if "ocr" not in parts:
+        return timings
+    start = time.perf_counter()
+    try:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            img = render_page_for_ocr(doc[0], settings.OCR_DPI)
+        warm_up_ocr(img, settings.OCR_DPI)
+        timings["ocr_ms"] = (time.perf_counter() - start) * 1000
+    except Exception as e:
+        logger.warning("OCR warm-up failed; scanned documents will pay for it on first use: %s", e)
+    return timings
+
+def _warm_up_pdf(data: bytes, timings: Dict[str, float]) -> None:
+    start = time.perf_counter()
+    extracted = process_invoice_from_bytes(data, "warmup.pdf")["extracted_fields"]
+    comparisons = {field: compare_field(value, extracted.get(field)) for field, value in SAMPLE_FIELDS.items()}
+    calculate_score(comparisons)
+    timings["extraction_ms"] = (time.perf_counter() - start) * 1000
+    mismatched = [field for field, comparison in comparisons.items() if comparison["result"] != "MATCH"]
+    if mismatched:
+        logger.warning("Warm-up sample did not extract as expected: %s", ', '.join(mismatched))
+
+def warm_up_worker(ocr: bool = True) -> None:
+    """
+    Run the embedded sample through the extraction path once in this process:
+    PyMuPDF, the field patterns, comparison and scoring, then (with `ocr`) the
+    OCR backend on every OCR thread. Used as the extraction pool initializer; later calls
+    in the same process only warm up what is still cold (the OCR backend, when the
+    fast lane's call came first). Never raises, so a failed warm-up cannot break the pool.
+    """
+    with _warm_up_lock:
+        parts = ({"pdf", "ocr"} if ocr else {"pdf"}) - _warmed_up
+        if not parts:
+            return
+        _warmed_up.update(parts)
+        try:
+            timings = _warm_up(parts)
+            logger.info("Extraction worker warmed up: %s", ', '.join(f'{k}={v:.0f}' for k, v in timings.items()))
+        except Exception as e:
+            logger.warning("Extraction worker warm-up failed: %s", e)
@@ -0,0 +1,75 @@
+"""
+Concurrency benchmark for the extraction executor.
+
+Pushes a batch of generated text PDFs through ExtractionExecutor with an
+increasing number of workers and reports throughput, speedup over a single
+worker and the worst event-loop stall observed while the batch was running.
+
+Usage:
+    python test/bench_concurrency.py [--docs 32] [--pages 40] [--mode process]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import build_document
+from service.executor import ExtractionExecutor
+from service.invoice_extractor import process_invoice_from_path
+
+async def run_batch(executor: ExtractionExecutor, paths: list) -> tuple:
+    max_lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal max_lag
+        interval = 0.01
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            max_lag = max(max_lag, time.perf_counter() - start - interval)
+
+    tick = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(executor.run(process_invoice_from_path, p) for p in paths))
+    elapsed = time.perf_counter() - start
+    done = True
+    await tick
+    return elapsed, max_lag
+
+async def main(args: argparse.Namespace) -> None:
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1))) if args.mode != "inline" else [1]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.docs):
+            path = os.path.join(tmp, f"invoice_{i}.pdf")
+            with open(path, "wb") as f:
+                f.write(build_document("text_pdf", args.pages, seed=i)[0])
+            paths.append(path)
+
+        print(f"{args.docs} docs x {args.pages} pages, mode={args.mode}, cores={cores}")
+        print(f"{'workers':>8} | {'seconds':>8} | {'docs/sec':>9} | {'speedup':>7} | {'max loop lag (ms)':>17}")
+        print("-" * 64)
+        baseline = None
+        for workers in worker_counts:
+            executor = ExtractionExecutor(mode=args.mode, max_workers=workers, queue_limit=0)
+            # Warm the pool so worker start-up is not counted
+            await asyncio.gather(*(executor.run(process_invoice_from_path, paths[0]) for _ in range(workers)))
+            elapsed, max_lag = await run_batch(executor, paths)
+            executor.shutdown()
+            throughput = args.docs / elapsed
+            baseline = baseline or throughput
+            print(f"{workers:>8} | {elapsed:>8.2f} | {throughput:>9.2f} | {throughput / baseline:>6.2f}x | {max_lag * 1000:>17.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=32)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--mode", choices=["inline", "thread", "process"], default="process")
+    asyncio.run(main(parser.parse_args()))
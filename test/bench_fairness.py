@@ -0,0 +1,93 @@
+"""
+Latency of a light caller while a heavy caller floods the OCR lane: FIFO versus fair queueing.
+
+A "heavy" caller keeps --flood scanned invoices queued in the OCR lane for
+--seconds while a "light" caller sends one scan every --interval seconds.
+Reports the light caller's p50/p95 latency and how the CPU-seconds of
+extraction were split between the two callers:
+    fifo  every job submitted as the same caller (arrival order)
+    fair  jobs submitted as their callers (service.executor.FairQueue)
+
+Needs Tesseract (C API or binary).
+
+Usage:
+    python test/bench_fairness.py [--seconds 20] [--interval 1.0] [--flood 8] [--workers 1] [--mode thread]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import settings
+from corpus import build_document
+from service.executor import ExtractionExecutor
+from service.invoice_extractor import process_invoice_from_bytes
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[int(fraction * (len(ordered) - 1))] if ordered else float("nan")
+
+async def measure(executor: ExtractionExecutor, fair: bool, scans: list, args: argparse.Namespace) -> dict:
+    cpu = {"heavy": 0.0, "light": 0.0}
+
+    async def extract(caller: str, index: int) -> None:
+        result = await executor.run(
+            process_invoice_from_bytes, scans[index % len(scans)], f"{caller}_{index}.pdf",
+            caller=caller if fair else "", cost=lambda r: r["cpu_seconds"],
+        )
+        cpu[caller] += result["cpu_seconds"]
+
+    stop = time.perf_counter() + args.seconds
+
+    async def flood(worker: int) -> None:
+        index = worker
+        while time.perf_counter() < stop:
+            await extract("heavy", index)
+            index += args.flood
+
+    flooders = [asyncio.create_task(flood(i)) for i in range(args.flood)]
+    await asyncio.sleep(1.0)  # Let the queue fill up
+    latencies = []
+    index = 0
+    while time.perf_counter() < stop:
+        start = time.perf_counter()
+        await extract("light", index)
+        latencies.append(time.perf_counter() - start)
+        index += 1
+        await asyncio.sleep(args.interval)
+    await asyncio.gather(*flooders)
+    return {"latencies": latencies, "cpu": cpu}
+
+async def main(args: argparse.Namespace) -> None:
+    scans = [build_document("image_pdf", 1, noise=0.2, seed=seed)[0] for seed in range(4)]
+    executor = ExtractionExecutor(mode=args.mode, max_workers=args.workers, queue_limit=0)
+    await executor.start()
+    # One scan per worker, so every worker has loaded its OCR model
+    await asyncio.gather(*(executor.run(process_invoice_from_bytes, scans[0], "warm.pdf") for _ in range(args.workers)))
+
+    print(
+        f"mode={args.mode}, cores={os.cpu_count()}, {args.workers} OCR workers x {settings.OCR_WORKERS} OCR threads, "
+        f"heavy caller keeps {args.flood} scans queued for {args.seconds:.0f}s, light caller sends one every {args.interval}s"
+    )
+    print(f"{'queue':<5} | {'light p50 ms':>12} | {'light p95 ms':>12} | {'light jobs':>10} | {'CPU s heavy/light':>17}")
+    print("-" * 69)
+    for name in ("fifo", "fair"):
+        r = await measure(executor, name == "fair", scans, args)
+        print(
+            f"{name:<5} | {statistics.median(r['latencies']) * 1000:>12.0f} | {percentile(r['latencies'], 0.95) * 1000:>12.0f} | "
+            f"{len(r['latencies']):>10} | {r['cpu']['heavy']:>8.1f}/{r['cpu']['light']:<8.1f}"
+        )
+    executor.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--interval", type=float, default=1.0, help="Pause between the light caller's scans")
+    parser.add_argument("--flood", type=int, default=8, help="Scans the heavy caller keeps in flight")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,168 @@
+"""
+Regression check and microbenchmark for field extraction.
+
+First verifies that `extract_fields` returns exactly what the original
+per-pattern implementation returns on a generated regression corpus, and
+that feeding the same texts page by page (split at random offsets) gives
+the same result as the joined text (exits with status 1 on any difference).
+Then times both implementations on long multi-page inputs.
+
+Usage:
+    python test/bench_field_extraction.py [--cases 2000] [--pages 10 100 300]
+"""
+import argparse
+import random
+import re
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import settings
+from service.field_extractor import field_extractor
+from service.invoice_extractor import extract_fields
+
+def extract_fields_reference(text: str) -> dict:
+    """The original implementation: one full-text regex scan per field."""
+    text = re.sub(r"\s+", " ", text)
+    extracted = {}
+    for key, pattern in settings.EXTRACTION_PATTERNS.items():
+        if key == "TDS":
+            matches = re.findall(pattern, text, re.IGNORECASE)
+            total_tds = 0.0
+            if matches:
+                for val in matches:
+                    try:
+                        clean_val = val.replace(",", "").replace("₹", "").replace("■", "").strip()
+                        total_tds += float(clean_val)
+                    except ValueError:
+                        continue
+                value = f"{total_tds:g}"
+            else:
+                value = None
+        else:
+            match = re.search(pattern, text, re.IGNORECASE)
+            value = match.group(1).strip() if match else None
+            if key == "CP_Name" and value and "," in value:
+                value = value.split(",")[0].strip()
+        extracted[key] = value
+    return extracted
+
+FIELD_LINES = [
+    lambda r: f"Channel Partner (Bill From){r.choice([':', ' -', '', ' : '])} {r.choice(['Sample Realty Partners', 'Acme Homes, Pune', 'Blue Brick LLP'])}",
+    lambda r: f"PAN{r.choice([':', ' -', ''])} {r.choice(['ABCDE1234F', 'PQRSX9876Z', 'abcde1234f', 'ABCD1234F'])}",
+    lambda r: f"GSTIN{r.choice([':', ''])} {r.choice(['27ABCDE1234F1Z5', '29PQRSX9876Z2ZA', '27ABCDE1234F0Z5'])}",
+    lambda r: f"Agreement Value{r.choice([' Amount', ''])}: {r.choice(['₹', '■', ''])}{r.randint(1, 9_999_999):,}.{r.randint(0, 99):02d}",
+    lambda r: f"{r.choice(['Commission', 'Brokerage'])} @ {r.choice(['2', '2.5', '3'])}% {r.choice(['Amount', 'Value', ''])}: {r.randint(1, 999_999):,}{r.choice(['', '.5', '.00'])}",
+    lambda r: f"CGST @ {r.choice(['9%', '18%'])}: {r.randint(1, 99_999):,}.{r.randint(0, 99):02d}",
+    lambda r: f"SGST @ 9% : ₹ {r.randint(1, 99_999):,}.{r.randint(0, 99):02d}",
+    lambda r: f"Total Invoice Amount: {r.randint(1, 9_999_999):,}.{r.randint(0, 99):02d}",
+    lambda r: f"TDS u/s 194H @ 5%: {r.randint(1, 99_999):,}{r.choice(['', '.25'])}",
+    lambda r: f"tds: {r.choice(['1,000', 'n/a', '12.5'])}",
+]
+
+NOISE = [
+    "PANEL discussion", "Sr No", "Address: Plot 4, Sector 21", "GSTINX", "Email: a@b.c", "CGSTN", "Total Invoice",
+    "Agreement Value pending", "Brokerage", "STDS", "Mob 9876543210", "Near City Mall", "Channel Partner",
+    "S.No 1", "Contact: Ravi", "Phase II", "Opp. Station", "\n\n", "\t", "  ",
+]
+
+def build_case(r: random.Random) -> str:
+    lines = [r.choice(FIELD_LINES)(r) for _ in range(r.randint(0, 14))]
+    lines += [r.choice(NOISE) for _ in range(r.randint(0, 10))]
+    r.shuffle(lines)
+    separators = ["\n", " ", "\n\n", "  \n"]
+    return "".join(line + r.choice(separators) for line in lines)
+
+def build_corpus(cases: int) -> list:
+    r = random.Random(1234)
+    corpus = [build_case(r) for _ in range(cases)]
+    corpus += [
+        "",
+        "Channel Partner (Bill From): " + "Very Long Name " * 200,
+        "x" * (settings.EXTRACTION_WINDOW - 10) + " PAN: ABCDE1234F",
+        "Agreement Value: " + " " * settings.EXTRACTION_WINDOW + "1,000.00",
+        "TDS: 1,00" + "0" * settings.EXTRACTION_WINDOW,
+        "TDS TDS: 5 TDS: 6.5 TDS: x",
+    ]
+    return corpus
+
+def build_long_text(pages: int) -> str:
+    """
+    A long invoice: header fields on page 1 (Agreement Value missing), followed
+    by annexure pages that keep mentioning PAN/GST/TDS labels without values.
+    """
+    r = random.Random(pages)
+    page_texts = []
+    for page_no in range(pages):
+        lines = [
+            f"Annexure {page_no + 1} line {i}: unit {r.randint(1, 999)} sold to buyer with PAN on record, "
+            f"GST and TDS as applicable, commission per schedule dated 01/04/2025"
+            for i in range(45)
+        ]
+        if page_no == 0:
+            lines = [f(r) for i, f in enumerate(FIELD_LINES[:9]) if i != 3] + lines
+        page_texts.append("\n".join(lines))
+    return "\n".join(page_texts)
+
+def check(corpus: list) -> int:
+    failures = 0
+    for i, text in enumerate(corpus):
+        expected = extract_fields_reference(text)
+        actual = extract_fields(text)
+        if expected != actual:
+            failures += 1
+            if failures <= 5:
+                print(f"MISMATCH in case {i}:\n  text: {text[:200]!r}\n  expected: {expected}\n  actual:   {actual}")
+    print(f"Regression corpus: {len(corpus)} cases, {failures} mismatches")
+    return failures
+
+def split_pages(text: str, r: random.Random) -> list:
+    cuts = sorted(r.sample(range(len(text) + 1), min(len(text) + 1, r.randint(0, 6))))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+def check_incremental(corpus: list) -> int:
+    r = random.Random(99)
+    failures = 0
+    for i, text in enumerate(corpus):
+        expected = extract_fields(text.strip())
+        pages = split_pages(text, r)
+        actual = field_extractor.extract_pages(pages)
+        if expected != actual:
+            failures += 1
+            if failures <= 5:
+                print(f"PAGE MISMATCH in case {i}:\n  pages: {[p[:60] for p in pages]!r}\n  expected: {expected}\n  actual:   {actual}")
+    print(f"Page-by-page extraction: {len(corpus)} cases, {failures} mismatches")
+    return failures
+
+def bench(func, text: str, repeat: int) -> float:
+    func(text)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(text)
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main(args: argparse.Namespace) -> int:
+    corpus = build_corpus(args.cases)
+    failures = check(corpus) + check_incremental(corpus + [build_long_text(pages) for pages in (3, 20)])
+
+    print(f"\n{'pages':>6} | {'chars':>9} | {'reference (ms)':>14} | {'engine (ms)':>11} | {'speedup':>7}")
+    print("-" * 60)
+    for pages in args.pages:
+        text = build_long_text(pages)
+        if extract_fields(text) != extract_fields_reference(text):
+            print(f"MISMATCH on {pages}-page text")
+            failures += 1
+        repeat = max(3, 300 // pages)
+        reference = bench(extract_fields_reference, text, repeat)
+        engine = bench(extract_fields, text, repeat)
+        print(f"{pages:>6} | {len(text):>9} | {reference:>14.2f} | {engine:>11.2f} | {reference / engine:>6.1f}x")
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=2000)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 300])
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,79 @@
+"""
+Benchmark of the temp-file request path versus the in-memory pipeline.
+
+The temp-file path reproduces what InvoiceService used to do per request:
+write the decoded blob to a directory, extract from the path, write the
+output JSON and delete both files. Point --dir at the mounted input volume
+to include its fsync behaviour.
+
+Usage:
+    python test/bench_inmemory.py [--docs 50] [--pages 2] [--dir input_pdfs] [--fsync]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import build_document
+from service.invoice_extractor import process_invoice_from_bytes, process_invoice_from_path
+
+def via_temp_files(data: bytes, directory: str, fsync: bool) -> None:
+    name = f"blob_{uuid.uuid4().hex}"
+    file_path = os.path.join(directory, f"{name}.pdf")
+    output_path = os.path.join(directory, f"{name}.json")
+    with open(file_path, "wb") as f:
+        f.write(data)
+        if fsync:
+            os.fsync(f.fileno())
+    result = process_invoice_from_path(file_path)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result["extracted_fields"], f, indent=2, ensure_ascii=False)
+        if fsync:
+            os.fsync(f.fileno())
+    os.remove(file_path)
+    os.remove(output_path)
+
+def via_memory(data: bytes) -> None:
+    process_invoice_from_bytes(data, "blob.pdf")
+
+def measure(func, docs: int) -> list:
+    latencies = []
+    for _ in range(docs):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def report(label: str, latencies: list) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"{label:12} | mean {statistics.mean(latencies):8.2f} ms | p50 {statistics.median(latencies):8.2f} ms | p95 {p95:8.2f} ms")
+
+def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        data, _ = build_document("text_pdf", args.pages)
+
+        directory = args.dir or tmp
+        os.makedirs(directory, exist_ok=True)
+        print(f"{args.docs} requests, {args.pages}-page PDF ({len(data)} bytes), temp dir={directory}, fsync={args.fsync}")
+
+        # Warm up both paths once
+        via_temp_files(data, directory, args.fsync)
+        via_memory(data)
+
+        report("temp files", measure(lambda: via_temp_files(data, directory, args.fsync), args.docs))
+        report("in-memory", measure(lambda: via_memory(data), args.docs))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=2)
+    parser.add_argument("--dir", default=None, help="Directory for temp files (defaults to a temporary directory)")
+    parser.add_argument("--fsync", action="store_true", help="fsync temp files as a durable volume would")
+    main(parser.parse_args())
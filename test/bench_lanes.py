@@ -0,0 +1,108 @@
+"""
+Text-document latency during scan-heavy bursts: two lanes versus one queue.
+
+Keeps --scan-concurrency image-only invoices in flight for --seconds while
+sending a text PDF every --interval seconds, and reports the text PDFs'
+p50/p95 latency next to their latency on an idle service, plus how many
+scans completed and how many were shed (QueueFullError):
+    single  every document through one ExtractionExecutor (the old path)
+    lanes   service.invoice_service.extract_in_lanes (fast and OCR lanes)
+
+Needs Tesseract (C API or binary).
+
+Usage:
+    python test/bench_lanes.py [--seconds 20] [--interval 0.25] [--scan-concurrency 8] [--mode process]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import settings
+from corpus import build_document
+from service.executor import LANES, ExtractionExecutor, QueueFullError, get_extraction_executor, shutdown_extraction_executor
+from service.invoice_extractor import process_invoice_from_bytes
+from service.invoice_service import extract_in_lanes
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[int(fraction * (len(ordered) - 1))] if ordered else float("nan")
+
+async def measure(extract, text_pdf: bytes, scans: list, args: argparse.Namespace) -> dict:
+    async def text_latency() -> float:
+        start = time.perf_counter()
+        await extract(text_pdf, "text.pdf")
+        return time.perf_counter() - start
+
+    idle = [await text_latency() for _ in range(10)]
+
+    stop = time.perf_counter() + args.seconds
+    completed = shed = 0
+
+    async def scan_loop(worker: int) -> None:
+        nonlocal completed, shed
+        index = worker
+        while time.perf_counter() < stop:
+            try:
+                await extract(scans[index % len(scans)], f"scan_{index}.pdf")
+                completed += 1
+            except QueueFullError as e:
+                shed += 1
+                await asyncio.sleep(min(e.retry_after, 0.5))
+            index += args.scan_concurrency
+
+    scanners = [asyncio.create_task(scan_loop(i)) for i in range(args.scan_concurrency)]
+    await asyncio.sleep(1.0)  # Let the burst build up
+    busy = []
+    while time.perf_counter() < stop:
+        busy.append(await text_latency())
+        await asyncio.sleep(args.interval)
+    await asyncio.gather(*scanners)
+    return {"idle": idle, "busy": busy, "completed": completed, "shed": shed}
+
+async def main(args: argparse.Namespace) -> None:
+    settings.EXECUTION_MODE = args.mode
+    text_pdf = build_document("text_pdf", 1, noise=0.2, seed=1)[0]
+    scans = [build_document("image_pdf", 1, noise=0.2, seed=seed)[0] for seed in range(4)]
+
+    single = ExtractionExecutor(max_workers=settings.EXTRACTION_WORKERS, queue_limit=settings.EXTRACTION_QUEUE_LIMIT)
+
+    async def single_extract(data: bytes, name: str):
+        return await single.run(process_invoice_from_bytes, data, name)
+
+    async def lanes_extract(data: bytes, name: str):
+        return await extract_in_lanes(data, name, None, False)
+
+    await single.start()
+    await asyncio.gather(*(get_extraction_executor(lane).start() for lane in LANES))
+    # One scan per worker, so every worker has loaded its OCR model
+    await asyncio.gather(*(single_extract(scans[0], "warm.pdf") for _ in range(single.max_workers)))
+    await asyncio.gather(*(lanes_extract(scans[0], "warm.pdf") for _ in range(settings.OCR_LANE_WORKERS)))
+
+    print(
+        f"mode={args.mode}, cores={os.cpu_count()}, {args.scan_concurrency} scans in flight for {args.seconds:.0f}s, "
+        f"single queue: {single.max_workers} workers; lanes: fast {settings.FAST_LANE_WORKERS}, "
+        f"OCR {settings.OCR_LANE_WORKERS} (nice +{settings.OCR_LANE_NICE})"
+    )
+    print(f"{'scheduler':<9} | {'idle p50 ms':>11} | {'busy p50 ms':>11} | {'busy p95 ms':>11} | {'scans done':>10} | {'shed':>5}")
+    print("-" * 73)
+    for name, extract in (("single", single_extract), ("lanes", lanes_extract)):
+        r = await measure(extract, text_pdf, scans, args)
+        print(
+            f"{name:<9} | {statistics.median(r['idle']) * 1000:>11.1f} | {statistics.median(r['busy']) * 1000:>11.1f} | "
+            f"{percentile(r['busy'], 0.95) * 1000:>11.1f} | {r['completed']:>10} | {r['shed']:>5}"
+        )
+    single.shutdown()
+    shutdown_extraction_executor()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--interval", type=float, default=0.25, help="Pause between text PDFs during the burst")
+    parser.add_argument("--scan-concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=["thread", "process"], default="process")
+    asyncio.run(main(parser.parse_args()))
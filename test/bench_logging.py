@@ -0,0 +1,110 @@
+"""
+Cost of logging on the request path: a synchronous stdout handler versus the queued handler.
+
+Logs --count INFO records from --threads threads into a stream that takes
+--write-us microseconds per write (a slow pipe or terminal) and reports the
+time each logging call takes on the calling thread (p50/p99):
+    sync   logging.StreamHandler, formatting and writing in the calling thread
+           (the handler setup_logger used to attach)
+    queue  core.logger's queue handler; a background thread formats and writes
+Also reports what a DEBUG call costs while DEBUG is disabled, with the message
+built eagerly (f-string) and lazily (%-style arguments).
+
+Usage:
+    python test/bench_logging.py [--count 20000] [--threads 4] [--write-us 50]
+"""
+import argparse
+import io
+import logging
+import logging.handlers
+import os
+import queue
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.logger import NonBlockingQueueHandler, RequestContextFilter
+
+class SlowStream(io.StringIO):
+    """A stream whose writes take `delay` seconds, like a slow pipe."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        return len(text)
+
+def stream_handler(delay: float) -> logging.Handler:
+    handler = logging.StreamHandler(SlowStream(delay))
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    return handler
+
+def timed_calls(logger: logging.Logger, count: int, threads: int) -> list:
+    latencies = [[] for _ in range(threads)]
+    fields = {"PAN": "ABCDE1234F", "GSTIN": "27ABCDE1234F1Z5", "Total_Invoice_Amount": "118,000.00"}
+
+    def worker(slot: int) -> None:
+        for index in range(slot, count, threads):
+            start = time.perf_counter()
+            logger.info("Processed document %s: %s", index, fields)
+            latencies[slot].append(time.perf_counter() - start)
+
+    pool = [threading.Thread(target=worker, args=(slot,)) for slot in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sorted(latency for slot in latencies for latency in slot)
+
+def bench(name: str, handler: logging.Handler, args: argparse.Namespace) -> list:
+    logger = logging.getLogger(f"bench.{name}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return timed_calls(logger, args.count, args.threads)
+
+def disabled_debug_ns(lazy: bool, calls: int = 200000) -> float:
+    logger = logging.getLogger("bench.disabled")
+    logger.setLevel(logging.INFO)
+    text = "x" * 2000
+    start = time.perf_counter()
+    if lazy:
+        for index in range(calls):
+            logger.debug("Extracted %s characters from page %s", len(text), index)
+    else:
+        for index in range(calls):
+            logger.debug(f"Extracted {len(text)} characters from page {index}")
+    return (time.perf_counter() - start) / calls * 1e9
+
+def main(args: argparse.Namespace) -> None:
+    delay = args.write_us / 1e6
+    print(f"{args.count} records from {args.threads} threads, {args.write_us:.0f} us per write, cores={os.cpu_count()}")
+    print(f"{'handler':<7} | {'p50 us':>8} | {'p99 us':>8} | {'dropped':>7}")
+    print("-" * 40)
+    latencies = bench("sync", stream_handler(delay), args)
+    print(f"{'sync':<7} | {statistics.median(latencies) * 1e6:>8.1f} | {latencies[int(0.99 * (len(latencies) - 1))] * 1e6:>8.1f} | {0:>7}")
+
+    log_queue: queue.Queue = queue.Queue(maxsize=args.queue_size)
+    listener = logging.handlers.QueueListener(log_queue, stream_handler(delay))
+    listener.start()
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter(1.0))
+    latencies = bench("queue", handler, args)
+    dropped = handler.dropped
+    listener.stop()
+    print(f"{'queue':<7} | {statistics.median(latencies) * 1e6:>8.1f} | {latencies[int(0.99 * (len(latencies) - 1))] * 1e6:>8.1f} | {dropped:>7}")
+
+    print(f"disabled DEBUG call: f-string {disabled_debug_ns(False):.0f} ns, lazy {disabled_debug_ns(True):.0f} ns")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--write-us", type=float, default=50.0, help="Time each write to the stream takes")
+    parser.add_argument("--queue-size", type=int, default=10000)
+    main(parser.parse_args())
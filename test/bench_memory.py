@@ -0,0 +1,206 @@
+"""
+Peak-memory benchmarks.
+
+Scenarios:
+    upload  Peak Python memory to ingest one document of --mb megabytes via
+            the base64-in-JSON request versus the raw binary upload path
+            (body read in 64 KiB chunks, as the ASGI server delivers it),
+            with and without a Content-Length header.
+    pages   Peak Python memory and run time to extract a --pages page text
+            PDF the old way (text += page, full text kept, fields extracted
+            from the joined text) versus the page generator feeding the
+            field accumulator, with and without include_text.
+    ocr     Peak RSS growth (sampled from /proc/self/statm in a fresh
+            process per run) and run time to extract a --pages page scanned
+            PDF, unbounded versus with MEMORY_BUDGET_MB=--budget. With
+            --no-tesseract (automatic when Tesseract is missing) the OCR
+            call itself is skipped, leaving render and preprocessing.
+
+Usage:
+    python test/bench_memory.py upload [--mb 20 50]
+    python test/bench_memory.py pages [--pages 50 200 500]
+    python test/bench_memory.py ocr [--pages 10 50 100] [--budget 150] [--dpi 300] [--no-tesseract]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+
+from corpus import build_document
+from schemas.invoice import InvoiceExtractionRequest
+from service.field_extractor import field_extractor
+from service.invoice_extractor import process_invoice_from_bytes
+from service.invoice_service import decode_base64_blob
+from service.upload import read_capped
+
+CHUNK_SIZE = 64 * 1024
+
+def measure_peak(func) -> tuple:
+    """Run `func` and return (result size, peak traced bytes)."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(result), peak
+
+async def measure_peak_async(coro_func) -> tuple:
+    """Async variant; tracing starts inside the running loop so loop set-up is not counted."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = await coro_func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(result), peak
+
+def chunked(payload: bytes):
+    view = memoryview(payload)
+    for offset in range(0, len(view), CHUNK_SIZE):
+        yield bytes(view[offset:offset + CHUNK_SIZE])
+
+def ingest_json(payload: bytes) -> bytes:
+    body = b"".join(chunked(payload))  # The JSON body is buffered whole before validation
+    request = InvoiceExtractionRequest.model_validate_json(body)
+    del body
+    return decode_base64_blob(request.blob_64)
+
+async def ingest_raw(payload: bytes, content_length: bool) -> bytes:
+    async def stream():
+        for chunk in chunked(payload):
+            yield chunk
+    return await read_capped(stream(), max_bytes=len(payload), expected_size=len(payload) if content_length else None)
+
+def scenario_upload(args: argparse.Namespace) -> None:
+    print(f"{'document':>9} | {'json+base64':>12} | {'raw':>9} | {'raw, chunked':>12}")
+    print("-" * 52)
+    for mb in args.mb:
+        document = b"%PDF-1.7\n" + os.urandom(mb * 1024 * 1024)
+        json_payload = json.dumps({"blob_64": base64.b64encode(document).decode("ascii"), "PAN": "ABCDE1234F"}).encode()
+        size_json, peak_json = measure_peak(lambda: ingest_json(json_payload))
+        size_raw, peak_raw = asyncio.run(measure_peak_async(lambda: ingest_raw(document, True)))
+        size_chunked, peak_chunked = asyncio.run(measure_peak_async(lambda: ingest_raw(document, False)))
+        assert size_json == size_raw == size_chunked == len(document)
+        print(f"{mb:>6} MB | {peak_json / 2**20:>9.1f} MB | {peak_raw / 2**20:>6.1f} MB | {peak_chunked / 2**20:>9.1f} MB")
+
+def extract_concatenated(data: bytes) -> dict:
+    """The pre-generator pipeline: quadratic text building and the full text in the result."""
+    text = ""
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for page in doc:
+            text += page.get_text()
+    text = text.strip()
+    return {"extracted_fields": field_extractor.extract(text), "full_text": text}
+
+def scenario_pages(args: argparse.Namespace) -> None:
+    print(f"{'pages':>6} | {'text chars':>10} | {'concatenated':>17} | {'generator':>17} | {'generator + text':>17}")
+    print("-" * 80)
+    for pages in args.pages:
+        data, _ = build_document("text_pdf", pages, noise=0.2)
+        runs = {}
+        for name, func in (
+            ("concatenated", lambda: extract_concatenated(data)),
+            ("generator", lambda: process_invoice_from_bytes(data, "bench.pdf")),
+            ("generator + text", lambda: process_invoice_from_bytes(data, "bench.pdf", include_text=True)),
+        ):
+            start = time.perf_counter()
+            _, peak = measure_peak(func)
+            runs[name] = (peak, time.perf_counter() - start)
+        chars = len(extract_concatenated(data)["full_text"])
+        cells = " | ".join(f"{peak / 2**20:>6.2f} MB {seconds * 1000:>5.0f} ms" for peak, seconds in runs.values())
+        print(f"{pages:>6} | {chars:>10} | {cells}")
+
+def ocr_child(args: argparse.Namespace) -> None:
+    """One measured run in this (fresh) process; prints a JSON result line."""
+    from core.config import settings
+    from service import ocr
+    from service.memory import current_rss
+
+    settings.MEMORY_BUDGET_MB = args.budget
+    settings.OCR_DPI = args.dpi
+    if args.no_tesseract:
+        ocr.ocr_image_with_confidence = lambda img, dpi=None, with_confidence=True: ("", -1)
+    with open(args.file, "rb") as f:
+        data = f.read()
+
+    baseline = current_rss()
+    peak = baseline
+    running = True
+
+    def sample() -> None:
+        nonlocal peak
+        while running:
+            peak = max(peak, current_rss())
+            time.sleep(0.005)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    result = process_invoice_from_bytes(data, "bench.pdf")
+    seconds = time.perf_counter() - start
+    running = False
+    sampler.join()
+    read = sum(1 for method in result["page_methods"] if method != "skipped")
+    print(json.dumps({"peak_mb": (peak - baseline) / 2**20, "seconds": seconds, "pages_read": read}))
+
+def tesseract_available() -> bool:
+    from service.ocr import ocr_backend
+    if ocr_backend() == "capi":
+        return True
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def scenario_ocr(args: argparse.Namespace) -> None:
+    no_tesseract = args.no_tesseract or not tesseract_available()
+    print(f"Scanned PDFs at {args.dpi} dpi, budget {args.budget} MB" + (", OCR call skipped" if no_tesseract else ""))
+    print(f"{'pages':>6} | {'unbounded':>22} | {'budget':>22} | {'pages read':>10}")
+    print("-" * 71)
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            path = os.path.join(tmp, f"scan_{pages}.pdf")
+            with open(path, "wb") as f:
+                f.write(build_document("image_pdf", pages, noise=0.2)[0])
+            runs = []
+            for budget in (0, args.budget):
+                command = [sys.executable, os.path.abspath(__file__), "_ocr_child", "--file", path, "--budget", str(budget), "--dpi", str(args.dpi)]
+                if no_tesseract:
+                    command.append("--no-tesseract")
+                output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            cells = " | ".join(f"{r['peak_mb']:>7.1f} MB {r['seconds']:>8.1f} s" for r in runs)
+            print(f"{pages:>6} | {cells} | {runs[1]['pages_read']:>4}/{pages:<5}")
+
+SCENARIOS = {
+    "upload": scenario_upload,
+    "pages": scenario_pages,
+    "ocr": scenario_ocr,
+    "_ocr_child": ocr_child,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--mb", type=int, nargs="+", default=[20, 50])
+    parser.add_argument("--pages", type=int, nargs="+", default=None, help="Default: 50 200 500 (pages), 10 50 100 (ocr)")
+    parser.add_argument("--budget", type=int, default=150, help="MEMORY_BUDGET_MB for the bounded ocr runs")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--no-tesseract", action="store_true")
+    parser.add_argument("--file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.pages is None:
+        args.pages = [10, 50, 100] if args.scenario == "ocr" else [50, 200, 500]
+    SCENARIOS[args.scenario](args)
@@ -0,0 +1,103 @@
+"""
+Per-page OCR latency: pytesseract (one tesseract process per page) versus
+the Tesseract C API backend (a warm libtesseract handle per OCR thread).
+
+Renders the pages of generated image-only invoices once, then for every
+available backend reports sequential per-page latency (p50/p95), pool
+throughput with --workers threads and how many invoice fields were read
+correctly. Backends that are not installed are skipped.
+
+Usage:
+    python test/bench_ocr.py [--docs 3] [--pages 2] [--workers 4] [--dpi 300]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+import pytesseract
+
+from core.config import settings
+from corpus import FIELDS, build_document
+from service.comparison import compare_field
+from service.field_extractor import field_extractor
+from service.ocr import render_page_gray
+from service.tesseract import load_library, thread_api
+
+def pytesseract_page(img) -> str:
+    return pytesseract.image_to_string(img, lang=settings.OCR_LANG)
+
+def capi_page(img) -> str:
+    return thread_api().image_to_string(img)
+
+def available_backends() -> dict:
+    backends = {}
+    try:
+        pytesseract.get_tesseract_version()
+        backends["pytesseract"] = pytesseract_page
+    except Exception:
+        print("pytesseract: skipped (tesseract binary not found)")
+    if load_library() is not None:
+        backends["capi"] = capi_page
+    else:
+        print("capi: skipped (libtesseract not found; set TESSERACT_LIBRARY)")
+    return backends
+
+def render_corpus(docs: int, pages: int, dpi: int) -> list:
+    """[(images of one document, expected fields)] for `docs` scanned invoices."""
+    corpus = []
+    for seed in range(docs):
+        data, fields = build_document("image_pdf", pages, noise=0.2, seed=seed)
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            corpus.append(([render_page_gray(page, dpi) for page in doc], fields))
+    return corpus
+
+def main(args: argparse.Namespace) -> None:
+    backends = available_backends()
+    if not backends:
+        return
+    corpus = render_corpus(args.docs, args.pages, args.dpi)
+    images = [img for doc_images, _ in corpus for img in doc_images]
+    print(f"{len(images)} pages at {args.dpi} dpi, {args.workers} pool workers")
+    print(f"{'backend':<12} | {'p50 ms':>8} | {'p95 ms':>8} | {'pool pages/sec':>14} | {'fields read':>11}")
+    print("-" * 66)
+
+    for name, ocr in backends.items():
+        ocr(images[0])  # Warm-up (loads the model for the C API)
+        latencies = []
+        for img in images:
+            start = time.perf_counter()
+            ocr(img)
+            latencies.append(time.perf_counter() - start)
+
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(ocr, images[:args.workers]))  # Warm every pool thread
+            start = time.perf_counter()
+            texts = list(pool.map(ocr, images))
+            throughput = len(images) / (time.perf_counter() - start)
+
+        matched = 0
+        offset = 0
+        for doc_images, fields in corpus:
+            extracted = field_extractor.extract_pages(text + "\n" for text in texts[offset:offset + len(doc_images)])
+            offset += len(doc_images)
+            matched += sum(compare_field(fields[f], extracted[f])["result"] == "MATCH" for f in FIELDS)
+
+        p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))]
+        print(
+            f"{name:<12} | {statistics.median(latencies) * 1000:>8.1f} | {p95 * 1000:>8.1f} | "
+            f"{throughput:>14.2f} | {matched:>5}/{len(corpus) * len(FIELDS):<5}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--dpi", type=int, default=settings.OCR_DPI)
+    main(parser.parse_args())
@@ -0,0 +1,99 @@
+"""
+OCR image preprocessing and adaptive DPI: speed versus field accuracy.
+
+OCRs generated image-only invoices (some of them skewed) through
+service.ocr.ocr_pages under several configurations and reports, for each,
+the per-page render/preprocess and Tesseract time, how many pages had to be
+re-rendered at full DPI and how many invoice fields were read correctly:
+    raw           no preprocessing, OCR_DPI
+    preprocessed  deskew + trim, OCR_DPI
+    bilevel       deskew + trim, binarised image (OCR_BILEVEL), OCR_DPI
+    low_dpi       deskew + trim, --low-dpi only
+    adaptive      --low-dpi first, OCR_DPI when confidence < --min-confidence
+
+Needs Tesseract (C API or binary); the preprocessed rows need numpy.
+
+Usage:
+    python test/bench_preprocess.py [--docs 6] [--skew 3] [--low-dpi 150] [--min-confidence 80]
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+
+from core.config import settings
+from core.metrics import StageTimer
+from corpus import FIELDS, build_image_pdf, generate_fields, page_lines
+from service.comparison import compare_field
+from service.field_extractor import field_extractor
+from service.ocr import ocr_pages
+from service.preprocess import np
+
+def build_scans(docs: int, skew: float) -> list:
+    """[(image-only PDF bytes, expected fields)]; every other document is skewed."""
+    scans = []
+    for seed in range(docs):
+        rng = random.Random(f"preprocess-{seed}")
+        fields = generate_fields(rng)
+        data = build_image_pdf(page_lines(fields, 1, 0.2, rng), skew=skew if seed % 2 else 0.0, seed=seed)
+        scans.append((data, fields))
+    return scans
+
+def run(scans: list, preprocess: bool, bilevel: bool, low_dpi: int, min_confidence: int) -> dict:
+    settings.OCR_PREPROCESS = preprocess
+    settings.OCR_BILEVEL = bilevel
+    settings.OCR_LOW_DPI = low_dpi
+    settings.OCR_MIN_CONFIDENCE = min_confidence
+    timer = StageTimer()
+    pages = matched = 0
+    for data, fields in scans:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            texts = ocr_pages(doc, timer=timer)
+            pages += doc.page_count
+        extracted = field_extractor.extract_pages(text + "\n" for text in texts)
+        matched += sum(compare_field(fields[f], extracted[f])["result"] == "MATCH" for f in FIELDS)
+    renders = [seconds for stage, seconds in timer.spans if stage == "ocr_render"]
+    tesseract = [seconds for stage, seconds in timer.spans if stage == "ocr_tesseract"]
+    return {
+        "render_ms": sum(renders) / pages * 1000,
+        "tesseract_ms": sum(tesseract) / pages * 1000,
+        "rerendered": len(renders) - pages,
+        "matched": matched,
+        "fields": len(scans) * len(FIELDS),
+    }
+
+def main(args: argparse.Namespace) -> None:
+    scans = build_scans(args.docs, args.skew)
+    configs = {"raw": (False, False, 0, 0)}
+    if np is None:
+        print("preprocessed, bilevel, low_dpi, adaptive: skipped (numpy is not installed)")
+    else:
+        configs.update({
+            "preprocessed": (True, False, 0, 0),
+            "bilevel": (True, True, 0, 0),
+            "low_dpi": (True, False, args.low_dpi, 0),
+            "adaptive": (True, False, args.low_dpi, args.min_confidence),
+        })
+
+    ocr_pages(fitz.open(stream=scans[0][0], filetype="pdf"))  # Warm up the OCR pool
+    print(f"{args.docs} scans (odd ones skewed up to {args.skew} deg), OCR_DPI={settings.OCR_DPI}, low DPI={args.low_dpi}")
+    print(f"{'config':<13} | {'render ms/page':>14} | {'tesseract ms/page':>17} | {'re-rendered':>11} | {'fields read':>11}")
+    print("-" * 79)
+    for name, (preprocess, bilevel, low_dpi, min_confidence) in configs.items():
+        r = run(scans, preprocess, bilevel, low_dpi, min_confidence)
+        print(
+            f"{name:<13} | {r['render_ms']:>14.1f} | {r['tesseract_ms']:>17.1f} | "
+            f"{r['rerendered']:>11} | {r['matched']:>5}/{r['fields']:<5}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=6)
+    parser.add_argument("--skew", type=float, default=3.0, help="Maximum rotation of the skewed scans, in degrees")
+    parser.add_argument("--low-dpi", type=int, default=150)
+    parser.add_argument("--min-confidence", type=int, default=settings.OCR_MIN_CONFIDENCE)
+    main(parser.parse_args())
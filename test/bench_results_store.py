@@ -0,0 +1,113 @@
+"""
+Cost of keeping results on the request path: a JSON file per request versus the results store.
+
+Records --count responses from --threads threads, the way concurrent
+requests would, and reports the time each recording takes on the request
+thread (p50/p99), plus how long the results take to reach disk:
+    file   json.dump(indent=2) to a file per request, then os.remove (the
+           per-request write the service used to do)
+    store  service.results_store.ResultsStore.record(); a background thread
+           commits batches to the day's SQLite segment
+
+Usage:
+    python test/bench_results_store.py [--count 5000] [--threads 8] [--dir /tmp/results-bench]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service.results_store import ResultsStore
+
+FIELDS = ("CP_Name", "PAN", "GSTIN", "Agreement_Amount", "Brokerage_Amount", "CGST", "SGST", "Total_Invoice_Amount", "TDS")
+
+def sample_response(index: int) -> dict:
+    return {
+        "comparisons": {field: {"expected": f"{field}-{index}", "actual": f"{field}-{index}", "result": "MATCH"} for field in FIELDS},
+        "score": "100",
+        "remarks": "Invoice validation resulted in a score of 100.",
+        "recommendedAction": "AUTO APPROVE",
+        "extractionMethod": "PyMuPDF",
+        "pageMethods": ["text"],
+        "extractionTruncated": False,
+    }
+
+def run_threads(record, count: int, threads: int) -> list:
+    latencies = [[] for _ in range(threads)]
+
+    def worker(slot: int) -> None:
+        for index in range(slot, count, threads):
+            start = time.perf_counter()
+            record(index)
+            latencies[slot].append(time.perf_counter() - start)
+
+    pool = [threading.Thread(target=worker, args=(slot,)) for slot in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return [latency for slot in latencies for latency in slot]
+
+def bench_files(directory: str, count: int, threads: int) -> tuple:
+    os.makedirs(directory, exist_ok=True)
+
+    def record(index: int) -> None:
+        path = os.path.join(directory, f"blob_{index}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"file_name": f"blob_{index}.pdf", "extracted_data": sample_response(index)}, f, indent=2, ensure_ascii=False)
+        os.remove(path)
+
+    start = time.perf_counter()
+    latencies = run_threads(record, count, threads)
+    return latencies, time.perf_counter() - start
+
+def bench_store(directory: str, count: int, threads: int) -> tuple:
+    store = ResultsStore(directory=directory, retention_days=0, queue_limit=0)
+
+    def record(index: int) -> None:
+        response = sample_response(index)
+        store.record(
+            document_hash=f"{index:064x}", document_type="pdf", size_bytes=1024, caller="bench",
+            score=response["score"], recommended_action=response["recommendedAction"],
+            extraction_method=response["extractionMethod"], cache_hit=False, response=json.dumps(response),
+        )
+
+    start = time.perf_counter()
+    latencies = run_threads(record, count, threads)
+    store.close()  # Waits until everything is committed
+    elapsed = time.perf_counter() - start
+    stats = store.stats()
+    assert stats["written"] == count, stats
+    return latencies, elapsed, stats["batches"]
+
+def main(args: argparse.Namespace) -> None:
+    shutil.rmtree(args.dir, ignore_errors=True)
+    print(f"{args.count} results from {args.threads} threads, cores={os.cpu_count()}")
+    print(f"{'method':<6} | {'p50 us':>8} | {'p99 us':>8} | {'on disk after s':>15} | {'transactions':>12}")
+    print("-" * 62)
+    latencies, elapsed = bench_files(os.path.join(args.dir, "files"), args.count, args.threads)
+    ordered = sorted(latencies)
+    print(
+        f"{'file':<6} | {statistics.median(ordered) * 1e6:>8.0f} | {ordered[int(0.99 * (len(ordered) - 1))] * 1e6:>8.0f} | "
+        f"{elapsed:>15.2f} | {args.count:>12}"
+    )
+    latencies, elapsed, batches = bench_store(os.path.join(args.dir, "store"), args.count, args.threads)
+    ordered = sorted(latencies)
+    print(
+        f"{'store':<6} | {statistics.median(ordered) * 1e6:>8.0f} | {ordered[int(0.99 * (len(ordered) - 1))] * 1e6:>8.0f} | "
+        f"{elapsed:>15.2f} | {batches:>12}"
+    )
+    shutil.rmtree(args.dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--dir", default="/tmp/results-bench")
+    main(parser.parse_args())
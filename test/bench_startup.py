@@ -0,0 +1,120 @@
+"""
+Startup time of the API process and of extraction workers, with a budget.
+
+Each target is imported in a fresh interpreter under `python -X importtime`,
+--runs times; the median import time is reported along with the slowest
+direct imports of the target. Targets:
+    main                       what uvicorn loads for every API worker
+    service.invoice_extractor  what a spawned extraction worker loads before
+                               its first document
+It then reports what each format backend adds on first use (PyMuPDF for
+PDFs, python-docx, Pillow/numpy/Tesseract for OCR).
+
+Exits non-zero when a target's median exceeds its budget or when importing
+it loads any of the heavy backends (HEAVY_MODULES), which must only be
+imported on first use of their format.
+
+Usage:
+    python test/bench_startup.py [--runs 5] [--budget-ms 1000] [--worker-budget-ms 250] [--top 8]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Backends that importing the app or a worker must not load
+HEAVY_MODULES = ("fitz", "pymupdf", "docx", "PIL", "numpy", "pytesseract", "service.ocr")
+
+# Format backend -> what its first use imports
+BACKENDS = {
+    "pdf (PyMuPDF)": "import fitz",
+    "docx (python-docx)": "import docx",
+    "ocr (Pillow, numpy, Tesseract)": "import service.ocr",
+    "pytesseract fallback": "import pytesseract",
+}
+
+def import_profile(code: str) -> list:
+    """
+    Run `code` in a fresh interpreter under -X importtime.
+    Returns [(depth, module, self_us, cumulative_us)] in the order Python reports them.
+    """
+    env = dict(os.environ, PYTHONWARNINGS="ignore", LOG_LEVEL="WARNING")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+def loaded_heavy_modules(target: str) -> list:
+    code = f"import sys, {target}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    env = dict(os.environ, PYTHONWARNINGS="ignore", LOG_LEVEL="WARNING")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+def profile_target(target: str, runs: int, top: int) -> dict:
+    totals, children = [], {}
+    for _ in range(runs):
+        # A module is reported after its imports, which are listed one level deeper just before it
+        direct = []
+        for depth, name, _, cumulative in import_profile(f"import {target}"):
+            if depth == 1:
+                direct.append((name, cumulative))
+            elif depth == 0:
+                if name == target:
+                    totals.append(cumulative / 1000)
+                    for child, child_cumulative in direct:
+                        children.setdefault(child, []).append(child_cumulative / 1000)
+                direct = []
+    slowest = sorted(((statistics.median(ms), name) for name, ms in children.items()), reverse=True)[:top]
+    return {"median_ms": statistics.median(totals), "max_ms": max(totals), "slowest": slowest}
+
+def backend_cost(statement: str, runs: int) -> float:
+    """Median ms that `statement` adds once the extraction worker module is loaded."""
+    costs = []
+    for _ in range(runs):
+        rows = import_profile(f"import service.invoice_extractor; {statement}")
+        module = statement.split()[-1]
+        costs.append(next((cumulative for depth, name, _, cumulative in rows if depth == 0 and name == module), 0) / 1000)
+    return statistics.median(costs)
+
+def main(args: argparse.Namespace) -> int:
+    failures = []
+    for target, budget in (("main", args.budget_ms), ("service.invoice_extractor", args.worker_budget_ms)):
+        r = profile_target(target, args.runs, args.top)
+        heavy = loaded_heavy_modules(target)
+        print(f"import {target}: median {r['median_ms']:.0f} ms, max {r['max_ms']:.0f} ms (budget {budget} ms, {args.runs} runs)")
+        for ms, name in r["slowest"]:
+            print(f"    {ms:>8.1f} ms  {name}")
+        if r["median_ms"] > budget:
+            failures.append(f"import {target} took {r['median_ms']:.0f} ms > {budget} ms")
+        if heavy:
+            failures.append(f"import {target} loads {', '.join(heavy)}; import them on first use instead")
+        print()
+
+    print("First use of each format adds:")
+    for label, statement in BACKENDS.items():
+        try:
+            print(f"    {backend_cost(statement, args.runs):>8.1f} ms  {label}")
+        except subprocess.CalledProcessError:
+            print(f"    {'-':>8}     {label} (not installed)")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=int, default=1000, help="Median import budget for the API process (main)")
+    parser.add_argument("--worker-budget-ms", type=int, default=250, help="Median import budget for an extraction worker")
+    parser.add_argument("--top", type=int, default=8, help="Slowest direct imports to list per target")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,201 @@
+"""
+Offline benchmark harness for the extraction pipeline.
+
+Times each stage on a synthetic corpus (see corpus.py) without a running
+server:
+    extract_text_normal   text-layer extraction of a text PDF
+    extract_text_ocr      OCR of an image-only PDF (skipped without tesseract)
+    extract_fields        regex field extraction on the extracted text
+    calculate_score       scoring of a comparison result
+    process_invoice       InvoiceService.process_invoice end to end
+                          (inline executor, cache disabled)
+
+For every stage it reports throughput and p50/p95/p99 latency; the end-to-end
+stage also reports field accuracy against the corpus ground truth. Results
+are compared against a stored baseline, and the script exits non-zero when
+a stage's p50 latency grows by more than --tolerance or accuracy drops.
+Baselines are machine specific: record one with --update-baseline on the
+machine that runs the comparison.
+
+Usage:
+    python test/benchmark.py [--iterations 30] [--pages 1 5] [--noise 0.2]
+                             [--stages extract_fields ...] [--baseline path]
+                             [--tolerance 0.25] [--update-baseline] [--json]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import settings
+
+# Measure the pipeline itself: no process pool hop and no cache hits
+settings.EXECUTION_MODE = "inline"
+settings.CACHE_ENABLED = False
+
+from corpus import FIELDS, build_document
+from schemas.invoice import InvoiceExtractionRequest
+from service.invoice_extractor import extract_fields, extract_text_normal, extract_text_ocr
+from service.invoice_service import InvoiceService, compare_field
+from service.scoring import calculate_score
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+STAGES = ("extract_text_normal", "extract_text_ocr", "extract_fields", "calculate_score", "process_invoice")
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(samples: list) -> dict:
+    total = sum(samples)
+    return {
+        "runs": len(samples),
+        "throughput": round(len(samples) / total, 3) if total else 0.0,
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+def time_calls(func, inputs: list, iterations: int) -> list:
+    """Call `func` on the inputs round-robin, `iterations` times, after one warm-up call."""
+    func(inputs[0])
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(inputs[i % len(inputs)])
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def tesseract_available() -> bool:
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def field_accuracy(response, expected: dict) -> float:
+    matched = sum(1 for f in FIELDS if response.comparisons[f].result == "MATCH")
+    return matched / len(FIELDS)
+
+def bench_process_invoice(documents: list, iterations: int) -> tuple:
+    service = InvoiceService()
+    requests = [
+        InvoiceExtractionRequest(blob_64=base64.b64encode(data).decode("ascii"), **fields)
+        for data, fields in documents
+    ]
+
+    async def run() -> tuple:
+        await service.process_invoice(requests[0])
+        samples, accuracy = [], []
+        for i in range(iterations):
+            start = time.perf_counter()
+            response = await service.process_invoice(requests[i % len(requests)])
+            samples.append(time.perf_counter() - start)
+            accuracy.append(field_accuracy(response, documents[i % len(documents)][1]))
+        return samples, accuracy
+
+    return asyncio.run(run())
+
+def run_stages(args: argparse.Namespace) -> dict:
+    text_docs = [build_document("text_pdf", pages, args.noise, seed) for seed, pages in enumerate(args.pages)]
+    mixed_docs = [
+        build_document(kind, pages, args.noise, seed)
+        for seed, pages in enumerate(args.pages)
+        for kind in ("text_pdf", "docx", "csv")
+    ]
+    texts = [extract_text_normal(data) for data, _ in text_docs]
+    comparisons = [
+        {f: compare_field(fields[f], extract_fields(text).get(f)) for f in FIELDS}
+        for (_, fields), text in zip(text_docs, texts)
+    ]
+
+    results = {}
+    for stage in args.stages:
+        if stage == "extract_text_normal":
+            samples = time_calls(extract_text_normal, [data for data, _ in text_docs], args.iterations)
+        elif stage == "extract_text_ocr":
+            if not tesseract_available():
+                print("extract_text_ocr: skipped (tesseract is not installed)", file=sys.stderr)
+                continue
+            scans = [build_document("image_pdf", pages, args.noise, seed)[0] for seed, pages in enumerate(args.pages)]
+            samples = time_calls(extract_text_ocr, scans, max(1, args.iterations // 10))
+        elif stage == "extract_fields":
+            samples = time_calls(extract_fields, texts, args.iterations)
+        elif stage == "calculate_score":
+            samples = time_calls(calculate_score, comparisons, args.iterations)
+        else:
+            samples, accuracy = bench_process_invoice(mixed_docs, args.iterations)
+            results[stage] = {**summarize(samples), "accuracy": round(statistics.mean(accuracy), 4)}
+            continue
+        results[stage] = summarize(samples)
+    return results
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return a description of every stage that regressed past the tolerance."""
+    regressions = []
+    for stage, current in results.items():
+        previous = baseline.get(stage)
+        if not previous:
+            continue
+        limit = previous["p50_ms"] * (1 + tolerance)
+        if current["p50_ms"] > limit:
+            regressions.append(f"{stage}: p50 {current['p50_ms']:.3f} ms > {limit:.3f} ms (baseline {previous['p50_ms']:.3f} ms)")
+        if "accuracy" in previous and current.get("accuracy", 1.0) < previous["accuracy"]:
+            regressions.append(f"{stage}: accuracy {current['accuracy']:.2%} < baseline {previous['accuracy']:.2%}")
+    return regressions
+
+def print_table(results: dict, baseline: dict) -> None:
+    print(f"{'stage':<20} | {'ops/sec':>9} | {'p50 ms':>9} | {'p95 ms':>9} | {'p99 ms':>9} | {'vs baseline':>11} | {'accuracy':>8}")
+    print("-" * 93)
+    for stage, r in results.items():
+        previous = baseline.get(stage)
+        delta = f"{(r['p50_ms'] / previous['p50_ms'] - 1) * 100:+.1f}%" if previous and previous["p50_ms"] else "-"
+        accuracy = f"{r['accuracy']:.1%}" if "accuracy" in r else "-"
+        print(f"{stage:<20} | {r['throughput']:>9.1f} | {r['p50_ms']:>9.3f} | {r['p95_ms']:>9.3f} | {r['p99_ms']:>9.3f} | {delta:>11} | {accuracy:>8}")
+
+def main(args: argparse.Namespace) -> int:
+    results = run_stages(args)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results, baseline)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**baseline, **results}, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not baseline:
+        print(f"No baseline at {args.baseline}; record one with --update-baseline.")
+        return 0
+
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 5])
+    parser.add_argument("--noise", type=float, default=0.2)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p50 slowdown, as a fraction")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--json", action="store_true")
+    sys.exit(main(parser.parse_args()))
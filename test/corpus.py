@@ -0,0 +1,198 @@
+"""
+Synthetic invoice corpus generator.
+
+Produces invoices carrying every field in settings.EXTRACTION_PATTERNS as
+text PDFs, image-only (scanned) PDFs, DOCX and CSV documents, with a
+configurable number of pages and amount of noise. Each document comes with
+its ground-truth expected values, so it can be fed straight to the API,
+the benchmark harness or the bulk CLI.
+
+Usage:
+    python test/corpus.py --out corpus/ [--count 20] [--kinds text_pdf image_pdf docx csv]
+                          [--pages 1 3] [--noise 0.2] [--seed 7]
+Writes the documents plus a manifest.csv (file name + expected values).
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+
+KINDS = ("text_pdf", "image_pdf", "docx", "csv")
+EXTENSIONS = {"text_pdf": ".pdf", "image_pdf": ".pdf", "docx": ".docx", "csv": ".csv"}
+FIELDS = (
+    "CP_Name", "PAN", "GSTIN", "Agreement_Amount", "Brokerage_Amount",
+    "CGST", "SGST", "Total_Invoice_Amount", "TDS",
+)
+
+PARTNER_NAMES = ["Sample Realty Partners", "Acme Homes", "Blue Brick LLP", "Skyline Estates", "Green Acre Brokers"]
+FILLER = [
+    "Unit {n} sold as per schedule dated 01/04/2025",
+    "Booking reference BK-{n} confirmed by the sales desk",
+    "Payment milestone {n} received through RTGS",
+    "Site visit {n} logged by the relationship manager",
+]
+DISTRACTORS = ["PANEL review pending", "GST registration certificate attached", "Total Invoice summary below", "Brokerage slab revised"]
+
+def _letters(rng: random.Random, n: int) -> str:
+    return "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(n))
+
+def _digits(rng: random.Random, n: int) -> str:
+    return "".join(rng.choice("0123456789") for _ in range(n))
+
+def _money(value: float) -> str:
+    return f"{value:,.2f}"
+
+def generate_fields(rng: random.Random) -> Dict[str, str]:
+    """Random but internally consistent ground-truth values for one invoice."""
+    pan = _letters(rng, 5) + _digits(rng, 4) + _letters(rng, 1)
+    agreement = rng.randint(20, 200) * 100_000.0
+    brokerage = round(agreement * rng.choice([0.01, 0.02, 0.025]), 2)
+    gst = round(brokerage * 0.09, 2)
+    tds = round(brokerage * 0.05, 2)
+    return {
+        "CP_Name": rng.choice(PARTNER_NAMES),
+        "PAN": pan,
+        "GSTIN": f"{rng.randint(10, 37)}{pan}1Z{rng.choice('0123456789ABCDEFGHJK')}",
+        "Agreement_Amount": _money(agreement),
+        "Brokerage_Amount": _money(brokerage),
+        "CGST": _money(gst),
+        "SGST": _money(gst),
+        "Total_Invoice_Amount": _money(brokerage + 2 * gst),
+        "TDS": f"{tds:g}",
+    }
+
+def field_lines(fields: Dict[str, str]) -> List[str]:
+    """Invoice lines in the layout the extraction patterns expect."""
+    return [
+        f"Channel Partner (Bill From): {fields['CP_Name']}",
+        "Address: Plot 12 Sector 5 Pune",
+        f"PAN: {fields['PAN']}",
+        f"GSTIN: {fields['GSTIN']}",
+        f"Agreement Value Amount: {fields['Agreement_Amount']}",
+        f"Brokerage @ 2% Amount: {fields['Brokerage_Amount']}",
+        f"CGST @ 9%: {fields['CGST']}",
+        f"SGST @ 9%: {fields['SGST']}",
+        f"Total Invoice Amount: {fields['Total_Invoice_Amount']}",
+        f"TDS u/s 194H @ 5%: {fields['TDS']}",
+    ]
+
+def page_lines(fields: Dict[str, str], pages: int, noise: float, rng: random.Random) -> List[List[str]]:
+    """Lines per page: the fields on page 1, filler on the rest; `noise` adds distractors."""
+    result = []
+    for page_no in range(pages):
+        lines = field_lines(fields) if page_no == 0 else [f"Annexure {page_no}"]
+        filler_count = 8 if page_no == 0 else 40
+        for i in range(filler_count):
+            lines.append(rng.choice(FILLER).format(n=page_no * 100 + i))
+            if rng.random() < noise:
+                lines.append(rng.choice(DISTRACTORS))
+        result.append(lines)
+    return result
+
+def build_text_pdf(pages: List[List[str]]) -> bytes:
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page()
+        page.insert_text((48, 60), "\n".join(lines), fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def build_image_pdf(pages: List[List[str]], dpi: int = 200, skew: float = 0.0, seed: int = 0) -> bytes:
+    """
+    A scanned-looking PDF: every page is a raster image with no text layer.
+    With `skew`, each page is rotated by a random angle of up to that many degrees.
+    """
+    source = fitz.open(stream=build_text_pdf(pages), filetype="pdf")
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for src_page in source:
+        pix = src_page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        page = doc.new_page(width=src_page.rect.width, height=src_page.rect.height)
+        if skew:
+            from PIL import Image
+
+            img = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+            img = img.rotate(rng.uniform(-skew, skew), resample=Image.BILINEAR, fillcolor=255)
+            buffer = io.BytesIO()
+            img.save(buffer, format="PNG")
+            page.insert_image(page.rect, stream=buffer.getvalue())
+            continue
+        page.insert_image(page.rect, pixmap=pix)
+    data = doc.tobytes(deflate=True)
+    doc.close()
+    source.close()
+    return data
+
+def build_docx(pages: List[List[str]]) -> bytes:
+    import docx  # python-docx
+
+    document = docx.Document()
+    for page_no, lines in enumerate(pages):
+        for line in lines:
+            document.add_paragraph(line)
+        if page_no < len(pages) - 1:
+            document.add_page_break()
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+def build_csv(pages: List[List[str]]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # One line per row: extra cells would leak into the free-text fields
+    writer.writerow(["description", "notes"])
+    for lines in pages:
+        for line in lines:
+            writer.writerow([line])
+    return buffer.getvalue().encode("utf-8")
+
+BUILDERS = {
+    "text_pdf": build_text_pdf,
+    "image_pdf": build_image_pdf,
+    "docx": build_docx,
+    "csv": build_csv,
+}
+
+def build_document(kind: str, pages: int = 1, noise: float = 0.0, seed: int = 0) -> Tuple[bytes, Dict[str, str]]:
+    """Build one document of `kind`; returns (document bytes, expected field values)."""
+    rng = random.Random(f"{kind}-{pages}-{noise}-{seed}")
+    fields = generate_fields(rng)
+    return BUILDERS[kind](page_lines(fields, pages, noise, rng)), fields
+
+def generate_corpus(count: int, kinds=KINDS, pages=(1,), noise: float = 0.0, seed: int = 7):
+    """Yield (file name, kind, document bytes, expected values) tuples."""
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        page_count = pages[(i // len(kinds)) % len(pages)]
+        data, fields = build_document(kind, page_count, noise, seed * 100_000 + i)
+        yield f"invoice_{i:05d}_{kind}_{page_count}p{EXTENSIONS[kind]}", kind, data, fields
+
+def main(args: argparse.Namespace) -> None:
+    os.makedirs(args.out, exist_ok=True)
+    manifest_path = os.path.join(args.out, "manifest.csv")
+    with open(manifest_path, "w", newline="", encoding="utf-8") as manifest:
+        writer = csv.DictWriter(manifest, fieldnames=["file", *FIELDS])
+        writer.writeheader()
+        for name, _, data, fields in generate_corpus(args.count, args.kinds, args.pages, args.noise, args.seed):
+            with open(os.path.join(args.out, name), "wb") as f:
+                f.write(data)
+            writer.writerow({"file": name, **fields})
+    print(f"Wrote {args.count} documents and {manifest_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    parser.add_argument("--pages", type=int, nargs="+", default=[1])
+    parser.add_argument("--noise", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
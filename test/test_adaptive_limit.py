@@ -0,0 +1,36 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service.executor import AdaptiveLimit
+
+def test_mixed_workload_keeps_limit():
+    # Quick one-page PDFs interleaved with slow DOCX files, nothing overloaded
+    rng = random.Random(0)
+    limit = AdaptiveLimit(8, 2.0)
+    values = []
+    for index in range(4000):
+        if index % 2:
+            limit.record(0.006 * rng.uniform(0.8, 1.3), "docx")
+        else:
+            limit.record(0.0004 * rng.uniform(0.8, 1.3), "pdf")
+        values.append(limit.value)
+    assert min(values[100:]) >= 7
+    assert sum(values) / len(values) > 7.5
+
+def test_contention_lowers_limit_and_recovery_raises_it():
+    rng = random.Random(1)
+    limit = AdaptiveLimit(8, 2.0)
+    for index in range(400):
+        limit.record((0.006 if index % 2 else 0.0004) * rng.uniform(0.8, 1.3), "docx" if index % 2 else "pdf")
+    assert limit.value == 8
+    # Every kind slows down fourfold, as when the workers fight over the CPU
+    for index in range(60):
+        limit.record((0.024 if index % 2 else 0.0016) * rng.uniform(0.8, 1.3), "docx" if index % 2 else "pdf")
+    assert limit.value < 8
+    lowered = limit.value
+    for index in range(200):
+        limit.record((0.006 if index % 2 else 0.0004) * rng.uniform(0.8, 1.3), "docx" if index % 2 else "pdf")
+    assert limit.value > lowered